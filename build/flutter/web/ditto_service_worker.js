@@ -0,0 +1,163 @@
+'use strict';
+// Ditto's service worker: Flutter's app-shell cache plus offline support for the
+// Python side. Registered from flutter_bootstrap.js in place of flutter_service_worker.js,
+// which it imports, so the generated RESOURCES manifest still drives the shell cache.
+//
+// - The Python shell (python.js, the worker and app.zip) is precached with the Flutter
+//   core files, and the Pyodide runtime is precached from its CDN, so a reload starts
+//   without the network.
+// - GET /health is served stale-while-revalidate: the cached answer comes back at once
+//   and the network refreshes it for next time.
+// - GET /details and /validate_token go to the network first and fall back to the last
+//   cached answer for the same token when it fails or takes longer than API_TIMEOUT.
+//
+// Responses served from the API cache carry X-Ditto-Cached-At (an ISO timestamp) so the
+// app can say it is showing an offline copy.
+importScripts("flutter_service_worker.js");
+
+// Keep in sync with the importScripts URL in python-worker.js
+const PYODIDE_BASE = "https://cdn.jsdelivr.net/pyodide/v0.27.2/full/";
+const PYODIDE_CACHE = "ditto-pyodide-v0.27.2";
+const PYODIDE_CORE = ["pyodide.js", "pyodide.asm.js", "pyodide.asm.wasm", "python_stdlib.zip", "pyodide-lock.json"];
+const PYTHON_SHELL = ["python.js", "python-worker.js", "assets/app/app.zip", "manifest.json", "favicon.png"];
+
+const API_CACHE = "ditto-api";
+const STALE_WHILE_REVALIDATE = ["/health"];
+const NETWORK_FIRST = ["/details", "/validate_token"];
+const API_TIMEOUT = 3000;  // ms before a network-first request falls back to the cache
+const API_MAX_AGE = 7 * 24 * 3600 * 1000;  // cached answers older than this are dropped
+const API_MAX_ENTRIES = 50;
+const CACHED_AT_HEADER = "X-Ditto-Cached-At";
+
+self.addEventListener("install", (event) => {
+  // A failed precache must not fail the install; those files are cached on first use instead
+  event.waitUntil(Promise.all([
+    caches.open(TEMP).then((cache) =>
+      cache.addAll(PYTHON_SHELL.map((value) => new Request(value, {'cache': 'reload'})))),
+    caches.open(PYODIDE_CACHE).then((cache) =>
+      cache.addAll(PYODIDE_CORE.map((value) => PYODIDE_BASE + value))),
+  ].map((task) => task.catch((err) => console.warn('Ditto precache incomplete: ' + err)))));
+});
+
+self.addEventListener("activate", (event) => {
+  event.waitUntil(caches.keys().then((names) => Promise.all(names
+    .filter((name) => name.startsWith("ditto-pyodide-") && name != PYODIDE_CACHE)
+    .map((name) => caches.delete(name)))));
+});
+
+// Registered after Flutter's handler, which only answers its own RESOURCES
+self.addEventListener("fetch", (event) => {
+  var request = event.request;
+  if (request.method !== 'GET' || request.mode === 'navigate') {
+    return;
+  }
+  if (request.url.startsWith(PYODIDE_BASE)) {
+    return event.respondWith(cacheFirst(PYODIDE_CACHE, request));
+  }
+  var path = new URL(request.url).pathname;
+  if (STALE_WHILE_REVALIDATE.some((suffix) => path.endsWith(suffix))) {
+    return event.respondWith(staleWhileRevalidate(event));
+  }
+  if (NETWORK_FIRST.some((suffix) => path.endsWith(suffix))) {
+    return event.respondWith(networkFirst(event));
+  }
+});
+
+// Pyodide URLs are versioned, so a cached copy never goes stale
+async function cacheFirst(cacheName, request) {
+  var cache = await caches.open(cacheName);
+  var cached = await cache.match(request);
+  if (cached) {
+    return cached;
+  }
+  var response = await fetch(request);
+  if (response.ok) {
+    cache.put(request, response.clone());
+  }
+  return response;
+}
+
+async function staleWhileRevalidate(event) {
+  var key = await apiCacheKey(event.request);
+  var cached = await matchApi(key);
+  var network = fetchAndStore(event.request, key);
+  if (cached) {
+    event.waitUntil(network.catch(() => null));
+    return cached;
+  }
+  return network;
+}
+
+async function networkFirst(event) {
+  var key = await apiCacheKey(event.request);
+  var network = fetchAndStore(event.request, key);
+  // Whatever happens to this request, let a late response still refresh the cache
+  event.waitUntil(network.catch(() => null));
+  var timer;
+  var timeout = new Promise((resolve) => { timer = setTimeout(resolve, API_TIMEOUT, null); });
+  try {
+    var response = await Promise.race([network, timeout]);
+    if (response) {
+      return response;
+    }
+  } catch (err) {
+    var failure = err;
+  } finally {
+    clearTimeout(timer);
+  }
+  var cached = await matchApi(key);
+  if (cached) {
+    return cached;
+  }
+  if (failure) {
+    throw failure;
+  }
+  return network;
+}
+
+async function fetchAndStore(request, key) {
+  var response = await fetch(request);
+  var cache = await caches.open(API_CACHE);
+  if (response.ok) {
+    var headers = new Headers({'Content-Type': response.headers.get('Content-Type') || 'application/json'});
+    headers.set(CACHED_AT_HEADER, new Date().toISOString());
+    await cache.put(key, new Response(await response.clone().blob(), {status: response.status, headers: headers}));
+    await trimApiCache(cache);
+  } else if (response.status == 401 || response.status == 403) {
+    // The token is no longer valid; don't keep answering for it offline
+    await cache.delete(key);
+  }
+  return response;
+}
+
+async function matchApi(key) {
+  var cache = await caches.open(API_CACHE);
+  var cached = await cache.match(key);
+  if (cached && Date.now() - Date.parse(cached.headers.get(CACHED_AT_HEADER)) > API_MAX_AGE) {
+    await cache.delete(key);
+    return null;
+  }
+  return cached || null;
+}
+
+async function trimApiCache(cache) {
+  // Keys come back in insertion order, so the oldest answers go first
+  var keys = await cache.keys();
+  for (var i = 0; i < keys.length - API_MAX_ENTRIES; i++) {
+    await cache.delete(keys[i]);
+  }
+}
+
+// Answers are per token: key them on the URL plus a hash of the Authorization header,
+// so tokens never end up in cache storage
+async function apiCacheKey(request) {
+  var auth = request.headers.get('Authorization');
+  if (!auth) {
+    return request.url;
+  }
+  var digest = await crypto.subtle.digest('SHA-256', new TextEncoder().encode(auth));
+  var hash = Array.from(new Uint8Array(digest).slice(0, 16), (b) => b.toString(16).padStart(2, '0')).join('');
+  var url = new URL(request.url);
+  url.searchParams.set('__ditto_auth', hash);
+  return url.toString();
+}
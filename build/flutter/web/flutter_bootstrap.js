@@ -4,6 +4,8 @@
 _flutter.loader.load({
     serviceWorkerSettings: {
         serviceWorkerVersion: {{flutter_service_worker_version}},
+        // ditto_service_worker.js wraps flutter_service_worker.js; the ?v= suffix must match the version
+        serviceWorkerUrl: "ditto_service_worker.js?v=" + {{flutter_service_worker_version}},
     },
     onEntrypointLoaded: async function (engineInitializer) {
         const appRunner = await engineInitializer.initializeEngine({useColorEmoji: useColorEmoji});
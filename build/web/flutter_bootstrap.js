@@ -12,6 +12,8 @@ _flutter.buildConfig = {"engineRevision":"18b71d647a292a980abb405ac7d16fe1f0b204
 _flutter.loader.load({
     serviceWorkerSettings: {
         serviceWorkerVersion: "519164613",
+        // ditto_service_worker.js wraps flutter_service_worker.js; the ?v= suffix must match the version
+        serviceWorkerUrl: "ditto_service_worker.js?v=" + "519164613",
     },
     onEntrypointLoaded: async function (engineInitializer) {
         const appRunner = await engineInitializer.initializeEngine({useColorEmoji: useColorEmoji});
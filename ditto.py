@@ -1,16 +1,59 @@
 import flet as ft
-import json
-from datetime import datetime, timedelta
-
-API_BASE_URL = "https://short-url.leapcell.app"
-TOKEN_REFRESH_TIME = 8
-
-class SessionData:
-    def __init__(self):
-        self.access_token = None
-        self.current_alias = None
-        self.token_time = None
+import asyncio
+import functools
+import os
+from datetime import datetime
+from time import monotonic
+from urllib.parse import urlencode
+
+import ditto_history
+from ditto_http import WARMUP_ENABLED, mark_startup, warm_up_in_background
+from ditto_jobs import FAILED, JOB_ACTIONS, jobs
+from ditto_linkhealth import BROKEN, OK, UNREACHABLE, link_checker
+from ditto_logging import NAVIGATION, log, log_error
+from ditto_qr import qr_png, qr_png_base64
+from ditto_tracing import instrument_page, traced
+from ditto_scheduler import BULK
+from ditto_sessions import MAX_OVERLAY_CONTROLS, sessions
+from ditto_api import (
+    API_BASE_URL,
+    API_BASE_URLS,
+    BULK_ACTIONS,
+    CACHED_AT_HEADER,
+    AliasDetails,
+    SessionData,
+    alias_cache,
+    alias_request,
+    check_alias_available,
+    create_alias,
+    export_alias_stats,
+    fetch_alias_details,
+    find_free_aliases,
+    login_alias,
+    make_request,
+    normalize_url,
+    parse_timestamp,
+    run_bulk,
+    start_backend_checks,
+)
 
+ALIAS_CHECK_DEBOUNCE = 0.4  # seconds of typing silence before checking an alias
+EXPORT_DIR = "exports"
+SCHEDULE_FORMAT = "%Y-%m-%d %H:%M"
+SCHEDULED_SHOWN = 20  # pending jobs listed per alias
+QR_SIZE = 200  # on-screen size of the short link's QR code
+QR_DOWNLOAD_SCALE = 16  # pixels per module in downloaded QR codes, large enough to print
+LINK_HEALTH_ICONS = {
+    OK: (ft.Icons.CHECK_CIRCLE, "#5ab896"),
+    BROKEN: (ft.Icons.ERROR, "#ff6b6b"),
+    UNREACHABLE: (ft.Icons.LINK_OFF, "#ff6b6b"),
+}
+HISTORY_HEIGHT = 320
+HISTORY_ROW_HEIGHT = 64  # fixed, so the list can lay out only the rows on screen
+HISTORY_PAGE_SIZE = 25  # rows added to the list at a time as it scrolls
+HISTORY_LOAD_MARGIN = 1000  # pixels from the end of the list at which the next rows are added
+HISTORY_ID_KEY = "ditto.history_id"  # client storage key of the browser's history id
+HISTORY_ID_TIMEOUT = 5  # seconds to wait for the browser's client storage
 
 # Ditto Pokemon image
 ditto_image = ft.Image(
@@ -20,133 +63,544 @@ ditto_image = ft.Image(
     fit=ft.ImageFit.CONTAIN,
 )
 
-async def refresh_token(page:ft.Page):
-    response = await make_request(
-        page,
-        f"{API_BASE_URL}/refresh_token",
-        method="GET",
-        auth_token=page.session_data.access_token,
-        flag=False
-    )
-    if response['ok']:
-        data = response['body']
-        page.session_data.access_token = data.get("access_token")
-        page.session_data.token_time=datetime.now()
 
-async def make_request(page: ft.Page, url, method="GET", data=None, timeout=10, auth_token=None,flag=True):
+def open_dialog(page: ft.Page, dialog):
+    """Show a dialog, dropping closed ones so the overlay stays within the session budget"""
+    if len(page.overlay) >= MAX_OVERLAY_CONTROLS:
+        page.overlay[:] = [control for control in page.overlay if getattr(control, 'open', False)]
+    page.overlay.append(dialog)
+    dialog.open = True
+    page.update()
+
+
+def single_submit(handler):
     """
-    HTTP request that works in both desktop and web builds
+    Drop clicks on a submit button while its async handler is still running. Handlers
+    disable the button in the update that says the request is under way, so quick
+    validation errors cost no extra update; the button is enabled again here.
     """
-    if flag and page.session_data.token_time and (datetime.now()-page.session_data.token_time).total_seconds()/60 > TOKEN_REFRESH_TIME:
-        await refresh_token(page)
-    try:
-        import sys
-        if 'pyodide' in sys.modules:
-            # Running in browser - use JavaScript fetch
-            return await make_request_js(page, url, method, data, auth_token)
-        else:
-            # Running in desktop - use urllib
-            return make_request_urllib(url, method, data, timeout, auth_token)
-    except Exception as e:
-        return {
-            'ok': False,
-            'status': 0,
-            'body': {'detail': f'Error: {str(e)}'}
-        }
+    running = False
 
+    @functools.wraps(handler)
+    async def wrapper(e):
+        nonlocal running
+        if running:
+            return
+        running = True
+        try:
+            await handler(e)
+        finally:
+            running = False
+            button = e.control
+            # The handler may have navigated away, taking the button off the page
+            if button.disabled and button.page:
+                button.disabled = False
+                button.update()
+    return wrapper
+
+
+def bulk_actions_panel(page: ft.Page, on_finished):
+    """
+    Multi-select pause/resume/reset/delete across every alias logged in this session.
+    on_finished(action, succeeded) is awaited after each run.
+    """
+    last_action = None
+    failed_aliases = []
+    last_progress_update = 0
 
-async def make_request_js(page: ft.Page, url, method="GET", data=None, auth_token=None):
-    """Use JavaScript fetch for browser environment"""
-    import js
-    from pyodide.ffi import to_js, JsException
+    progress_bar = ft.ProgressBar(width=460, value=0, color="#5ab896", bgcolor="#2a2a2a", visible=False)
 
-    headers = {'Content-Type': 'application/json'}
+    progress_text = ft.Text("", color="#8a8a8a", size=12)
 
-    if auth_token:
-        headers['Authorization'] = f'Bearer {auth_token}'
+    failures_text = ft.Text("", color="#ff6b6b", size=12, selectable=True)
 
-    options = {
-        'method': method,
-        'headers': headers
-    }
+    alias_list = ft.ListView(height=180, spacing=0)
 
-    if data:
-        options['body'] = json.dumps(data)
+    def selected_aliases():
+        return [c.data for c in alias_list.controls if c.value]
 
-    try:
-        # Await the fetch promise
-        response = await js.fetch(url, to_js(options))
-
-        # Await the text promise
-        body_text = await response.text()
-
-        return {
-            'ok': response.ok,
-            'status': response.status,
-            'body': json.loads(body_text) if body_text else {}
-        }
-    except JsException as e:
-        return {
-            'ok': False,
-            'status': 0,
-            'body': {'detail': f'JS Fetch error: {str(e)}'}
-        }
-    except Exception as e:
-        return {
-            'ok': False,
-            'status': 0,
-            'body': {'detail': f'Error: {str(e)}'}
-        }
-
-
-def make_request_urllib(url, method="GET", data=None, timeout=10, auth_token=None):
-    """Original urllib implementation for desktop"""
-    import urllib.request
-    import urllib.error
+    def on_select_all(e):
+        for checkbox in alias_list.controls:
+            checkbox.value = select_all_checkbox.value
+        page.update()
 
-    try:
-        headers = {'Content-Type': 'application/json'} if data else {}
+    select_all_checkbox = ft.Checkbox(label="Select all", on_change=on_select_all)
+
+    def refresh_alias_list():
+        selected = set(selected_aliases())
+        alias_list.controls = [
+            ft.Checkbox(label=alias, data=alias, value=alias in selected)
+            for alias in sorted(page.session_data.alias_tokens)
+        ]
+
+    def on_progress(done, total, alias, response):
+        nonlocal last_progress_update
+        progress_bar.value = done / total
+        progress_text.value = f"{done}/{total} done"
+        # Throttle websocket traffic for large selections
+        if done == total or monotonic() - last_progress_update > 0.1:
+            last_progress_update = monotonic()
+            page.update()
 
-        if auth_token:
-            headers['Authorization'] = f'Bearer {auth_token}'
+    async def run_action(action, aliases):
+        nonlocal last_action, failed_aliases
+        label, method, endpoint = BULK_ACTIONS[action]
+        last_action = action
+        progress_bar.value = 0
+        progress_bar.visible = True
+        progress_text.value = f"{label}: 0/{len(aliases)} done"
+        progress_text.color = "#8a8a8a"
+        failures_text.value = ""
+        retry_button.visible = False
+        action_buttons.disabled = True
+        page.update()
 
-        if data:
-            data = json.dumps(data).encode('utf-8')
+        try:
+            succeeded, failed = await run_bulk(
+                aliases,
+                lambda alias: alias_request(page, alias, endpoint, method),
+                on_progress=on_progress,
+            )
+        finally:
+            action_buttons.disabled = False
+
+        if action == 'delete':
+            for alias in succeeded:
+                alias_cache.set(alias, True)
+                if alias != page.session_data.current_alias:
+                    page.session_data.forget_alias(alias)
+        failed_aliases = list(failed)
+        progress_bar.visible = False
+        progress_text.value = f"{label}: {len(succeeded)} succeeded, {len(failed)} failed"
+        progress_text.color = "#ff6b6b" if failed else "#5ab896"
+        failures_text.value = "\n".join(f"{alias}: {detail}" for alias, detail in sorted(failed.items()))
+        retry_button.visible = bool(failed)
+        refresh_alias_list()
+        page.update()
+        await on_finished(action, succeeded)
+
+    def on_action_click(action):
+        @single_submit
+        @traced("ui.bulk_action")
+        async def handler(e):
+            aliases = selected_aliases()
+            if not aliases:
+                progress_text.value = "Select at least one alias"
+                progress_text.color = "#ff6b6b"
+                page.update()
+                return
+            if action not in ('reset_hits', 'delete'):
+                await run_action(action, aliases)
+                return
+
+            @single_submit
+            async def confirm(confirm_e):
+                dialog.open = False
+                page.update()
+                await run_action(action, aliases)
 
-        req = urllib.request.Request(
-            url,
-            data=data,
-            headers=headers,
-            method=method
-        )
+            def cancel(cancel_e):
+                dialog.open = False
+                page.update()
 
-        with urllib.request.urlopen(req, timeout=timeout) as response:
-            body = response.read().decode('utf-8')
-            return {
-                'ok': 200 <= response.status < 300,
-                'status': response.status,
-                'body': json.loads(body) if body else {}
-            }
-    except urllib.error.HTTPError as e:
-        body = e.read().decode('utf-8')
-        return {
-            'ok': False,
-            'status': e.code,
-            'body': json.loads(body) if body else {'detail': str(e)}
-        }
-    except Exception as e:
-        return {
-            'ok': False,
-            'status': 0,
-            'body': {'detail': f'Error: {str(e)}'}
-        }
-
-
-async def show_manage_alias_page(page: ft.Page):
+            label = BULK_ACTIONS[action][0]
+            dialog = ft.AlertDialog(
+                modal=True,
+                title=ft.Text(f"Confirm {label}"),
+                content=ft.Text(f"{label} {len(aliases)} selected aliases? This action cannot be undone."),
+                actions=[
+                    ft.TextButton("Cancel", on_click=cancel),
+                    ft.TextButton(label, on_click=confirm, style=ft.ButtonStyle(color="#ff6b6b")),
+                ],
+            )
+            open_dialog(page, dialog)
+        return handler
+
+    @single_submit
+    @traced("ui.on_retry_click")
+    async def on_retry_click(e):
+        if last_action and failed_aliases:
+            await run_action(last_action, failed_aliases)
+
+    retry_button = ft.TextButton(
+        text="Retry failed",
+        style=ft.ButtonStyle(color="#ff8c42"),
+        on_click=on_retry_click,
+        visible=False,
+    )
+
+    action_buttons = ft.Row(
+        [
+            ft.ElevatedButton(
+                text=label,
+                bgcolor="#ff6b6b" if action == 'delete' else "#4a9b7f",
+                color="#ffffff",
+                style=ft.ButtonStyle(
+                    shape=ft.RoundedRectangleBorder(radius=8),
+                ),
+                on_click=on_action_click(action),
+            )
+            for action, (label, method, endpoint) in BULK_ACTIONS.items()
+        ],
+        spacing=10,
+        alignment=ft.MainAxisAlignment.CENTER,
+        wrap=True,
+    )
+
+    # Bulk login: one "alias password" pair per line
+    credentials_field = ft.TextField(
+        label="Aliases to add",
+        hint_text="One 'alias password' per line",
+        hint_style=ft.TextStyle(color="#5a5a5a", size=12),
+        multiline=True,
+        min_lines=3,
+        max_lines=8,
+        border_color="#4a9b7f",
+        focused_border_color="#5ab896",
+        label_style=ft.TextStyle(color="#8a8a8a"),
+        text_style=ft.TextStyle(color="#ffffff"),
+        cursor_color="#5ab896",
+        width=460,
+    )
+
+    @single_submit
+    @traced("ui.on_login_all_click")
+    async def on_login_all_click(e):
+        credentials = {}
+        for line in (credentials_field.value or "").splitlines():
+            # Aliases have no spaces, but a password may start or end with one
+            alias, _, password = line.lstrip().partition(" ")
+            if alias:
+                credentials[alias] = password
+        if not credentials:
+            progress_text.value = "Enter at least one alias"
+            progress_text.color = "#ff6b6b"
+            page.update()
+            return
+
+        async def login(alias):
+            response = await login_alias(page, alias, credentials[alias], flag=False, priority=BULK)
+            if response['ok']:
+                page.session_data.remember_token(alias, response['body'].get("access_token"))
+            return response
+
+        progress_text.value = f"Logging in {len(credentials)} aliases..."
+        progress_text.color = "#8a8a8a"
+        e.control.disabled = True
+        page.update()
+        succeeded, failed = await run_bulk(credentials, login, on_progress=on_progress)
+        progress_text.value = f"Added {len(succeeded)} aliases, {len(failed)} failed"
+        progress_text.color = "#ff6b6b" if failed else "#5ab896"
+        failures_text.value = "\n".join(f"{alias}: {detail}" for alias, detail in sorted(failed.items()))
+        # Leave the failed aliases for another try, but never show passwords in the field
+        credentials_field.value = "\n".join(f"{alias} " for alias in failed)
+        refresh_alias_list()
+        page.update()
+
+    add_aliases_container = ft.Column(
+        [
+            credentials_field,
+            ft.ElevatedButton(
+                text="Login all",
+                bgcolor="#5ab896",
+                color="#ffffff",
+                style=ft.ButtonStyle(
+                    shape=ft.RoundedRectangleBorder(radius=8),
+                ),
+                on_click=on_login_all_click,
+            ),
+        ],
+        horizontal_alignment=ft.CrossAxisAlignment.CENTER,
+        visible=False,
+    )
+
+    def toggle_add_aliases(e):
+        add_aliases_container.visible = not add_aliases_container.visible
+        page.update()
+
+    def on_export_format_change(e):
+        root, _ = os.path.splitext(export_path_field.value or os.path.join(EXPORT_DIR, "ditto-aliases"))
+        export_path_field.value = f"{root}.{export_format_dropdown.value}"
+        page.update()
+
+    export_format_dropdown = ft.Dropdown(
+        options=[ft.dropdown.Option("csv", "CSV"), ft.dropdown.Option("jsonl", "JSONL")],
+        value="csv",
+        width=110,
+        border_color="#4a9b7f",
+        on_change=on_export_format_change,
+    )
+
+    export_path_field = ft.TextField(
+        label="Export file",
+        value=os.path.join(EXPORT_DIR, "ditto-aliases.csv"),
+        border_color="#4a9b7f",
+        focused_border_color="#5ab896",
+        label_style=ft.TextStyle(color="#8a8a8a"),
+        text_style=ft.TextStyle(color="#ffffff"),
+        cursor_color="#5ab896",
+        expand=True,
+    )
+
+    incremental_checkbox = ft.Checkbox(label="Only aliases changed since last export")
+
+    @single_submit
+    @traced("ui.on_export_click")
+    async def on_export_click(e):
+        aliases = sorted(page.session_data.alias_tokens)
+        path = (export_path_field.value or "").strip()
+        if not aliases or not path:
+            progress_text.value = "Nothing to export" if not aliases else "Enter an export file"
+            progress_text.color = "#ff6b6b"
+            page.update()
+            return
+        progress_bar.value = 0
+        progress_bar.visible = True
+        failures_text.value = ""
+        retry_button.visible = False
+        e.control.disabled = True
+        page.update()
+        try:
+            written, failed = await export_alias_stats(
+                page,
+                aliases,
+                path,
+                fmt=export_format_dropdown.value,
+                incremental=incremental_checkbox.value,
+                on_progress=on_progress,
+            )
+            progress_text.value = f"Exported {written} rows to {path}, {len(failed)} failed"
+            progress_text.color = "#ff6b6b" if failed else "#5ab896"
+            failures_text.value = "\n".join(f"{alias}: {detail}" for alias, detail in sorted(failed.items()))
+        except OSError as ex:
+            progress_text.value = f"Export failed: {str(ex)}"
+            progress_text.color = "#ff6b6b"
+        progress_bar.visible = False
+        page.update()
+
+    export_row = ft.Column(
+        [
+            ft.Row([export_path_field, export_format_dropdown], spacing=10),
+            ft.Row(
+                [
+                    incremental_checkbox,
+                    ft.ElevatedButton(
+                        text="Export",
+                        bgcolor="#4a9b7f",
+                        color="#ffffff",
+                        style=ft.ButtonStyle(
+                            shape=ft.RoundedRectangleBorder(radius=8),
+                        ),
+                        on_click=on_export_click,
+                    ),
+                ],
+                alignment=ft.MainAxisAlignment.SPACE_BETWEEN,
+            ),
+        ],
+        width=460,
+    )
+
+    refresh_alias_list()
+
+    return ft.Container(
+        content=ft.Column(
+            [
+                ft.Text(
+                    "Bulk Actions",
+                    size=18,
+                    weight=ft.FontWeight.W_500,
+                    color="#5ab896",
+                ),
+                ft.Row(
+                    [
+                        select_all_checkbox,
+                        ft.TextButton(
+                            text="+ Add aliases",
+                            style=ft.ButtonStyle(color="#5ab896"),
+                            on_click=toggle_add_aliases,
+                        ),
+                    ],
+                    alignment=ft.MainAxisAlignment.SPACE_BETWEEN,
+                ),
+                add_aliases_container,
+                alias_list,
+                action_buttons,
+                ft.Divider(color="#333333", height=1),
+                export_row,
+                progress_bar,
+                ft.Row([progress_text, retry_button], alignment=ft.MainAxisAlignment.CENTER),
+                failures_text,
+            ],
+            horizontal_alignment=ft.CrossAxisAlignment.CENTER,
+        ),
+        padding=20,
+        border_radius=12,
+        border=ft.border.all(1, "#3a3a3a"),
+        width=500,
+    )
+
+
+def scheduled_actions_panel(page: ft.Page):
+    """Pause, resume, change the URL of or delete the current alias at a later time"""
+    alias = page.session_data.current_alias
+
+    action_dropdown = ft.Dropdown(
+        options=[ft.dropdown.Option(action, label) for action, (label, method, endpoint) in JOB_ACTIONS.items()],
+        value="pause",
+        width=150,
+        border_color="#4a9b7f",
+    )
+
+    when_field = ft.TextField(
+        label="When (local time)",
+        hint_text="YYYY-MM-DD HH:MM",
+        hint_style=ft.TextStyle(color="#5a5a5a", size=12),
+        border_color="#4a9b7f",
+        focused_border_color="#5ab896",
+        label_style=ft.TextStyle(color="#8a8a8a"),
+        text_style=ft.TextStyle(color="#ffffff"),
+        cursor_color="#5ab896",
+        expand=True,
+    )
+
+    url_field = ft.TextField(
+        label="New target URL",
+        border_color="#4a9b7f",
+        focused_border_color="#5ab896",
+        label_style=ft.TextStyle(color="#8a8a8a"),
+        text_style=ft.TextStyle(color="#ffffff"),
+        cursor_color="#5ab896",
+        width=460,
+        visible=False,
+    )
+
+    schedule_status_text = ft.Text("", color="#8a8a8a", size=12)
+
+    jobs_list = ft.Column(spacing=0)
+
+    def on_action_change(e):
+        url_field.visible = action_dropdown.value == "change_url"
+        page.update()
+
+    action_dropdown.on_change = on_action_change
+
+    # The job scheduler lives on the event loop, so its handlers are async: Flet runs sync ones in a worker thread
+    def cancel_job(job_id):
+        @traced("ui.cancel_scheduled_action")
+        async def on_cancel_click(e):
+            if not jobs.cancel(job_id):
+                schedule_status_text.value = "That action has already run"
+                schedule_status_text.color = "#ff8c42"
+            refresh_jobs_list()
+            page.update()
+        return on_cancel_click
+
+    def refresh_jobs_list():
+        pending = jobs.pending_for(alias)
+        rows = []
+        for job in pending[:SCHEDULED_SHOWN]:
+            label = JOB_ACTIONS[job.action][0]
+            target = f" to {job.url}" if job.url else ""
+            rows.append(ft.Row(
+                [
+                    ft.Text(f"{datetime.fromtimestamp(job.due).strftime(SCHEDULE_FORMAT)}  {label}{target}", color="#ffffff", size=13, expand=True),
+                    ft.IconButton(icon=ft.Icons.CLOSE, icon_color="#ff6b6b", tooltip="Cancel", on_click=cancel_job(job.id)),
+                ],
+            ))
+        if len(pending) > SCHEDULED_SHOWN:
+            rows.append(ft.Text(f"+{len(pending) - SCHEDULED_SHOWN} more", color="#8a8a8a", size=12))
+        failed = [job for job in jobs.history_for(alias) if job.status == FAILED][:3]
+        for job in failed:
+            rows.append(ft.Text(f"{JOB_ACTIONS[job.action][0]} at {datetime.fromtimestamp(job.due).strftime(SCHEDULE_FORMAT)} failed: {job.detail}", color="#ff6b6b", size=12))
+        if not rows:
+            rows.append(ft.Text("Nothing scheduled", color="#8a8a8a", size=12))
+        jobs_list.controls = rows
+
+    @traced("ui.on_schedule_click")
+    async def on_schedule_click(e):
+        try:
+            due = datetime.strptime((when_field.value or "").strip(), SCHEDULE_FORMAT).timestamp()
+        except ValueError:
+            schedule_status_text.value = "Enter a time as YYYY-MM-DD HH:MM"
+            schedule_status_text.color = "#ff6b6b"
+            page.update()
+            return
+        if due <= datetime.now().timestamp():
+            schedule_status_text.value = "Pick a time in the future"
+            schedule_status_text.color = "#ff6b6b"
+            page.update()
+            return
+        url = None
+        if action_dropdown.value == "change_url":
+            url, url_error = normalize_url(url_field.value or "")
+            if url_error:
+                schedule_status_text.value = url_error
+                schedule_status_text.color = "#ff6b6b"
+                page.update()
+                return
+        entry = page.session_data.alias_tokens.get(alias)
+        if entry is None:
+            schedule_status_text.value = "Log in again to schedule actions"
+            schedule_status_text.color = "#ff6b6b"
+            page.update()
+            return
+        access_token, token_time = entry
+        jobs.schedule(alias, action_dropdown.value, due, access_token, token_time, url=url)
+        schedule_status_text.value = f"{JOB_ACTIONS[action_dropdown.value][0]} scheduled for {datetime.fromtimestamp(due).strftime(SCHEDULE_FORMAT)}"
+        schedule_status_text.color = "#5ab896"
+        refresh_jobs_list()
+        page.update()
+
+    refresh_jobs_list()
+
+    return ft.Container(
+        content=ft.Column(
+            [
+                ft.Text(
+                    "Scheduled Actions",
+                    size=18,
+                    weight=ft.FontWeight.W_500,
+                    color="#5ab896",
+                ),
+                ft.Row([action_dropdown, when_field], spacing=10, width=460),
+                url_field,
+                ft.ElevatedButton(
+                    text="Schedule",
+                    bgcolor="#4a9b7f",
+                    color="#ffffff",
+                    style=ft.ButtonStyle(
+                        shape=ft.RoundedRectangleBorder(radius=8),
+                    ),
+                    on_click=on_schedule_click,
+                ),
+                schedule_status_text,
+                jobs_list,
+            ],
+            horizontal_alignment=ft.CrossAxisAlignment.CENTER,
+        ),
+        padding=20,
+        border_radius=12,
+        border=ft.border.all(1, "#3a3a3a"),
+        width=500,
+    )
+
+
+@traced("ui.show_manage_alias_page")
+async def show_manage_alias_page(page: ft.Page, details=None):
+    """
+    details is an already started /details fetch (a task) to bind once the page is built;
+    without one the fetch is started here, so it runs while the controls are constructed.
+    """
+    if details is None:
+        details = asyncio.ensure_future(fetch_alias_details(page))
+    # Building the controls never yields, so let the request get on the wire first
+    await asyncio.sleep(0)
     is_editing = False
     is_editing_password = False
-    alias_data = {}
+    log(NAVIGATION, "page", page="manage", alias=page.session_data.current_alias)
+    alias_details = AliasDetails(page.session_data.current_alias)
 
+    @traced("ui.go_back")
     def go_back(e):
         page.controls.clear()
         show_main_page(page)
@@ -174,14 +628,19 @@ async def show_manage_alias_page(page: ft.Page):
         spacing=10,
     )
 
+    @traced("ui.on_refresh_click")
     async def on_refresh_click(e):
         status_text.value = "Refreshing..."
         status_text.color = "#5ab896"
         page.update()
-        await load_alias_details()
-        status_text.value = "Data refreshed successfully!"
+        if await load_alias_details():
+            status_text.value = "Data refreshed successfully!"
+        elif status_text.value == "Refreshing...":
+            status_text.value = "Could not refresh details"
+            status_text.color = "#ff6b6b"
         page.update()
 
+    @traced("ui.on_logout_click")
     def on_logout_click(e):
         page.session_data = SessionData()
         page.controls.clear()
@@ -273,7 +732,7 @@ async def show_manage_alias_page(page: ft.Page):
         if is_editing:
             url_display_row.visible = False
             url_edit_row.visible = True
-            new_url_field.value = alias_data.get("url", "")
+            new_url_field.value = alias_details.url or ""
         else:
             url_display_row.visible = True
             url_edit_row.visible = False
@@ -314,6 +773,57 @@ async def show_manage_alias_page(page: ft.Page):
         on_click=toggle_edit_mode,
     )
 
+    checked_url = None
+    link_check_task = None
+
+    def show_link_health(result):
+        icon, color = LINK_HEALTH_ICONS.get(result.result, (ft.Icons.HELP_OUTLINE, "#8a8a8a"))
+        link_health_button.icon = icon
+        link_health_button.icon_color = color
+        lines = [result.summary()]
+        if result.redirects:
+            lines += [f"{hop_status}  {hop_url}" for hop_url, hop_status in result.chain]
+        lines.append(f"Checked {datetime.fromtimestamp(result.checked).strftime('%H:%M')}, click to check again")
+        link_health_button.tooltip = "\n".join(lines)
+        link_health_button.visible = True
+
+    async def check_link(force=False):
+        """Probe the target URL once per URL shown, or again when forced"""
+        nonlocal checked_url
+        url = alias_details.url
+        if not url or (url == checked_url and not force):
+            return
+        checked_url = url
+        if force or link_checker.cached(url) is None:
+            link_health_button.icon = ft.Icons.HOURGLASS_EMPTY
+            link_health_button.icon_color = "#8a8a8a"
+            link_health_button.tooltip = "Checking link..."
+            link_health_button.visible = True
+            page.update()
+        result = await link_checker.check(url, force=force)
+        # The URL may have been edited while the probe ran
+        if alias_details.url == url:
+            show_link_health(result)
+            page.update()
+
+    def start_link_check(force=False):
+        nonlocal link_check_task
+        if link_checker.available():
+            link_check_task = asyncio.ensure_future(check_link(force))
+
+    # async so Flet runs it on the event loop: sync handlers run in a worker thread, which has none
+    @traced("ui.on_link_health_click")
+    async def on_link_health_click(e):
+        start_link_check(force=True)
+
+    link_health_button = ft.IconButton(
+        icon=ft.Icons.HOURGLASS_EMPTY,
+        icon_color="#8a8a8a",
+        icon_size=20,
+        on_click=on_link_health_click,
+        visible=False,
+    )
+
     url_display_row = ft.Row(
         [
             ft.Container(
@@ -324,24 +834,40 @@ async def show_manage_alias_page(page: ft.Page):
                 border=ft.border.all(1, "#3a3a3a"),
                 expand=True,
             ),
+            link_health_button,
             edit_button,
         ],
         spacing=10,
     )
 
+    @single_submit
+    @traced("ui.on_update_url_click")
     async def on_update_url_click(e):
         if not new_url_field.value:
             status_text.value = "Please enter a target URL"
             status_text.color = "#ff6b6b"
             page.update()
             return
+        target_url, url_error = normalize_url(new_url_field.value)
+        if url_error:
+            status_text.value = url_error
+            status_text.color = "#ff6b6b"
+            page.update()
+            return
+        if target_url == alias_details.url:
+            status_text.value = "URL is unchanged"
+            status_text.color = "#ff8c42"
+            page.update()
+            return
+        new_url_field.value = target_url
         status_text.value = "Updating URL..."
         status_text.color = "#5ab896"
+        save_url_button.disabled = True
         page.update()
         try:
             response = await make_request(
                 page,
-                f"{API_BASE_URL}/change_url?url={new_url_field.value}",
+                f"{API_BASE_URL}/change_url?{urlencode({'url': target_url})}",
                 method="PATCH",
                 auth_token=page.session_data.access_token
             )
@@ -360,6 +886,7 @@ async def show_manage_alias_page(page: ft.Page):
             page.update()
 
         except Exception as ex:
+            log_error("ui.on_update_url_click", ex)
             status_text.value = f"Error: {str(ex)}"
             status_text.color = "#ff6b6b"
             page.update()
@@ -393,6 +920,7 @@ async def show_manage_alias_page(page: ft.Page):
 
     async def on_reset_hits_click(e):
         # Confirmation dialog
+        @traced("ui.confirm_reset")
         async def confirm_reset(confirm_e):
             dialog.open = False
             page.update()
@@ -416,6 +944,7 @@ async def show_manage_alias_page(page: ft.Page):
                 page.update()
 
             except Exception as ex:
+                log_error("ui.confirm_reset", ex)
                 status_text.value = f"Error: {str(ex)}"
                 status_text.color = "#ff6b6b"
                 page.update()
@@ -434,13 +963,12 @@ async def show_manage_alias_page(page: ft.Page):
             ],
         )
 
-        page.overlay.append(dialog)
-        dialog.open = True
-        page.update()
+        open_dialog(page, dialog)
 
+    @traced("ui.on_toggle_status_click")
     async def on_toggle_status_click(e):
         try:
-            is_active = alias_data.get("url_state", False)
+            is_active = alias_details.active
             if is_active:
                 endpoint = "pause"
                 status_text.value = "Pausing..."
@@ -469,6 +997,7 @@ async def show_manage_alias_page(page: ft.Page):
             page.update()
 
         except Exception as ex:
+            log_error("ui.on_toggle_status_click", ex)
             status_text.value = f"Error: {str(ex)}"
             status_text.color = "#ff6b6b"
             page.update()
@@ -565,6 +1094,8 @@ async def show_manage_alias_page(page: ft.Page):
         width=500,
     )
 
+    @single_submit
+    @traced("ui.on_update_password_click")
     async def on_update_password_click(e):
         if not old_password_field.value or not new_password_field.value or not confirm_password_field.value:
             status_text.value = "Please fill in all password fields"
@@ -578,6 +1109,8 @@ async def show_manage_alias_page(page: ft.Page):
             page.update()
             return
 
+        save_password_button.disabled = True
+        page.update()
         try:
             update_data = {
                 'url_code': page.session_data.current_alias,
@@ -607,6 +1140,7 @@ async def show_manage_alias_page(page: ft.Page):
             page.update()
 
         except Exception as ex:
+            log_error("ui.on_update_password_click", ex)
             status_text.value = f"Error: {str(ex)}"
             status_text.color = "#ff6b6b"
             page.update()
@@ -671,52 +1205,63 @@ async def show_manage_alias_page(page: ft.Page):
     )
 
     # Fetch current alias details
-    async def load_alias_details():
-        nonlocal alias_data
+    @traced("ui.load_alias_details")
+    async def load_alias_details(pending=None):
+        """
+        Returns True when fresh details were loaded, False for an offline copy or a failure.
+        Only the fields that changed since the last load are redrawn.
+        """
         try:
-            response = await make_request(
-                page,
-                f"{API_BASE_URL}/details",
-                method="GET",
-                auth_token=page.session_data.access_token
-            )
+            response = await (pending if pending is not None else fetch_alias_details(page))
 
             if response['ok']:
-                data = response['body'].get("data", {})
-                alias_data = data
-
-                url_display_text.value = data.get("url", "N/A")
-                hits_text.value = f"Hits: {data.get('url_hits', 0)}"
-
-                created_at = data.get("url_created_at", "")
-                if created_at:
-                    # Format the date
-                    from datetime import datetime
-                    try:
-                        dt = datetime.fromisoformat(created_at.replace('Z', '+00:00'))
-                        created_text.value = f"Created: {dt.strftime('%b %d, %Y at %I:%M %p')}"
-                    except:
-                        created_text.value = f"Created: {created_at}"
-
-                is_active = data.get("url_state", False)
-                state_text.value = f"Status: {'Active' if is_active else 'Paused'}"
-                state_text.color = "#5ab896" if is_active else "#ff6b6b"
-
-                # Update toggle button icon and tooltip
-                toggle_status_icon_button.icon = ft.Icons.PAUSE_CIRCLE if is_active else ft.Icons.PLAY_CIRCLE
-                toggle_status_icon_button.icon_color = "#ff8c42" if is_active else "#5ab896"
-                toggle_status_icon_button.tooltip = "Pause Alias" if is_active else "Resume Alias"
+                changed = alias_details.update(response['body'].get("data", {}))
+
+                if 'url' in changed:
+                    url_display_text.value = alias_details.url or "N/A"
+                    url_display_text.color = "#ffffff"
+                if 'hits' in changed:
+                    hits_text.value = f"Hits: {alias_details.hits}"
+                if 'created_at' in changed:
+                    created_at = alias_details.created_at
+                    created = created_at.strftime('%b %d, %Y at %I:%M %p') if created_at else alias_details.created_raw
+                    created_text.value = f"Created: {created}" if created else ""
+                if 'active' in changed:
+                    is_active = alias_details.active
+                    state_text.value = f"Status: {'Active' if is_active else 'Paused'}"
+                    state_text.color = "#5ab896" if is_active else "#ff6b6b"
+
+                    # Update toggle button icon and tooltip
+                    toggle_status_icon_button.icon = ft.Icons.PAUSE_CIRCLE if is_active else ft.Icons.PLAY_CIRCLE
+                    toggle_status_icon_button.icon_color = "#ff8c42" if is_active else "#5ab896"
+                    toggle_status_icon_button.tooltip = "Pause Alias" if is_active else "Resume Alias"
+
+                # The web build's service worker answers from its cache when the API can't be reached
+                cached_at = response.get('headers', {}).get(CACHED_AT_HEADER)
+                if cached_at:
+                    saved = parse_timestamp(cached_at)
+                    status_text.value = f"Offline: showing details from {saved.strftime('%b %d at %I:%M %p') if saved else cached_at}"
+                    status_text.color = "#ff8c42"
+                if changed or cached_at:
+                    page.update()
+                start_link_check()
+                return not cached_at
             else:
                 url_display_text.value = "Failed to load alias details"
                 url_display_text.color = "#ff6b6b"
-            page.update()
         except Exception as ex:
+            log_error("ui.load_alias_details", ex)
             url_display_text.value = f"Error: {str(ex)}"
             url_display_text.color = "#ff6b6b"
-            page.update()
+        # The error replaced the URL, so the next load redraws everything
+        alias_details.reset()
+        page.update()
+        return False
 
     async def on_delete_click(e):
         # Confirmation dialog
+        @single_submit
+        @traced("ui.confirm_delete")
         async def confirm_delete(confirm_e):
             dialog.open = False
             page.update()
@@ -730,12 +1275,13 @@ async def show_manage_alias_page(page: ft.Page):
                 )
 
                 if response['ok']:
+                    alias_cache.set(page.session_data.current_alias, True)
+                    page.session_data.forget_alias(page.session_data.current_alias)
                     status_text.value = "Alias deleted successfully!"
                     status_text.color = "#5ab896"
                     page.update()
 
                     # Return to main page after short delay
-                    import asyncio
                     await asyncio.sleep(1.5)
                     page.controls.clear()
                     show_main_page(page)
@@ -747,6 +1293,7 @@ async def show_manage_alias_page(page: ft.Page):
                     page.update()
 
             except Exception as ex:
+                log_error("ui.confirm_delete", ex)
                 status_text.value = f"Error: {str(ex)}"
                 status_text.color = "#ff6b6b"
                 page.update()
@@ -765,9 +1312,26 @@ async def show_manage_alias_page(page: ft.Page):
             ],
         )
 
-        page.overlay.append(dialog)
-        dialog.open = True
-        page.update()
+        open_dialog(page, dialog)
+
+    async def on_bulk_finished(action, succeeded):
+        current_alias = page.session_data.current_alias
+        if current_alias not in succeeded:
+            return
+        if action == 'delete':
+            page.session_data.forget_alias(current_alias)
+            status_text.value = "Current alias deleted, returning home..."
+            status_text.color = "#5ab896"
+            page.update()
+            await asyncio.sleep(1.5)
+            page.controls.clear()
+            show_main_page(page)
+            page.update()
+        else:
+            await load_alias_details()
+
+    bulk_panel = bulk_actions_panel(page, on_bulk_finished)
+    schedule_panel = scheduled_actions_panel(page)
 
     edit_password_button = ft.ElevatedButton(
         content=ft.Row(
@@ -824,6 +1388,10 @@ async def show_manage_alias_page(page: ft.Page):
                     status_text,
                     ft.Container(height=20),
                     password_edit_container,
+                    ft.Container(height=20),
+                    schedule_panel,
+                    ft.Container(height=20),
+                    bulk_panel,
                     ft.Container(height=30),
                     ft.Divider(color="#333333", height=1),
                     ft.Container(height=20),
@@ -847,13 +1415,16 @@ async def show_manage_alias_page(page: ft.Page):
         )
     )
 
-    # Load alias details after page is rendered
-    await load_alias_details()
+    # Bind the details fetched while the page was being built
+    await load_alias_details(details)
 
 
 
 
+@traced("ui.show_login_page")
 def show_login_page(page: ft.Page):
+    log(NAVIGATION, "page", page="login")
+    @traced("ui.go_back")
     def go_back(e):
         page.controls.clear()
         show_main_page(page)
@@ -910,6 +1481,8 @@ def show_login_page(page: ft.Page):
         text_align=ft.TextAlign.CENTER,
     )
 
+    @single_submit
+    @traced("ui.on_login_click")
     async def on_login_click(e):
         if not alias_field.value or not password_field.value:
             status_text.value = "Please fill in both fields"
@@ -918,23 +1491,16 @@ def show_login_page(page: ft.Page):
             return
         status_text.value = "Loging in..."
         status_text.color = "#5ab896"
+        login_button.disabled = True
         page.update()
         try:
-            response = await make_request(
-                page,
-                f"{API_BASE_URL}/login",
-                method="POST",
-                data={
-                    'url_code': alias_field.value,
-                    'url_pass': password_field.value
-                }
-            )
+            response = await login_alias(page, alias_field.value, password_field.value)
 
             if response['ok']:
                 data = response['body']
-                page.session_data.access_token = data.get("access_token")
                 page.session_data.current_alias = alias_field.value
-                page.session_data.token_time =datetime.now()
+                page.session_data.remember_token(alias_field.value, data.get("access_token"))
+                details = asyncio.ensure_future(fetch_alias_details(page))
 
                 status_text.value = "Login successful!"
                 status_text.color = "#5ab896"
@@ -942,7 +1508,7 @@ def show_login_page(page: ft.Page):
 
                 # Navigate to manage alias page
                 page.controls.clear()
-                await show_manage_alias_page(page)
+                await show_manage_alias_page(page, details)
                 page.update()
             else:
                 error_detail = response['body'].get("detail", "Login failed")
@@ -951,6 +1517,7 @@ def show_login_page(page: ft.Page):
                 page.update()
 
         except Exception as ex:
+            log_error("ui.on_login_click", ex)
             status_text.value = f"Error: {str(ex)}"
             status_text.color = "#ff6b6b"
             page.update()
@@ -992,7 +1559,9 @@ def show_login_page(page: ft.Page):
     )
 
 
+@traced("ui.show_down_page")
 def show_down_page(page: ft.Page):
+    log(NAVIGATION, "page", page="down")
     title_row = ft.Row(
         [
             ditto_image,
@@ -1007,6 +1576,7 @@ def show_down_page(page: ft.Page):
         spacing=10,
     )
 
+    @traced("ui.retry_connection")
     async def retry_connection(e):
         page.controls.clear()
         await connection(page)
@@ -1034,7 +1604,177 @@ def show_down_page(page: ft.Page):
     )
 
 
+async def open_user_history(page):
+    user_id = None
+    if ditto_history.stored():
+        try:
+            user_id = await asyncio.wait_for(page.client_storage.get_async(HISTORY_ID_KEY), HISTORY_ID_TIMEOUT)
+            if not ditto_history.valid_user_id(user_id):
+                user_id = ditto_history.new_user_id()
+                await asyncio.wait_for(page.client_storage.set_async(HISTORY_ID_KEY, user_id), HISTORY_ID_TIMEOUT)
+        except Exception:
+            # A browser without client storage keeps its history for this session only
+            user_id = None
+    return ditto_history.history_for(user_id)
+
+
+async def user_history(page):
+    """The link history of the page's browser, opened once per session"""
+    if page.session_data.history is None:
+        page.session_data.history = asyncio.ensure_future(open_user_history(page))
+    return await asyncio.shield(page.session_data.history)
+
+
+def link_history_panel(page: ft.Page):
+    """
+    Links created from this browser, newest first, with prefix search over aliases and
+    target URLs. The history is not read until the panel is opened, and rows are built
+    HISTORY_PAGE_SIZE at a time as the list scrolls. Returns the panel and a function to
+    call with each newly created history entry.
+    """
+    history = None  # the browser's LinkHistory, once the panel has been opened
+    matches = []  # entries for the current search, newest first
+
+    def on_open_click(e):
+        page.launch_url(e.control.data)
+
+    def on_copy_click(e):
+        page.set_clipboard(e.control.data)
+        summary_text.value = f"Copied {e.control.data}"
+        page.update()
+
+    def history_row(entry):
+        short_url = entry.get('short_url', "")
+        created = entry.get('created', "").replace("T", " ")[:16]
+        return ft.Container(
+            content=ft.Row(
+                [
+                    ft.Column(
+                        [
+                            ft.TextButton(
+                                text=short_url or entry.get('alias', ""),
+                                data=short_url,
+                                on_click=on_open_click,
+                                disabled=not short_url,
+                                style=ft.ButtonStyle(color="#5ab896", padding=0),
+                            ),
+                            ft.Text(
+                                f"{created}  {entry.get('url', '')}",
+                                color="#8a8a8a",
+                                size=12,
+                                no_wrap=True,
+                                overflow=ft.TextOverflow.ELLIPSIS,
+                            ),
+                        ],
+                        spacing=2,
+                        expand=True,
+                    ),
+                    ft.IconButton(
+                        icon=ft.Icons.CONTENT_COPY,
+                        icon_color="#8a8a8a",
+                        icon_size=18,
+                        tooltip="Copy short URL",
+                        data=short_url,
+                        on_click=on_copy_click,
+                        disabled=not short_url,
+                    ),
+                ],
+            ),
+            height=HISTORY_ROW_HEIGHT,
+        )
+
+    def show_more():
+        shown = len(history_list.controls)
+        history_list.controls.extend(history_row(entry) for entry in matches[shown:shown + HISTORY_PAGE_SIZE])
+
+    def show_matches():
+        nonlocal matches
+        query = (search_field.value or "").strip()
+        matches = history.search(query)
+        history_list.controls = []
+        show_more()
+        if matches:
+            summary_text.value = f"{len(matches)} of {len(history)} links"
+        else:
+            summary_text.value = f"No links starting with '{query}'" if query else "No links created yet"
+
+    # The handlers are async so they read the history on the event loop, where creates add to it
+    @traced("ui.on_history_search")
+    async def on_search_change(e):
+        if history is None:
+            return
+        show_matches()
+        history_list.scroll_to(offset=0)
+        page.update()
+
+    async def on_history_scroll(e):
+        if len(history_list.controls) < len(matches) and e.max_scroll_extent - e.pixels < HISTORY_LOAD_MARGIN:
+            show_more()
+            history_list.update()
+
+    @traced("ui.on_history_toggle")
+    async def on_toggle_click(e):
+        nonlocal history
+        # Closed, the body is taken off the page so its rows cost the session nothing
+        if history_body in panel.controls:
+            panel.controls = [toggle_button]
+            history_list.controls = []
+            toggle_button.text = "Show history"
+        else:
+            history = await user_history(page)
+            show_matches()
+            panel.controls = [toggle_button, history_body]
+            toggle_button.text = "Hide history"
+        page.update()
+
+    def on_created(entry):
+        if history is not None and history_body in panel.controls:
+            show_matches()
+
+    search_field = ft.TextField(
+        label="Search aliases and URLs",
+        border_color="#4a9b7f",
+        focused_border_color="#5ab896",
+        label_style=ft.TextStyle(color="#8a8a8a"),
+        text_style=ft.TextStyle(color="#ffffff"),
+        cursor_color="#5ab896",
+        width=460,
+        on_change=on_search_change,
+    )
+
+    summary_text = ft.Text("", color="#8a8a8a", size=12)
+
+    history_list = ft.ListView(
+        height=HISTORY_HEIGHT,
+        item_extent=HISTORY_ROW_HEIGHT,
+        spacing=0,
+        on_scroll=on_history_scroll,
+        on_scroll_interval=100,
+    )
+
+    history_body = ft.Column(
+        [search_field, summary_text, history_list],
+        horizontal_alignment=ft.CrossAxisAlignment.CENTER,
+        width=460,
+    )
+
+    toggle_button = ft.TextButton(
+        text="Show history",
+        icon=ft.Icons.HISTORY,
+        style=ft.ButtonStyle(color="#5ab896"),
+        on_click=on_toggle_click,
+    )
+
+    panel = ft.Column(
+        [toggle_button],
+        horizontal_alignment=ft.CrossAxisAlignment.CENTER,
+    )
+    return panel, on_created
+
+
+@traced("ui.show_main_page")
 def show_main_page(page: ft.Page):
+    log(NAVIGATION, "page", page="main")
     status_text = ft.Text(
         "",
         color="#ff6b6b",
@@ -1075,21 +1815,61 @@ def show_main_page(page: ft.Page):
         visible=False,
     )
 
+    qr_image = ft.Image(width=QR_SIZE, height=QR_SIZE, fit=ft.ImageFit.CONTAIN, visible=False)
+
+    @traced("ui.on_download_qr_click")
+    async def on_download_qr_click(e):
+        short_url = short_url_text.data
+        if not short_url:
+            return
+        alias = short_url.rstrip("/").rsplit("/", 1)[-1]
+        path = os.path.join(EXPORT_DIR, f"qr-{alias}.png")
+        # Rendered on the event loop, which owns the QR cache; only the file write goes to a thread
+        png = qr_png(short_url, scale=QR_DOWNLOAD_SCALE)
+
+        def save():
+            os.makedirs(EXPORT_DIR, exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(png)
+
+        try:
+            await asyncio.to_thread(save)
+            status_text.value = f"QR code saved to {path}"
+            status_text.color = "#5ab896"
+        except OSError as ex:
+            status_text.value = f"Could not save QR code: {str(ex)}"
+            status_text.color = "#ff6b6b"
+        page.update()
+
+    download_qr_button = ft.TextButton(
+        text="Download QR",
+        icon=ft.Icons.DOWNLOAD,
+        style=ft.ButtonStyle(color="#5ab896"),
+        on_click=on_download_qr_click,
+    )
+
     short_url_container = ft.Container(
-        content=ft.Row(
+        content=ft.Column(
             [
-                ft.TextButton(
-                    content=short_url_text,
-                    on_click=on_url_click,
-                    style=ft.ButtonStyle(
-                        padding=0,
-                        overlay_color="transparent",
-                    ),
+                ft.Row(
+                    [
+                        ft.TextButton(
+                            content=short_url_text,
+                            on_click=on_url_click,
+                            style=ft.ButtonStyle(
+                                padding=0,
+                                overlay_color="transparent",
+                            ),
+                        ),
+                        copy_button,
+                    ],
+                    spacing=15,
+                    alignment=ft.MainAxisAlignment.CENTER,
                 ),
-                copy_button,
+                qr_image,
+                download_qr_button,
             ],
-            spacing=15,
-            alignment=ft.MainAxisAlignment.CENTER,
+            horizontal_alignment=ft.CrossAxisAlignment.CENTER,
         ),
         visible=False,
     )
@@ -1104,6 +1884,81 @@ def show_main_page(page: ft.Page):
         width=500,
     )
 
+    alias_check_task = None
+
+    alias_status_text = ft.Text(
+        "",
+        color="#8a8a8a",
+        size=12,
+        visible=False,
+    )
+
+    alias_suggestions_row = ft.Row(
+        [],
+        spacing=8,
+        alignment=ft.MainAxisAlignment.CENTER,
+        wrap=True,
+        visible=False,
+    )
+
+    def show_alias_status(message, color):
+        alias_status_text.value = message
+        alias_status_text.color = color
+        alias_status_text.visible = bool(message)
+
+    def on_suggestion_click(e):
+        alias_field.value = e.control.data
+        show_alias_status(f"'{e.control.data}' is available", "#5ab896")
+        alias_suggestions_row.visible = False
+        alias_suggestions_row.controls.clear()
+        page.update()
+
+    async def run_alias_check(alias):
+        await asyncio.sleep(ALIAS_CHECK_DEBOUNCE)
+        show_alias_status("Checking availability...", "#8a8a8a")
+        page.update()
+
+        available = await check_alias_available(page, alias)
+        if available is None:
+            show_alias_status("", "#8a8a8a")
+        elif available:
+            show_alias_status(f"'{alias}' is available", "#5ab896")
+        else:
+            show_alias_status(f"'{alias}' is already taken", "#ff6b6b")
+            page.update()
+
+            free_aliases = await find_free_aliases(page, alias)
+            if free_aliases:
+                show_alias_status(f"'{alias}' is already taken. Try:", "#ff6b6b")
+                alias_suggestions_row.controls = [
+                    ft.TextButton(
+                        text=suggestion,
+                        data=suggestion,
+                        style=ft.ButtonStyle(color="#5ab896"),
+                        on_click=on_suggestion_click,
+                    )
+                    for suggestion in free_aliases
+                ]
+                alias_suggestions_row.visible = True
+        page.update()
+
+    async def on_alias_change(e):
+        nonlocal alias_check_task
+        # Drop the pending or in-flight check for the previous value
+        if alias_check_task and not alias_check_task.done():
+            alias_check_task.cancel()
+        alias_check_task = None
+
+        if alias_status_text.visible or alias_suggestions_row.visible:
+            show_alias_status("", "#8a8a8a")
+            alias_suggestions_row.visible = False
+            alias_suggestions_row.controls.clear()
+            page.update()
+
+        alias = (alias_field.value or "").strip()
+        if alias:
+            alias_check_task = asyncio.create_task(run_alias_check(alias))
+
     alias_field = ft.TextField(
         label="Alias",
         border_color="#4a9b7f",
@@ -1112,6 +1967,7 @@ def show_main_page(page: ft.Page):
         text_style=ft.TextStyle(color="#ffffff"),
         cursor_color="#5ab896",
         width=500,
+        on_change=on_alias_change,
     )
 
     password_field = ft.TextField(
@@ -1142,56 +1998,78 @@ def show_main_page(page: ft.Page):
         spacing=10,
     )
 
+    duplicate_warned_url = None
+
+    def show_shrink_error(message):
+        status_text.value = message
+        status_text.color = "#ff6b6b"
+        short_url_container.visible = False
+        short_url_text.value = ""
+        short_url_text.data = ""
+
+    @single_submit
+    @traced("ui.on_shrink_click")
     async def on_shrink_click(e):
+        nonlocal duplicate_warned_url
         if shrink_button.text == "Shrink URL":
-            if not url_field.value or not alias_field.value:
-                status_text.value = "Please fill in both Long URL and Alias fields"
-                status_text.color = "#ff6b6b"
-                short_url_container.visible = False
-                short_url_text.value = ""
-                short_url_text.data = ""
+            target_url, url_error = normalize_url(url_field.value)
+            alias = (alias_field.value or "").strip()
+            previous_short_url = page.session_data.recent_creates.get(target_url)
+            if not url_field.value or not alias:
+                show_shrink_error("Please fill in both Long URL and Alias fields")
+            elif url_error:
+                show_shrink_error(url_error)
+            elif alias_cache.get(alias) is False:
+                show_shrink_error(f"Alias '{alias}' is already taken")
+            elif previous_short_url and duplicate_warned_url != target_url:
+                # Warn once; a second click creates another alias for the same URL
+                duplicate_warned_url = target_url
+                status_text.value = f"You already shortened this URL as {previous_short_url}. Click Shrink URL again to create another alias."
+                status_text.color = "#ff8c42"
             else:
+                if alias_check_task and not alias_check_task.done():
+                    alias_check_task.cancel()
+                url_field.value = target_url
                 status_text.value = "Shrinking..."
                 status_text.color = "#5ab896"
+                shrink_button.disabled = True
                 page.update()
                 try:
-                    response = await make_request(
-                        page,
-                        f"{API_BASE_URL}/create",
-                        method="POST",
-                        data={
-                            'url': url_field.value,
-                            'url_code': alias_field.value,
-                            'url_pass': password_field.value
-                        }
-                    )
+                    response = await create_alias(page, target_url, alias, password_field.value or "")
 
                     if response['ok']:
+                        alias_cache.set(alias, False)
                         data = response['body']
                         short_url = data.get("short_url", "")
+                        page.session_data.remember_create(target_url, short_url)
+                        history = await user_history(page)
+                        history_created(history.add(target_url, alias, short_url))
                         status_text.value = "URL shortened successfully!"
                         status_text.color = "#5ab896"
                         short_url_text.value = short_url
                         short_url_text.data = short_url
-                        short_url_container.visible = True
+                        short_url_container.visible = bool(short_url)
+                        qr_image.src_base64 = qr_png_base64(short_url) if short_url else None
+                        qr_image.visible = download_qr_button.visible = bool(short_url)
                         copy_button.visible = True
                         copy_button.content.controls[1].value = "Copy"
                         shrink_button.text = "Shrink another URL"
                     else:
-                        status_text.value = response['body'].get("detail", "An error occurred")
-                        status_text.color = "#ff6b6b"
-                        short_url_container.visible = False
-                        short_url_text.value = ""
-                        short_url_text.data = ""
+                        show_shrink_error(response['body'].get("detail", "An error occurred"))
                 except Exception as ex:
-                    status_text.value = f"Error: {str(ex)}"
-                    status_text.color = "#ff6b6b"
-                    short_url_container.visible = False
-                    short_url_text.value = ""
-                    short_url_text.data = ""
+                    log_error("ui.on_shrink_click", ex)
+                    show_shrink_error(f"Error: {str(ex)}")
         else:
-            page.controls.clear()
-            show_main_page(page)
+            # Reset the form in place, so the history panel keeps its state
+            url_field.value = alias_field.value = password_field.value = ""
+            show_alias_status("", "#8a8a8a")
+            alias_suggestions_row.visible = False
+            alias_suggestions_row.controls.clear()
+            status_text.value = ""
+            short_url_container.visible = False
+            short_url_text.value = short_url_text.data = ""
+            qr_image.src_base64 = None
+            shrink_button.text = "Shrink URL"
         page.update()
 
     shrink_button = ft.ElevatedButton(
@@ -1210,15 +2088,22 @@ def show_main_page(page: ft.Page):
         response = await make_request(page, f"{API_BASE_URL}/validate_token", timeout=5, auth_token=page.session_data.access_token)
         return response['ok']
 
+    @traced("ui.on_link_click")
     async def on_link_click(e):
         page.controls.clear()
-        if page.session_data.access_token and await isLogedIn():
-            await show_manage_alias_page(page)
+        # Fetch details alongside the token check instead of after it
+        details = asyncio.ensure_future(fetch_alias_details(page)) if page.session_data.access_token else None
+        if details is not None and await isLogedIn():
+            await show_manage_alias_page(page, details)
         else:
-            page.session_data = SessionData()
+            if details is not None:
+                details.cancel()
+            page.session_data.clear_login()
             show_login_page(page)
         page.update()
 
+    history_panel, history_created = link_history_panel(page)
+
     manage_alias_text = ft.Row(
         [
             ft.Text(
@@ -1249,6 +2134,8 @@ def show_main_page(page: ft.Page):
                     url_field,
                     ft.Container(height=20),
                     alias_field,
+                    alias_status_text,
+                    alias_suggestions_row,
                     ft.Container(height=20),
                     password_field,
                     ft.Container(height=30),
@@ -1258,6 +2145,7 @@ def show_main_page(page: ft.Page):
                     ft.Container(height=10),
                     short_url_container,
                     ft.Container(height=10),
+                    history_panel,
                     manage_alias_text,
                 ],
                 horizontal_alignment=ft.CrossAxisAlignment.CENTER,
@@ -1267,6 +2155,7 @@ def show_main_page(page: ft.Page):
     )
 
 
+@traced("ui.connection")
 async def connection(page: ft.Page):
     status_text = ft.Text(
         "Loading...",
@@ -1298,6 +2187,34 @@ async def connection(page: ft.Page):
     except Exception:
         show_down_page(page)
 
+
+def reap_session(page: ft.Page):
+    """Release an idle session's login state and controls, leaving a way back in"""
+    page.session_data = SessionData()
+    page.overlay.clear()
+    page.controls.clear()
+
+    async def on_continue_click(e):
+        page.controls.clear()
+        await connection(page)
+        page.update()
+
+    page.add(
+        ft.Container(
+            content=ft.Column(
+                [
+                    ft.Text("Session closed after inactivity", color="#ff8c42", size=20, text_align=ft.TextAlign.CENTER),
+                    ft.ElevatedButton("Continue", on_click=on_continue_click, bgcolor="#5ab896", color="white"),
+                ],
+                horizontal_alignment=ft.CrossAxisAlignment.CENTER,
+                spacing=20,
+            ),
+            padding=40,
+            alignment=ft.alignment.center,
+        )
+    )
+
+
 async def main(page: ft.Page):
     page.title = "Ditto"
     page.bgcolor = "#1a1a1a"
@@ -1308,8 +2225,22 @@ async def main(page: ft.Page):
 
     if not hasattr(page, 'session_data'):
         page.session_data = SessionData()
+    instrument_page(page)
+    sessions.register(page, reap_session)
+    page.on_disconnect = lambda e: sessions.disconnected(page)
+    page.on_close = lambda e: sessions.unregister(page)
+    start_backend_checks()
+    jobs.start()
 
     await connection(page)
+    mark_startup("first_page")
 
 
-ft.app(target=main, view=ft.AppView.WEB_BROWSER)
+if __name__ == "__main__":
+    if WARMUP_ENABLED:
+        for base_url in API_BASE_URLS:
+            warm_up_in_background(base_url)
+    if os.environ.get("DITTO_METRICS_PORT"):
+        import ditto_metrics
+        ditto_metrics.serve(int(os.environ["DITTO_METRICS_PORT"]))
+    ft.app(target=main, view=ft.AppView.WEB_BROWSER)
@@ -0,0 +1,894 @@
+"""
+Ditto's request layer: HTTP helpers, session state and alias operations.
+Kept free of Flet imports so the CLI and scripts can use it without the UI.
+"""
+import asyncio
+import json
+import logging
+import os
+import re
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from time import monotonic
+from urllib.parse import quote, urlsplit, urlunsplit
+
+import ditto_cassette
+import ditto_http
+from ditto_backends import BackendRouter, failovers_total, parse_base_urls
+from ditto_latency import endpoint_key, hedges_total, latency
+from ditto_logging import ERROR, REQUEST, log
+from ditto_ratelimit import MAX_RETRY_AFTER, RATE_LIMIT_HEADERS, RATE_LIMIT_RETRIES, rate_limiter, session_bucket
+from ditto_scheduler import BACKGROUND, BULK, INTERACTIVE, scheduler
+from ditto_sessions import MAX_ALIAS_TOKENS, MAX_INFLIGHT_REQUESTS
+from ditto_tracing import span, traced
+
+# Comma-separated for several replicas; URLs are built on the first and routed by ditto_backends
+API_BASE_URLS = parse_base_urls(os.environ.get("DITTO_API_BASE_URL", "https://short-url.leapcell.app"))
+API_BASE_URL = API_BASE_URLS[0]
+HEALTH_CHECK_TIMEOUT = 5
+
+# Record/replay layer under make_request (see ditto_cassette); None talks to the network
+transport = ditto_cassette.from_environment()
+TOKEN_REFRESH_TIME = 8
+ALIAS_CACHE_SIZE = 1024
+ALIAS_CACHE_TTL = 120  # seconds an availability answer is trusted
+ALIAS_SUGGESTION_COUNT = 3
+MAX_URL_LENGTH = 2048
+RECENT_CREATES_LIMIT = 100
+BULK_CONCURRENCY = 8  # parallel requests in a bulk action
+EXPORT_FIELDS = ['alias', 'url', 'hits', 'state', 'created_at']
+# Set by the web build's service worker on answers served from its offline cache
+CACHED_AT_HEADER = 'x-ditto-cached-at'
+# Public base of short links, for when the API doesn't return one; the API host need not serve them
+SHORT_URL_BASE = os.environ.get("DITTO_SHORT_URL_BASE", "").rstrip("/")
+# Header carrying each /create attempt's idempotency key, e.g. Idempotency-Key; off unless the API
+# honours it (and, for the web build, its CORS policy allows it)
+IDEMPOTENCY_HEADER = os.environ.get("DITTO_IDEMPOTENCY_HEADER", "")
+CREATE_RETRIES = 2  # resends of a create whose outcome is unknown
+CREATE_RETRY_DELAY = 1.0  # seconds, multiplied by the attempt number
+# Answers after which a create may or may not have been applied
+AMBIGUOUS_STATUSES = (0, 502, 503, 504)
+ALIAS_EXISTS_STATUSES = (400, 409)
+
+class SessionData:
+    __slots__ = ('access_token', 'current_alias', 'token_time', 'recent_creates', 'create_keys', 'submissions',
+                 'alias_tokens', 'rate_bucket', 'inflight', 'refresh_task', 'max_aliases', 'history')
+
+    def __init__(self):
+        self.access_token = None
+        self.current_alias = None
+        self.token_time = None
+        self.recent_creates = OrderedDict()  # normalized target URL -> short URL
+        self.create_keys = OrderedDict()  # (url, alias, password) -> idempotency key of a create with unknown outcome
+        self.submissions = {}  # form submission key -> future of its request while in flight
+        self.alias_tokens = {}  # alias -> (access token, token time) for every logged-in alias
+        self.rate_bucket = session_bucket()
+        self.inflight = None
+        self.refresh_task = None
+        self.max_aliases = MAX_ALIAS_TOKENS  # None keeps every login
+        self.history = None  # task opening the link history of the session's browser
+
+    def inflight_budget(self):
+        """Semaphore capping this session's concurrent requests, created on the running loop"""
+        if self.inflight is None:
+            self.inflight = asyncio.Semaphore(MAX_INFLIGHT_REQUESTS)
+        return self.inflight
+
+    def remember_token(self, alias, access_token):
+        self.alias_tokens.pop(alias, None)
+        self.alias_tokens[alias] = (access_token, datetime.now())
+        if alias == self.current_alias:
+            self.access_token = access_token
+            self.token_time = datetime.now()
+        # Over budget: forget the longest-held logins, never the one being managed
+        stale = (alias for alias in list(self.alias_tokens) if alias != self.current_alias)
+        while self.max_aliases is not None and len(self.alias_tokens) > self.max_aliases:
+            del self.alias_tokens[next(stale)]
+
+    def forget_alias(self, alias):
+        self.alias_tokens.pop(alias, None)
+        if alias == self.current_alias:
+            self.clear_login()
+
+    def clear_login(self):
+        self.alias_tokens.pop(self.current_alias, None)
+        self.access_token = None
+        self.current_alias = None
+        self.token_time = None
+
+    def remember_create(self, url, short_url):
+        self.recent_creates[url] = short_url
+        self.recent_creates.move_to_end(url)
+        while len(self.recent_creates) > RECENT_CREATES_LIMIT:
+            self.recent_creates.popitem(last=False)
+
+    def create_key(self, submission):
+        """Idempotency key for a create: reused until an attempt with it gets a definite answer"""
+        key = self.create_keys.get(submission)
+        if key is None:
+            key = self.create_keys[submission] = uuid.uuid4().hex
+            while len(self.create_keys) > RECENT_CREATES_LIMIT:
+                self.create_keys.popitem(last=False)
+        return key
+
+
+def parse_timestamp(value):
+    """datetime from the API's ISO timestamps ('Z' suffix included), None if it isn't one"""
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except (AttributeError, ValueError):
+        return None
+
+
+class AliasDetails:
+    """
+    One alias's /details, parsed once. Fields start as None, so the first update() reports
+    them all as changed; views redraw just the fields each later update() reports.
+    """
+    __slots__ = ('alias', 'url', 'hits', 'active', 'created_raw', 'created_at')
+    FIELDS = ('url', 'hits', 'active', 'created_at')
+
+    def __init__(self, alias=None):
+        self.alias = alias
+        self.reset()
+
+    def reset(self):
+        """Forget every field, e.g. after the view showed an error in their place"""
+        self.url = None
+        self.hits = None
+        self.active = None
+        self.created_raw = None
+        self.created_at = None  # datetime, or None when the API's value isn't a timestamp
+
+    @classmethod
+    def from_api(cls, data, alias=None):
+        details = cls(alias)
+        details.update(data)
+        return details
+
+    def update(self, data):
+        """Apply a /details "data" object; returns the names of the fields that changed"""
+        changed = set()
+        # Missing and null values count as empty, so a field the API clears is reported as changed
+        for name, value in (('url', data.get("url") or ""), ('hits', data.get("url_hits") or 0), ('active', bool(data.get("url_state")))):
+            if getattr(self, name) != value:
+                setattr(self, name, value)
+                changed.add(name)
+        created_raw = data.get("url_created_at") or ""
+        if created_raw != self.created_raw:
+            # Parsing is the costly part, so it only happens when the raw value changes
+            self.created_raw = created_raw
+            self.created_at = parse_timestamp(created_raw)
+            changed.add('created_at')
+        return changed
+
+    def to_row(self):
+        return {
+            'alias': self.alias,
+            'url': self.url,
+            'hits': self.hits,
+            'state': "active" if self.active else "paused",
+            'created_at': self.created_raw,
+        }
+
+
+def shared_submission(page, key, submit):
+    """
+    Run a form submission once while it is in flight: identical submissions (same key) from
+    this session get the same future instead of sending another request. submit() returns
+    the coroutine to run.
+    """
+    submissions = page.session_data.submissions
+    future = submissions.get(key)
+    if future is None:
+        future = submissions[key] = asyncio.ensure_future(submit())
+        future.add_done_callback(lambda done: submissions.pop(key, None))
+    # Shielded so one caller being cancelled doesn't abort the request for the others
+    return asyncio.shield(future)
+
+
+async def login_alias(page, alias, password, flag=True, priority=INTERACTIVE):
+    """POST /login, shared by identical logins in flight"""
+    return await shared_submission(page, ('login', alias, password), lambda: make_request(
+        page,
+        f"{API_BASE_URL}/login",
+        method="POST",
+        data={
+            'url_code': alias,
+            'url_pass': password
+        },
+        flag=flag,
+        priority=priority
+    ))
+
+
+async def create_alias(page, target_url, alias, password="", flag=True):
+    """
+    POST /create, shared by identical creates in flight. Attempts carry an idempotency key,
+    and a create whose outcome is unknown (timeout, 502-504) is resent with the same key,
+    also when the user submits it again later. If the alias then turns out to exist already,
+    it is checked by logging in: an alias with this password and target URL was created by
+    the earlier attempt, and is reported as created.
+    """
+    submission = (target_url, alias, password)
+    return await shared_submission(page, ('create',) + submission, lambda: send_create(page, submission, flag))
+
+
+@traced("create_alias")
+async def send_create(page, submission, flag):
+    target_url, alias, password = submission
+    session = page.session_data
+    # A key already on record means an earlier attempt may have been applied
+    uncertain = submission in session.create_keys
+    # Recorded even when the header is off, so a later resubmit knows this create's outcome is unknown
+    key = session.create_key(submission)
+    headers = {IDEMPOTENCY_HEADER: key} if IDEMPOTENCY_HEADER else None
+    for attempt in range(CREATE_RETRIES + 1):
+        if attempt:
+            await asyncio.sleep(CREATE_RETRY_DELAY * attempt)
+        response = await make_request(
+            page,
+            f"{API_BASE_URL}/create",
+            method="POST",
+            data={
+                'url': target_url,
+                'url_code': alias,
+                'url_pass': password
+            },
+            flag=flag,
+            headers=headers
+        )
+        if response['status'] not in AMBIGUOUS_STATUSES:
+            break
+        uncertain = True
+    else:
+        return response
+    session.create_keys.pop(submission, None)
+    if uncertain and response['status'] in ALIAS_EXISTS_STATUSES and await created_earlier(page, target_url, alias, password):
+        # The answer carrying the short URL was lost; without a configured base it stays unknown
+        short_url = short_url_for(alias)
+        return {'ok': True, 'status': 200, 'body': {'short_url': short_url} if short_url else {}, 'headers': {}}
+    return response
+
+
+def short_url_for(alias):
+    """Short link of alias on DITTO_SHORT_URL_BASE, or "" when no base is configured"""
+    return f"{SHORT_URL_BASE}/{quote(alias, safe='')}" if SHORT_URL_BASE else ""
+
+
+async def created_earlier(page, target_url, alias, password):
+    """Whether alias exists with this password and target URL, i.e. an earlier create went through"""
+    response = await make_request(page, f"{API_BASE_URL}/login", method="POST", data={'url_code': alias, 'url_pass': password}, flag=False)
+    if not response['ok']:
+        return False
+    access_token = response['body'].get("access_token")
+    response = await make_request(page, f"{API_BASE_URL}/details", auth_token=access_token, flag=False)
+    return response['ok'] and response['body'].get("data", {}).get("url") == target_url
+
+
+async def refresh_token(page, priority=INTERACTIVE):
+    """Refresh the session's token; concurrent callers share a single /refresh_token call"""
+    session = page.session_data
+    if session.refresh_task is None or session.refresh_task.done():
+        session.refresh_task = asyncio.ensure_future(request_token_refresh(page, priority))
+    # Shielded so one caller being cancelled doesn't abort the refresh for the others
+    await asyncio.shield(session.refresh_task)
+
+
+@traced("refresh_token")
+async def request_token_refresh(page, priority=INTERACTIVE):
+    response = await make_request(
+        page,
+        f"{API_BASE_URL}/refresh_token",
+        method="GET",
+        auth_token=page.session_data.access_token,
+        flag=False,
+        priority=priority
+    )
+    if response['ok']:
+        data = response['body']
+        page.session_data.access_token = data.get("access_token")
+        page.session_data.token_time=datetime.now()
+        if page.session_data.current_alias:
+            page.session_data.remember_token(page.session_data.current_alias, page.session_data.access_token)
+
+async def make_request(page, url, method="GET", data=None, timeout=10, auth_token=None,flag=True, follow_redirects=True, priority=INTERACTIVE, headers=None):
+    """
+    HTTP request that works in both desktop and web builds.
+    page is anything with a session_data attribute: a Flet page or the CLI context.
+    priority is the scheduler class (interactive, background or bulk) whose slots the request uses.
+    headers are extra request headers.
+    """
+    started = monotonic()
+    with span(f"HTTP {method} {urlsplit(url).path}", **{'http.method': method, 'http.host': urlsplit(url).netloc, 'priority': priority}) as request_span:
+        if flag and page.session_data.token_time and (datetime.now()-page.session_data.token_time).total_seconds()/60 > TOKEN_REFRESH_TIME:
+            await refresh_token(page, priority)
+        # The class slot comes first: a request queued for the small bulk or background pools must
+        # not hold its session's budget, or the session's clicks would queue behind it
+        async with scheduler.slot(priority), page.session_data.inflight_budget():
+            for attempt in range(RATE_LIMIT_RETRIES + 1):
+                await rate_limiter.acquire(page.session_data.rate_bucket, interactive=priority == INTERACTIVE)
+                response = await send_routed(page, url, method, data, timeout, auth_token, follow_redirects, headers)
+                retry_after = rate_limiter.observe(response)
+                # A throttled request was not processed, so it is safe to send again once the limiter allows
+                if retry_after is None or retry_after > MAX_RETRY_AFTER or attempt == RATE_LIMIT_RETRIES:
+                    break
+                request_span.set('ratelimit.retries', attempt + 1)
+        if retry_after is not None:
+            response['body'] = {'detail': f"Too many requests, please try again in {max(1, round(retry_after))} s"}
+        request_span.set('http.status_code', response['status'])
+        log_request(method, url, data, priority, response, monotonic() - started)
+        return response
+
+
+def log_request(method, url, data, priority, response, elapsed):
+    """One log record per request; transport errors and 5xx answers are logged as errors"""
+    status = response['status']
+    fields = {'method': method, 'url': url, 'status': status, 'duration_ms': round(elapsed * 1000, 1), 'priority': priority}
+    if data is not None:
+        fields['payload'] = data  # passwords and tokens are redacted by ditto_logging
+    if status == 0 or status >= 500:
+        body = response['body']
+        fields['detail'] = body.get('detail') if isinstance(body, dict) else body
+        log(ERROR, "request failed", logging.ERROR, **fields)
+    else:
+        log(REQUEST, "request", logging.WARNING if status >= 400 else logging.INFO, **fields)
+
+
+async def send_routed(page, url, method="GET", data=None, timeout=10, auth_token=None, follow_redirects=True, headers=None):
+    """Send to the best API replica, moving GETs to another replica when one can't be reached"""
+    tried = []
+    while True:
+        target, backend = router.route(url, auth_token, exclude=tried)
+        response = await send_timed(page, target, method, data, timeout, auth_token, follow_redirects, headers)
+        if backend is None:
+            return response
+        router.observe(backend, response, auth_token)
+        # Only a GET is safe to resend: a write that timed out may still have been applied
+        if response['status'] != 0 or method != "GET" or len(tried) + 1 >= len(router.backends):
+            return response
+        failovers_total.inc(backend=backend.url)
+        tried.append(backend)
+
+
+async def send_timed(page, url, method="GET", data=None, timeout=10, auth_token=None, follow_redirects=True, headers=None):
+    """
+    Send a request with a timeout derived from the endpoint's recent latencies (timeout is the ceiling),
+    hedging slow idempotent GETs with a second copy once they pass the endpoint's p95.
+    """
+    key = endpoint_key(method, url)
+    timeout = latency.timeout_for(key, timeout)
+    hedge_delay = latency.hedge_delay(key)
+    started = monotonic()
+    if hedge_delay is None:
+        response = await send_request(page, url, method, data, timeout, auth_token, follow_redirects, headers)
+    else:
+        response = await send_hedged(page, url, method, data, timeout, auth_token, follow_redirects, key, hedge_delay, headers)
+    elapsed = monotonic() - started
+    # Fast transport errors (connection refused...) say nothing about the endpoint's latency
+    if response['status'] or elapsed >= timeout:
+        latency.record(key, elapsed)
+    return response
+
+
+async def send_hedged(page, url, method, data, timeout, auth_token, follow_redirects, key, hedge_delay, headers=None):
+    """Start a second copy of the request after hedge_delay and return whichever answers first"""
+    def send():
+        return asyncio.ensure_future(send_request(page, url, method, data, timeout, auth_token, follow_redirects, headers))
+
+    tasks = [send()]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=hedge_delay)
+        if done:
+            return tasks[0].result()
+        latency.hedges_in_flight += 1
+        tasks.append(send())
+        try:
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                # A real answer beats a transport error from the other copy
+                answered = [task for task in tasks if task in done and task.result()['status']]
+                if answered or not pending:
+                    winner = (answered or list(done))[0]
+                    hedges_total.inc(endpoint=key, winner="primary" if winner is tasks[0] else "hedge")
+                    return winner.result()
+        finally:
+            latency.hedges_in_flight -= 1
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def send_request(page, url, method="GET", data=None, timeout=10, auth_token=None, follow_redirects=True, headers=None):
+    """Send one request through the configured transport: a cassette when set, else the network"""
+    def forward():
+        return send_network(page, url, method, data, timeout, auth_token, follow_redirects, headers)
+
+    if transport is not None:
+        return await transport.send(url, method, data, forward)
+    return await forward()
+
+
+async def send_network(page, url, method="GET", data=None, timeout=10, auth_token=None, follow_redirects=True, headers=None):
+    """Send one request with fetch or urllib depending on where Ditto is running"""
+    try:
+        import sys
+        if 'pyodide' in sys.modules:
+            # Running in browser - use JavaScript fetch
+            return await make_request_js(page, url, method, data, auth_token, follow_redirects, headers)
+        else:
+            # Running in desktop - use urllib in a worker thread so the event loop stays responsive
+            return await asyncio.to_thread(make_request_urllib, url, method, data, timeout, auth_token, follow_redirects, headers)
+    except Exception as e:
+        return {
+            'ok': False,
+            'status': 0,
+            'body': {'detail': f'Error: {str(e)}'}
+        }
+
+
+def parse_body(body_text):
+    """Decode a response body, falling back to the raw text for non-JSON replies"""
+    if not body_text:
+        return {}
+    try:
+        return json.loads(body_text)
+    except ValueError:
+        return {'detail': body_text}
+
+
+async def make_request_js(page, url, method="GET", data=None, auth_token=None, follow_redirects=True, extra_headers=None):
+    """Use JavaScript fetch for browser environment"""
+    import js
+    from pyodide.ffi import to_js, JsException
+
+    headers = dict(extra_headers or {}, **{'Content-Type': 'application/json'})
+
+    if auth_token:
+        headers['Authorization'] = f'Bearer {auth_token}'
+
+    options = {
+        'method': method,
+        'headers': headers
+    }
+
+    if data:
+        # The browser negotiates and decodes compressed responses itself; only request bodies need handling
+        body = ditto_http.encode_body(json.dumps(data).encode('utf-8'), headers)
+        options['body'] = to_js(body) if 'Content-Encoding' in headers else body.decode('utf-8')
+
+    if not follow_redirects:
+        options['redirect'] = 'manual'
+
+    try:
+        # Await the fetch promise
+        response = await js.fetch(url, to_js(options))
+
+        # Manual redirects come back opaque, with status 0 and no body
+        if response.type == 'opaqueredirect':
+            return {
+                'ok': False,
+                'status': 302,
+                'body': {}
+            }
+
+        # Await the text promise
+        body_text = await response.text()
+        decoded_size = len(body_text.encode('utf-8'))
+        # Content-Length is the encoded size; fetch hides Content-Encoding from cross-origin callers
+        wire_size = response.headers.get('content-length')
+        ditto_http.body_bytes.inc(decoded_size, direction="received")
+        ditto_http.wire_bytes.inc(int(wire_size) if wire_size else decoded_size, direction="received")
+
+        return {
+            'ok': response.ok,
+            'status': response.status,
+            'body': parse_body(body_text),
+            'headers': {name: response.headers.get(name) for name in RATE_LIMIT_HEADERS + (CACHED_AT_HEADER,) if response.headers.has(name)}
+        }
+    except JsException as e:
+        return {
+            'ok': False,
+            'status': 0,
+            'body': {'detail': f'JS Fetch error: {str(e)}'}
+        }
+    except Exception as e:
+        return {
+            'ok': False,
+            'status': 0,
+            'body': {'detail': f'Error: {str(e)}'}
+        }
+
+
+def make_request_urllib(url, method="GET", data=None, timeout=10, auth_token=None, follow_redirects=True, extra_headers=None):
+    """Desktop implementation over pooled keep-alive connections (see ditto_http)"""
+    try:
+        headers = dict(extra_headers or {})
+        if data:
+            headers['Content-Type'] = 'application/json'
+
+        if auth_token:
+            headers['Authorization'] = f'Bearer {auth_token}'
+
+        if data:
+            data = json.dumps(data).encode('utf-8')
+
+        # A write carrying an idempotency key can be resent if its connection drops
+        idempotent = bool(IDEMPOTENCY_HEADER) and IDEMPOTENCY_HEADER in headers
+        status, reason, response_headers, raw = ditto_http.request(url, method, data, headers, timeout, follow_redirects, idempotent)
+        body = raw.decode('utf-8', errors='replace')
+        ok = 200 <= status < 300
+        return {
+            'ok': ok,
+            'status': status,
+            'body': parse_body(body) if body or ok else {'detail': f"HTTP Error {status}: {reason}"},
+            'headers': response_headers
+        }
+    except Exception as e:
+        return {
+            'ok': False,
+            'status': 0,
+            'body': {'detail': f'Error: {str(e)}'}
+        }
+
+
+def set_base_urls(value):
+    """Point the request layer at one or more comma-separated API base URLs"""
+    global API_BASE_URL, API_BASE_URLS
+    API_BASE_URLS = parse_base_urls(value)
+    API_BASE_URL = API_BASE_URLS[0]
+    router.configure(API_BASE_URLS)
+
+
+async def probe_backend(base_url):
+    return await send_request(None, f"{base_url}/health", timeout=HEALTH_CHECK_TIMEOUT)
+
+
+def start_backend_checks():
+    """Start background health checks of the API replicas on the running event loop"""
+    return router.start_health_checks(probe_backend)
+
+
+router = BackendRouter(API_BASE_URLS)
+
+
+URL_SAFE_CHARS = "/:@!$&'()*+,;=-._~%"
+SCHEME_RE = re.compile(r'^([a-zA-Z][a-zA-Z0-9+.-]*):')
+HOST_LABEL = r'[a-z0-9_]([a-z0-9_-]*[a-z0-9_])?'
+# Characters IDNA 2003 maps away (ß -> ss) but IDNA 2008 keeps, so the two name different hosts
+IDNA_DEVIATIONS = frozenset('\u00df\u03c2\u200c\u200d')
+HOST_RE = re.compile(rf'^{HOST_LABEL}(\.{HOST_LABEL})*\.?$')
+
+
+def encode_url_part(part, extra_safe="", unsafe=""):
+    """Percent-encode a URL component without double-encoding existing escapes"""
+    part = re.sub(r'%(?![0-9A-Fa-f]{2})', '%25', part)
+    safe = "".join(c for c in URL_SAFE_CHARS + extra_safe if c not in unsafe)
+    return quote(part, safe=safe)
+
+
+def normalize_url(raw):
+    """
+    Normalize a user-entered target URL before it is sent to the API.
+    Returns (url, None) on success or (None, error message) when the input can't be a valid link.
+    """
+    url = (raw or "").strip()
+    if not url:
+        return None, "Please enter a URL"
+
+    if '://' not in url:
+        match = SCHEME_RE.match(url)
+        # "example.com:8080/x" is a host and port, "mailto:x" is a scheme
+        if match and not url[match.end():match.end() + 1].isdigit():
+            return None, f"Unsupported URL scheme '{match.group(1)}'"
+        url = "https:" + url if url.startswith('//') else "https://" + url
+
+    try:
+        parts = urlsplit(url)
+        port = parts.port
+    except ValueError:
+        return None, "Invalid URL"
+
+    if parts.scheme.lower() not in ('http', 'https'):
+        return None, "Only http and https URLs are supported"
+
+    host = parts.hostname
+    if not host:
+        return None, "URL must include a host name"
+    if ':' in host:
+        # IPv6 literal
+        host = f"[{host}]"
+    else:
+        if IDNA_DEVIATIONS.intersection(host):
+            # The stdlib codec is IDNA 2003 and would send the link to a different host
+            return None, "Host names containing ß, ς or zero-width joiners are not supported"
+        try:
+            host = host.encode('idna').decode('ascii')
+        except UnicodeError:
+            return None, "Invalid host name"
+        if not HOST_RE.match(host) or ('.' not in host and host != 'localhost'):
+            return None, "Invalid host name"
+
+    netloc = host if port is None else f"{host}:{port}"
+    userinfo = parts.netloc.rpartition('@')[0]
+    if userinfo:
+        user, colon, password = userinfo.partition(':')
+        userinfo = encode_url_part(user, unsafe=":@") + colon + encode_url_part(password, unsafe=":@")
+        netloc = f"{userinfo}@{netloc}"
+
+    url = urlunsplit((
+        parts.scheme.lower(),
+        netloc,
+        encode_url_part(parts.path) or '/',
+        encode_url_part(parts.query, "?/"),
+        encode_url_part(parts.fragment, "?/#"),
+    ))
+    if len(url) > MAX_URL_LENGTH:
+        return None, f"URL is too long (max {MAX_URL_LENGTH} characters)"
+    return url, None
+
+
+class LRUCache:
+    """Bounded least-recently-used cache with per-entry expiry"""
+    def __init__(self, maxsize, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+
+    def get(self, key, default=None):
+        entry = self.entries.get(key)
+        if entry is None:
+            return default
+        value, stored_at = entry
+        if self.ttl is not None and monotonic() - stored_at > self.ttl:
+            del self.entries[key]
+            return default
+        self.entries.move_to_end(key)
+        return value
+
+    def set(self, key, value):
+        self.entries[key] = (value, monotonic())
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self.entries)
+
+
+# Shared across sessions: whether an alias is taken is the same for every user
+alias_cache = LRUCache(ALIAS_CACHE_SIZE, ALIAS_CACHE_TTL)
+
+
+async def check_alias_available(page, alias):
+    """
+    Log in to alias with a random password: 404 means it is free, 401 that it is taken.
+    The short link itself is never requested, as following it counts as a visit.
+    Returns True if the alias is free, False if taken, None if unknown.
+    """
+    import secrets
+
+    cached = alias_cache.get(alias)
+    if cached is not None:
+        return cached
+    response = await make_request(
+        page,
+        f"{API_BASE_URL}/login",
+        method="POST",
+        data={'url_code': alias, 'url_pass': secrets.token_urlsafe(16)},
+        timeout=5,
+        flag=False,
+        priority=BACKGROUND
+    )
+    status = response['status']
+    if status == 404:
+        available = True
+    elif status in (200, 401):
+        available = False
+    else:
+        return None
+    alias_cache.set(alias, available)
+    return available
+
+
+async def fetch_alias_details(page):
+    """GET /details for the session's current alias"""
+    return await make_request(
+        page,
+        f"{API_BASE_URL}/details",
+        method="GET",
+        auth_token=page.session_data.access_token
+    )
+
+
+def suggest_aliases(alias, count=6):
+    """Generate free-looking variants of a taken alias locally"""
+    import secrets
+
+    base = alias.rstrip('-_0123456789') or alias
+    candidates = [
+        f"{alias}{n}" for n in range(1, 3)
+    ] + [
+        f"{base}-{datetime.now().year}",
+        f"{base}-{secrets.token_hex(2)}",
+        f"my-{base}",
+        f"{base}-link",
+    ]
+    suggestions = []
+    for candidate in candidates:
+        if candidate != alias and candidate not in suggestions and alias_cache.get(candidate) is not False:
+            suggestions.append(candidate)
+    return suggestions[:count]
+
+
+async def find_free_aliases(page, alias, limit=ALIAS_SUGGESTION_COUNT):
+    """Check suggested variants in parallel and keep the free ones"""
+    candidates = suggest_aliases(alias)
+    results = await asyncio.gather(*(check_alias_available(page, c) for c in candidates))
+    return [c for c, available in zip(candidates, results) if available][:limit]
+
+
+BULK_ACTIONS = {
+    # action -> (label, method, endpoint)
+    'pause': ("Pause", "PATCH", "/pause"),
+    'resume': ("Resume", "PATCH", "/resume"),
+    'reset_hits': ("Reset Hits", "PATCH", "/reset_hits"),
+    'delete': ("Delete", "DELETE", "/delete"),
+}
+
+
+async def alias_token(page, alias, priority=BULK):
+    """The token of one of the session's logged-in aliases, refreshed first when due; None if not logged in"""
+    entry = page.session_data.alias_tokens.get(alias)
+    if entry is None:
+        return None
+    access_token, token_time = entry
+    if (datetime.now() - token_time).total_seconds()/60 > TOKEN_REFRESH_TIME:
+        response = await make_request(
+            page,
+            f"{API_BASE_URL}/refresh_token",
+            method="GET",
+            auth_token=access_token,
+            flag=False,
+            priority=priority
+        )
+        if response['ok']:
+            access_token = response['body'].get("access_token")
+            page.session_data.remember_token(alias, access_token)
+    return access_token
+
+
+async def alias_request(page, alias, endpoint, method="GET", priority=BULK):
+    """
+    Request on behalf of one of the session's logged-in aliases, refreshing its token when due.
+    Used for bulk actions and exports, so it runs in the bulk priority class by default.
+    """
+    access_token = await alias_token(page, alias, priority)
+    if access_token is None:
+        return {
+            'ok': False,
+            'status': 401,
+            'body': {'detail': 'Not logged in'}
+        }
+    return await make_request(
+        page,
+        f"{API_BASE_URL}{endpoint}",
+        method=method,
+        auth_token=access_token,
+        flag=False,
+        priority=priority
+    )
+
+
+async def run_bulk(items, worker, concurrency=BULK_CONCURRENCY, on_progress=None):
+    """
+    Run worker(item) for every item on a bounded pool of worker tasks.
+    Returns (succeeded, failed) where failed maps each failed item to its error detail.
+    """
+    items = list(items)
+    pending = iter(items)
+    succeeded, failed = [], {}
+
+    async def run_worker():
+        # Workers share one iterator, so each item is handled exactly once
+        for item in pending:
+            try:
+                response = await worker(item)
+            except Exception as ex:
+                response = {'ok': False, 'status': 0, 'body': {'detail': f'Error: {str(ex)}'}}
+            if response['ok']:
+                succeeded.append(item)
+            else:
+                failed[item] = str(response['body'].get("detail", "Request failed"))
+            if on_progress:
+                on_progress(len(succeeded) + len(failed), len(items), item, response)
+
+    await asyncio.gather(*(run_worker() for _ in range(min(concurrency, len(items)))))
+    return succeeded, failed
+
+
+def load_export_state(state_path):
+    try:
+        with open(state_path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def export_rows(path, fmt):
+    """Data rows in an export file, or None when it can't be read"""
+    import csv
+
+    try:
+        with open(path, newline='', encoding='utf-8') as f:
+            if fmt == "csv":
+                return max(0, sum(1 for _ in csv.reader(f)) - 1)
+            return sum(1 for line in f if line.strip())
+    except (OSError, ValueError):
+        return None
+
+
+def export_intact(path, fmt, state):
+    """Whether the export at path is still the one state was saved for"""
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return False
+    return state.get('format') == fmt and state.get('mtime') == mtime and state.get('rows') == export_rows(path, fmt)
+
+
+def save_export_state(state_path, state):
+    tmp_path = f"{state_path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, state_path)
+
+
+async def export_alias_stats(page, aliases, path, fmt="csv", incremental=False, on_progress=None):
+    """
+    Fetch /details for the aliases concurrently and stream one row per alias straight to path.
+    Rows are written as they arrive, so memory stays flat however many aliases are exported.
+    With incremental=True only aliases whose stats changed since the last export are appended,
+    unless the file is missing or was changed since then, which makes it a full export.
+    Returns (rows written, failed aliases).
+    """
+    import csv
+    import hashlib
+
+    # Kept next to the export: its format, data rows and mtime, and alias -> fingerprint of the last exported row
+    state_path = f"{path}.state.json"
+    state = load_export_state(state_path)
+    append = incremental and export_intact(path, fmt, state)
+    # A full export starts over, so an alias that fails this time is exported again next time
+    fingerprints = state.get('fingerprints', {}) if append else {}
+    rows = state['rows'] if append else 0
+    written = 0
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, 'a' if append else 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=EXPORT_FIELDS) if fmt == "csv" else None
+        if writer and not append:
+            writer.writeheader()
+
+        async def export_one(alias):
+            nonlocal written
+            response = await alias_request(page, alias, "/details")
+            if not response['ok']:
+                return response
+            row = AliasDetails.from_api(response['body'].get("data", {}), alias).to_row()
+            fingerprint = hashlib.sha1(json.dumps(row, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+            if fingerprints.get(alias) != fingerprint:
+                if writer:
+                    writer.writerow(row)
+                else:
+                    f.write(json.dumps(row) + "\n")
+                written += 1
+            fingerprints[alias] = fingerprint
+            return {'ok': True, 'status': response['status'], 'body': {}}
+
+        succeeded, failed = await run_bulk(aliases, export_one, on_progress=on_progress)
+
+    save_export_state(state_path, {'format': fmt, 'rows': rows + written, 'mtime': os.stat(path).st_mtime_ns, 'fingerprints': fingerprints})
+    return written, failed
@@ -0,0 +1,152 @@
+"""
+Routing across several replicas of the Short-URL API.
+
+DITTO_API_BASE_URL may list several base URLs separated by commas. Requests built on the
+first one are sent to the fastest healthy replica instead, as measured by background
+/health checks. Requests carrying a token stay on the replica that issued it. A replica
+that fails FAILURE_THRESHOLD requests in a row has its circuit opened for OPEN_SECONDS,
+then gets traffic again half-open until a request succeeds or fails.
+"""
+import asyncio
+import os
+from collections import OrderedDict
+from time import monotonic
+
+import ditto_metrics
+
+FAILURE_THRESHOLD = 3
+OPEN_SECONDS = 30
+HEALTH_INTERVAL = float(os.environ.get("DITTO_HEALTH_INTERVAL", "15"))  # seconds between background checks, 0 disables
+LATENCY_SMOOTHING = 0.3  # weight of the newest health-check latency in the moving average
+STICKY_TOKENS = 10000
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+circuit_state = ditto_metrics.gauge("ditto_backend_circuit_state", "Circuit state per backend: 0 closed, 1 half-open, 2 open")
+backend_latency = ditto_metrics.gauge("ditto_backend_latency_seconds", "Smoothed /health latency per backend")
+failovers_total = ditto_metrics.counter("ditto_backend_failovers_total", "Requests retried on another backend after a transport error")
+
+
+def parse_base_urls(value):
+    return [url.strip().rstrip("/") for url in (value or "").split(",") if url.strip()]
+
+
+class Backend:
+    def __init__(self, url):
+        self.url = url
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.latency = None
+        circuit_state.set(0, backend=url)
+
+    def set_state(self, state):
+        self.state = state
+        circuit_state.set(STATE_VALUES[state], backend=self.url)
+
+    def available(self, now):
+        if self.state == OPEN and now - self.opened_at >= OPEN_SECONDS:
+            self.set_state(HALF_OPEN)
+        return self.state != OPEN
+
+    def succeeded(self):
+        self.failures = 0
+        if self.state != CLOSED:
+            self.set_state(CLOSED)
+
+    def failed(self, now):
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= FAILURE_THRESHOLD:
+            self.opened_at = now
+            self.set_state(OPEN)
+
+    def observe_latency(self, seconds):
+        self.latency = seconds if self.latency is None else (1 - LATENCY_SMOOTHING) * self.latency + LATENCY_SMOOTHING * seconds
+        backend_latency.set(round(self.latency, 4), backend=self.url)
+
+
+class BackendRouter:
+    def __init__(self, urls):
+        self.backends = []
+        self.configure(urls)
+        self.health_task = None
+
+    def configure(self, urls):
+        for backend in self.backends:
+            circuit_state.remove(backend=backend.url)
+            backend_latency.remove(backend=backend.url)
+        self.backends = [Backend(url) for url in urls]
+        self.primary = urls[0] if urls else None
+        self.tokens = OrderedDict()  # access token -> Backend that issued it
+
+    def choose(self, auth_token=None, exclude=()):
+        now = monotonic()
+        available = [b for b in self.backends if b not in exclude and b.available(now)]
+        sticky = self.tokens.get(auth_token) if auth_token else None
+        if sticky in available:
+            return sticky
+        if available:
+            order = {b: i for i, b in enumerate(self.backends)}
+            return min(available, key=lambda b: (b.state != CLOSED, b.latency if b.latency is not None else float('inf'), order[b]))
+        remaining = [b for b in self.backends if b not in exclude]
+        # Every circuit is open: try the replica that has been resting longest
+        return min(remaining, key=lambda b: b.opened_at) if remaining else None
+
+    def route(self, url, auth_token=None, exclude=()):
+        """Return (url rewritten to the chosen backend, backend), or (url, None) if url isn't an API call"""
+        if len(self.backends) < 2 or not url.startswith(self.primary):
+            return url, None
+        backend = self.choose(auth_token, exclude)
+        if backend is None:
+            return url, None
+        return backend.url + url[len(self.primary):], backend
+
+    def bind_token(self, auth_token, backend):
+        self.tokens[auth_token] = backend
+        self.tokens.move_to_end(auth_token)
+        while len(self.tokens) > STICKY_TOKENS:
+            self.tokens.popitem(last=False)
+
+    def observe(self, backend, response, auth_token=None):
+        if response['status'] == 0 or response['status'] >= 500:
+            backend.failed(monotonic())
+            return
+        backend.succeeded()
+        if response['ok']:
+            if auth_token:
+                self.bind_token(auth_token, backend)
+            body = response['body']
+            if isinstance(body, dict) and body.get("access_token"):
+                self.bind_token(body["access_token"], backend)
+
+    async def check(self, probe):
+        """Probe every backend's /health once; probe(url) returns a response dict"""
+        async def check_one(backend):
+            started = monotonic()
+            response = await probe(backend.url)
+            if response['ok']:
+                backend.observe_latency(monotonic() - started)
+                backend.succeeded()
+            else:
+                backend.failed(monotonic())
+
+        await asyncio.gather(*(check_one(b) for b in self.backends))
+
+    def start_health_checks(self, probe, interval=HEALTH_INTERVAL):
+        """Run check() every interval seconds on the running event loop, once per process"""
+        if len(self.backends) < 2 or interval <= 0:
+            return None
+        if self.health_task is not None and not self.health_task.done():
+            return self.health_task
+
+        async def loop():
+            while True:
+                await self.check(probe)
+                await asyncio.sleep(interval)
+
+        self.health_task = asyncio.get_running_loop().create_task(loop())
+        return self.health_task
+
+    def stats(self):
+        return [{'url': b.url, 'state': b.state, 'latency': b.latency, 'failures': b.failures} for b in self.backends]
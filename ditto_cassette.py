@@ -0,0 +1,103 @@
+"""
+Record/replay transport for make_request, for repeatable offline tests and benchmarks.
+
+    DITTO_CASSETTE=flows.jsonl DITTO_CASSETTE_MODE=record python ditto.py
+    DITTO_CASSETTE=flows.jsonl DITTO_CASSETTE_MODE=replay DITTO_REPLAY_SPEED=0 python ditto.py
+
+Recording overwrites the cassette with one JSON line per exchange. Replay matches each
+request on method, path, query and a hash of its body, falling back to the endpoint
+(method and path, with aliases collapsed) so randomly suggested aliases still replay,
+and waits the recorded latency times DITTO_REPLAY_SPEED (1 as recorded, 0 instant).
+Authorization headers are never written; response bodies are, tokens included.
+"""
+import asyncio
+import copy
+import hashlib
+import json
+import os
+from time import monotonic
+from urllib.parse import urlsplit
+
+from ditto_latency import endpoint_key
+
+
+def body_hash(data):
+    if not data:
+        return None
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+
+def request_path(url):
+    parts = urlsplit(url)
+    return parts.path + (f"?{parts.query}" if parts.query else "")
+
+
+class Cassette:
+    def __init__(self, path, mode="replay", speed=1.0):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown cassette mode '{mode}'")
+        self.path = path
+        self.mode = mode
+        self.speed = speed
+        self.exact = {}  # (method, path, body hash) -> [entries]
+        self.loose = {}  # endpoint key -> [entries]
+        self.cursors = {}
+        if mode == "record":
+            open(path, 'w', encoding='utf-8').close()
+        else:
+            self.load()
+
+    def load(self):
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self.exact.setdefault((entry['method'], entry['path'], entry['body_hash']), []).append(entry)
+                    self.loose.setdefault(entry['endpoint'], []).append(entry)
+
+    def next_entry(self, table, key):
+        """Entries for a key are replayed in recorded order; the last one repeats once they run out"""
+        entries = table.get(key)
+        if not entries:
+            return None
+        cursor = self.cursors.get((id(table), key), 0)
+        self.cursors[(id(table), key)] = cursor + 1
+        return entries[min(cursor, len(entries) - 1)]
+
+    async def send(self, url, method, data, forward):
+        """forward() performs the real request; it is only called when recording"""
+        if self.mode == "record":
+            started = monotonic()
+            response = await forward()
+            self.write({
+                'method': method,
+                'path': request_path(url),
+                'body_hash': body_hash(data),
+                'endpoint': endpoint_key(method, url),
+                'latency': round(monotonic() - started, 4),
+                'response': response,
+            })
+            return response
+
+        entry = (self.next_entry(self.exact, (method, request_path(url), body_hash(data)))
+                 or self.next_entry(self.loose, endpoint_key(method, url)))
+        if entry is None:
+            return {
+                'ok': False,
+                'status': 0,
+                'body': {'detail': f'No recorded response for {method} {request_path(url)}'}
+            }
+        if self.speed > 0 and entry['latency']:
+            await asyncio.sleep(entry['latency'] * self.speed)
+        return copy.deepcopy(entry['response'])
+
+    def write(self, entry):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry) + "\n")
+
+
+def from_environment():
+    path = os.environ.get("DITTO_CASSETTE")
+    if not path:
+        return None
+    return Cassette(path, os.environ.get("DITTO_CASSETTE_MODE", "replay"), float(os.environ.get("DITTO_REPLAY_SPEED", "1")))
@@ -0,0 +1,313 @@
+"""
+Command-line client for the Short-URL API.
+
+    python ditto_cli.py create https://example.com promo --password secret
+    python ditto_cli.py login promo --password secret
+    python ditto_cli.py pause promo summer-sale
+    python ditto_cli.py bulk resume --all
+    python ditto_cli.py qr promo summer-sale --output-dir qr
+    printf 'details promo\ndetails summer-sale\n' | python ditto_cli.py pipe
+
+Reuses the request layer in ditto_api and never imports Flet, so it starts fast and
+opens no browser. Tokens from `login` are kept in ~/.ditto/tokens.json for later commands.
+The request layer, and the asyncio, logging and tracing it brings, are imported by the
+commands that use them, so --help and usage errors return without loading any of it.
+"""
+import argparse
+import json
+import os
+import sys
+
+TOKEN_FILE = os.path.join(os.path.expanduser("~"), ".ditto", "tokens.json")
+
+# command -> (bulk action, help) for the per-alias management commands
+ALIAS_COMMANDS = {
+    'pause': ('pause', "pause aliases"),
+    'resume': ('resume', "resume aliases"),
+    'reset': ('reset_hits', "reset the hit count of aliases"),
+    'delete': ('delete', "delete aliases"),
+}
+
+
+class CliContext:
+    """Stands in for the Flet page: the request layer only needs session_data"""
+    def __init__(self, token_file, as_json=False, concurrency=None):
+        from ditto_api import BULK_CONCURRENCY, SessionData
+        concurrency = concurrency or BULK_CONCURRENCY
+        self.token_file = token_file
+        self.as_json = as_json
+        self.concurrency = concurrency
+        self.session_data = SessionData()
+        self.failures = 0
+        self.load_tokens()
+        self.saved_tokens = dict(self.session_data.alias_tokens)
+
+    def load_tokens(self):
+        from datetime import datetime
+        try:
+            with open(self.token_file, encoding='utf-8') as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return
+        for alias, (access_token, token_time) in saved.items():
+            self.session_data.alias_tokens[alias] = (access_token, datetime.fromisoformat(token_time))
+
+    def save_tokens(self):
+        if self.session_data.alias_tokens == self.saved_tokens:
+            return
+        saved = {
+            alias: [access_token, token_time.isoformat()]
+            for alias, (access_token, token_time) in self.session_data.alias_tokens.items()
+        }
+        os.makedirs(os.path.dirname(self.token_file) or ".", exist_ok=True)
+        tmp_path = f"{self.token_file}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(saved, f)
+        os.chmod(tmp_path, 0o600)
+        os.replace(tmp_path, self.token_file)
+        self.saved_tokens = dict(self.session_data.alias_tokens)
+
+    def emit(self, command, response, alias=None, **extra):
+        """Print one result line as soon as it is known"""
+        body = response['body'] if isinstance(response['body'], dict) else {'detail': response['body']}
+        result = {'command': command, 'ok': response['ok'], 'status': response['status']}
+        if alias is not None:
+            result['alias'] = alias
+        result.update(extra)
+        if not response['ok']:
+            self.failures += 1
+            result['detail'] = str(body.get("detail", "Request failed"))
+        elif 'data' in body:
+            result['data'] = body['data']
+
+        if self.as_json:
+            print(json.dumps(result), flush=True)
+            return
+        label = f"{command} {alias}" if alias is not None else command
+        if not response['ok']:
+            print(f"FAIL {label}: {result['detail']}", flush=True)
+        elif 'data' in result:
+            data = result['data']
+            state = "active" if data.get("url_state", False) else "paused"
+            print(f"ok   {label}: {data.get('url', '')} hits={data.get('url_hits', 0)} {state} created={data.get('url_created_at', '')}", flush=True)
+        else:
+            details = " ".join(f"{key}={value}" for key, value in extra.items())
+            print(f"ok   {label} {details}".rstrip(), flush=True)
+
+
+def local_error(detail):
+    return {'ok': False, 'status': 0, 'body': {'detail': detail}}
+
+
+async def cmd_health(ctx, args):
+    import ditto_api
+    from ditto_api import make_request
+    response = await make_request(ctx, f"{ditto_api.API_BASE_URL}/health", timeout=10, flag=False)
+    ctx.emit("health", response)
+
+
+async def cmd_create(ctx, args):
+    from ditto_api import create_alias, normalize_url
+    from ditto_history import LinkHistory
+    target_url, url_error = normalize_url(args.url)
+    if url_error:
+        ctx.emit("create", local_error(url_error), alias=args.alias)
+        return
+    response = await create_alias(ctx, target_url, args.alias, args.password or "", flag=False)
+    if response['ok']:
+        short_url = response['body'].get("short_url", "")
+        LinkHistory().add(target_url, args.alias, short_url)
+        ctx.emit("create", response, alias=args.alias, short_url=short_url)
+    else:
+        ctx.emit("create", response, alias=args.alias)
+
+
+async def cmd_login(ctx, args):
+    from ditto_api import login_alias
+    password = args.password
+    if password is None and not args.piped and sys.stdin.isatty():
+        import getpass
+        password = getpass.getpass(f"Password for {args.alias}: ")
+    response = await login_alias(ctx, args.alias, password or "", flag=False)
+    if response['ok']:
+        ctx.session_data.remember_token(args.alias, response['body'].get("access_token"))
+    ctx.emit("login", response, alias=args.alias)
+
+
+async def run_on_aliases(ctx, command, aliases, endpoint, method):
+    """Run one endpoint for many aliases on the bulk worker pool, printing results as they land"""
+    from ditto_api import alias_request, run_bulk
+    if not aliases:
+        ctx.emit(command, local_error("No aliases given"))
+        return
+
+    async def worker(alias):
+        response = await alias_request(ctx, alias, endpoint, method)
+        if response['ok'] and endpoint == "/delete":
+            ctx.session_data.forget_alias(alias)
+        ctx.emit(command, response, alias=alias)
+        return response
+
+    await run_bulk(aliases, worker, concurrency=ctx.concurrency)
+
+
+def resolve_aliases(ctx, args):
+    if getattr(args, 'all', False):
+        return sorted(ctx.session_data.alias_tokens)
+    return args.aliases
+
+
+async def cmd_details(ctx, args):
+    await run_on_aliases(ctx, "details", resolve_aliases(ctx, args), "/details", "GET")
+
+
+async def cmd_alias_action(ctx, args):
+    from ditto_api import BULK_ACTIONS
+    label, method, endpoint = BULK_ACTIONS[ALIAS_COMMANDS[args.command][0]]
+    await run_on_aliases(ctx, args.command, args.aliases, endpoint, method)
+
+
+async def cmd_bulk(ctx, args):
+    from ditto_api import BULK_ACTIONS
+    label, method, endpoint = BULK_ACTIONS[args.action]
+    await run_on_aliases(ctx, args.action, resolve_aliases(ctx, args), endpoint, method)
+
+
+async def cmd_qr(ctx, args):
+    """
+    Write a PNG QR code of each alias's short link; encoded locally, no API calls. The link is
+    the one the API returned when the alias was created here, else one on DITTO_SHORT_URL_BASE.
+    """
+    from urllib.parse import quote
+
+    import ditto_api
+    from ditto_history import LinkHistory
+    from ditto_qr import DEFAULT_SCALE, qr_png
+    aliases = resolve_aliases(ctx, args)
+    if not aliases:
+        ctx.emit("qr", local_error("No aliases given"))
+        return
+    history = LinkHistory()
+    for alias in aliases:
+        created = next((entry['short_url'] for entry in history.search(alias) if entry['alias'] == alias and entry.get('short_url')), "")
+        short_url = created or ditto_api.short_url_for(alias)
+        if not short_url:
+            ctx.emit("qr", local_error("Short link unknown: the alias wasn't created here and DITTO_SHORT_URL_BASE is not set"), alias=alias)
+            continue
+        path = os.path.join(args.output_dir, f"{quote(alias, safe='')}.png")
+        try:
+            os.makedirs(args.output_dir, exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(qr_png(short_url, scale=args.scale or DEFAULT_SCALE))
+        except (OSError, ValueError) as ex:
+            ctx.emit("qr", local_error(str(ex)), alias=alias)
+            continue
+        ctx.emit("qr", {'ok': True, 'status': 0, 'body': {}}, alias=alias, path=path)
+
+
+async def cmd_pipe(ctx, args):
+    """Read one command per line from stdin and run them concurrently"""
+    import shlex
+
+    from ditto_api import run_bulk
+    parser = build_parser(piped=True)
+    commands = []
+    for line_number, line in enumerate(sys.stdin, start=1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        try:
+            line_args = parser.parse_args(shlex.split(line))
+        except (SystemExit, ValueError):
+            ctx.emit("pipe", local_error(f"Invalid command on line {line_number}: {line}"))
+            continue
+        line_args.piped = True
+        commands.append(line_args)
+
+    async def worker(line_args):
+        await line_args.handler(ctx, line_args)
+        return {'ok': True, 'status': 0, 'body': {}}
+
+    await run_bulk(commands, worker, concurrency=ctx.concurrency)
+
+
+def build_parser(piped=False):
+    parser = argparse.ArgumentParser(
+        prog="ditto",
+        description="Create and manage Short-URL aliases from the command line.",
+    )
+    if not piped:
+        parser.add_argument("--base-url", help="Short-URL API base URL, or several replicas separated by commas (default: DITTO_API_BASE_URL)")
+        parser.add_argument("--json", action="store_true", help="print one JSON object per result")
+        parser.add_argument("--token-file", default=TOKEN_FILE, help="where login tokens are stored")
+        parser.add_argument("--concurrency", type=int, help="parallel requests for bulk and pipe (default 8)")
+        parser.add_argument("--metrics", action="store_true", help="print request metrics to stderr when done")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    health = commands.add_parser("health", help="check the API is up")
+    health.set_defaults(handler=cmd_health)
+
+    create = commands.add_parser("create", help="shorten a URL")
+    create.add_argument("url")
+    create.add_argument("alias")
+    create.add_argument("--password", default="", help="leave empty for password-less")
+    create.set_defaults(handler=cmd_create)
+
+    login = commands.add_parser("login", help="log in to an alias and keep its token")
+    login.add_argument("alias")
+    login.add_argument("--password")
+    login.set_defaults(handler=cmd_login)
+
+    details = commands.add_parser("details", help="show alias stats")
+    details.add_argument("aliases", nargs="*")
+    details.add_argument("--all", action="store_true", help="every logged-in alias")
+    details.set_defaults(handler=cmd_details)
+
+    for command, (_, command_help) in ALIAS_COMMANDS.items():
+        action = commands.add_parser(command, help=command_help)
+        action.add_argument("aliases", nargs="+")
+        action.set_defaults(handler=cmd_alias_action)
+
+    bulk = commands.add_parser("bulk", help="run an action across many aliases")
+    bulk.add_argument("action", choices=sorted(action for action, _ in ALIAS_COMMANDS.values()))
+    bulk.add_argument("aliases", nargs="*")
+    bulk.add_argument("--all", action="store_true", help="every logged-in alias")
+    bulk.set_defaults(handler=cmd_bulk)
+
+    qr = commands.add_parser("qr", help="save QR codes of short links as PNG")
+    qr.add_argument("aliases", nargs="*")
+    qr.add_argument("--all", action="store_true", help="every logged-in alias")
+    qr.add_argument("--output-dir", default="qr", help="directory the PNG files are written to")
+    qr.add_argument("--scale", type=int, help="pixels per QR module (default 8)")
+    qr.set_defaults(handler=cmd_qr)
+
+    if not piped:
+        pipe = commands.add_parser("pipe", help="run commands read from stdin concurrently")
+        pipe.set_defaults(handler=cmd_pipe)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    args.piped = False
+    import asyncio
+
+    import ditto_api
+    if args.base_url:
+        ditto_api.set_base_urls(args.base_url)
+    ctx = CliContext(args.token_file, as_json=args.json, concurrency=max(1, args.concurrency) if args.concurrency else None)
+    try:
+        asyncio.run(args.handler(ctx, args))
+    except KeyboardInterrupt:
+        return 130
+    finally:
+        ctx.save_tokens()
+        if args.metrics:
+            import ditto_metrics
+            print(json.dumps(ditto_metrics.snapshot(), indent=2), file=sys.stderr)
+    return 1 if ctx.failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
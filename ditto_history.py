@@ -0,0 +1,128 @@
+"""
+History of the short links created by a user, kept in an append-only JSONL file.
+
+The command line keeps its history in DITTO_HISTORY_FILE (default ~/.ditto/history.jsonl).
+The app serves many browsers, so each gets its own file in DITTO_HISTORY_DIR (default
+~/.ditto/history), named by a random id the browser keeps in its client storage; no
+browser can read another's links. DITTO_HISTORY_DIR=off keeps histories in memory only,
+for the session.
+
+A history file gets one line per created link and is never rewritten. It is only read
+the first time the history is shown or searched; creating a link before then just
+appends its line, and afterwards the in-memory copy is kept up to date as well.
+
+Search matches the start of an alias or of a target URL, with or without its scheme and
+"www.", through sorted in-memory indexes searched with bisect.
+"""
+import bisect
+import json
+import os
+import re
+import secrets
+from collections import OrderedDict
+from datetime import datetime
+
+HISTORY_FILE = os.environ.get("DITTO_HISTORY_FILE", os.path.join(os.path.expanduser("~"), ".ditto", "history.jsonl"))
+HISTORY_DIR = os.environ.get("DITTO_HISTORY_DIR", os.path.join(os.path.expanduser("~"), ".ditto", "history"))
+OPEN_HISTORIES = 256  # per-user histories kept loaded, shared by a browser's tabs
+URL_PREFIX_RE = re.compile(r'^[a-z][a-z0-9+.-]*://(www\.)?')
+USER_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+
+
+def index_keys(entry):
+    """Lower-cased strings a search prefix is matched against"""
+    alias = entry.get('alias', "").lower()
+    url = entry.get('url', "").lower()
+    keys = {alias, url, URL_PREFIX_RE.sub("", url)}
+    keys.discard("")
+    return keys
+
+
+class LinkHistory:
+    def __init__(self, path=HISTORY_FILE):
+        self.path = path  # None keeps the history in memory only
+        self.entries = None if path is not None else []  # oldest first; None until loaded
+        self.index = []  # sorted (key, entry position)
+
+    def load(self):
+        if self.entries is not None:
+            return
+        self.entries = []
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # a line cut short by a crash
+                    if isinstance(entry, dict):
+                        self.entries.append(entry)
+        except OSError:
+            pass
+        self.index = sorted((key, position) for position, entry in enumerate(self.entries) for key in index_keys(entry))
+
+    def add(self, url, alias, short_url):
+        entry = {'url': url, 'alias': alias, 'short_url': short_url, 'created': datetime.now().isoformat(timespec='seconds')}
+        if self.path is not None:
+            try:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(entry) + "\n")
+            except OSError:
+                # Losing a history line must not fail the create that just succeeded
+                pass
+        if self.entries is None:
+            return entry  # picked up from the file when the history is first read
+        position = len(self.entries)
+        self.entries.append(entry)
+        for key in index_keys(entry):
+            bisect.insort(self.index, (key, position))
+        return entry
+
+    def __len__(self):
+        self.load()
+        return len(self.entries)
+
+    def search(self, prefix):
+        """Every entry with an alias or target URL starting with prefix, newest first"""
+        self.load()
+        prefix = prefix.strip().lower()
+        if not prefix:
+            return list(reversed(self.entries))
+        positions = set()
+        i = bisect.bisect_left(self.index, (prefix,))
+        while i < len(self.index) and self.index[i][0].startswith(prefix):
+            positions.add(self.index[i][1])
+            i += 1
+        return [self.entries[position] for position in sorted(positions, reverse=True)]
+
+
+def new_user_id():
+    return secrets.token_hex(16)
+
+
+def valid_user_id(user_id):
+    # The id comes from the browser, so it must never be able to name another file
+    return isinstance(user_id, str) and USER_ID_RE.match(user_id) is not None
+
+
+open_histories = OrderedDict()  # user id -> LinkHistory
+
+
+def stored():
+    """False with DITTO_HISTORY_DIR=off, when histories only last for the session"""
+    return HISTORY_DIR not in ("", "off", os.devnull)
+
+
+def history_for(user_id):
+    """The history of the browser holding user_id, or a new in-memory one without a usable id"""
+    if not valid_user_id(user_id) or not stored():
+        return LinkHistory(None)
+    history = open_histories.get(user_id)
+    if history is None:
+        history = open_histories[user_id] = LinkHistory(os.path.join(HISTORY_DIR, f"{user_id}.jsonl"))
+        while len(open_histories) > OPEN_HISTORIES:
+            open_histories.popitem(last=False)
+    else:
+        open_histories.move_to_end(user_id)
+    return history
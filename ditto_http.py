@@ -0,0 +1,366 @@
+"""
+Keep-alive HTTP transport for the desktop build.
+
+Connections are pooled per host and reused, so only the first call to the API pays for
+TCP and TLS setup, and host names go through a process-wide DNS cache (DITTO_DNS_TTL
+seconds, 0 disables it). With DITTO_WARMUP=1 the API host is resolved and connected to
+in the background as soon as the process starts. Requests through a configured proxy
+fall back to urllib.
+
+Responses are requested with Accept-Encoding: gzip, deflate and decompressed as they are
+read. Request bodies of at least DITTO_COMPRESS_REQUESTS bytes are sent gzipped (0, the
+default, leaves them alone, as not every backend accepts compressed bodies).
+"""
+import functools
+import os
+import select
+import socket
+import sys
+import threading
+import time
+import zlib
+from urllib.parse import urljoin, urlsplit
+
+import ditto_metrics
+from ditto_logging import log_error
+
+DNS_TTL = float(os.environ.get("DITTO_DNS_TTL", "300"))
+WARMUP_ENABLED = os.environ.get("DITTO_WARMUP", "") not in ("", "0", "off")
+POOL_SIZE = 8  # idle connections kept per host
+POOL_IDLE_TIMEOUT = 30  # seconds an idle connection is trusted before it is dropped instead of reused
+MAX_REDIRECTS = 5
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+IDEMPOTENT_METHODS = ("GET", "HEAD", "PUT", "DELETE", "OPTIONS")
+CREDENTIAL_HEADERS = ("authorization", "cookie", "proxy-authorization")  # not sent on to another origin
+ACCEPT_ENCODING = "gzip, deflate"
+COMPRESS_MIN_BYTES = int(os.environ.get("DITTO_COMPRESS_REQUESTS", "0"))
+READ_CHUNK = 64 * 1024
+STARTED = time.monotonic()
+
+startup_seconds = ditto_metrics.gauge("ditto_startup_seconds", "Seconds from loading the request layer to each startup milestone")
+first_request_seconds = ditto_metrics.gauge("ditto_first_request_seconds", "Duration of the process's first API request")
+dns_lookups = ditto_metrics.counter("ditto_dns_lookups_total", "Host name lookups, by whether the DNS cache answered")
+connections_total = ditto_metrics.counter("ditto_http_connections_total", "Requests by whether they opened a new connection or reused a pooled one")
+wire_bytes = ditto_metrics.counter("ditto_http_wire_bytes_total", "Body bytes sent and received on the wire, compressed or not")
+body_bytes = ditto_metrics.counter("ditto_http_body_bytes_total", "Body bytes sent and received before compression")
+
+milestones = {}
+milestones_lock = threading.Lock()
+
+
+def mark_startup(milestone):
+    """Record the first time a startup milestone is reached"""
+    with milestones_lock:
+        if milestone in milestones:
+            return False
+        milestones[milestone] = time.monotonic() - STARTED
+    startup_seconds.set(round(milestones[milestone], 4), milestone=milestone)
+    return True
+
+
+def startup_report():
+    with milestones_lock:
+        return dict(milestones)
+
+
+class DnsCache:
+    def __init__(self, ttl=DNS_TTL):
+        self.ttl = ttl
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def resolve(self, host, port):
+        key = (host, port)
+        with self.lock:
+            entry = self.entries.get(key)
+        if entry and time.monotonic() - entry[1] < self.ttl:
+            dns_lookups.inc(result="hit")
+            return entry[0]
+        dns_lookups.inc(result="miss")
+        infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        if self.ttl > 0:
+            with self.lock:
+                self.entries[key] = (infos, time.monotonic())
+        return infos
+
+    def forget(self, host, port):
+        with self.lock:
+            self.entries.pop((host, port), None)
+
+
+class AddressNotAllowed(OSError):
+    """A host resolved only to addresses a connection's allow filter rejects"""
+
+
+def create_connection(address, timeout=None, source_address=None, allow=None):
+    """
+    socket.create_connection, resolving through the DNS cache.
+    allow, when given, is called with each resolved IP address; addresses it rejects are refused.
+    """
+    host, port = address
+    error = None
+    for family, sock_type, proto, _, sockaddr in dns_cache.resolve(host, port):
+        if allow is not None and not allow(sockaddr[0]):
+            error = AddressNotAllowed(f"{host} resolves to {sockaddr[0]}")
+            continue
+        sock = socket.socket(family, sock_type, proto)
+        try:
+            if isinstance(timeout, (int, float)):
+                sock.settimeout(timeout)
+            if source_address:
+                sock.bind(source_address)
+            sock.connect(sockaddr)
+            return sock
+        except OSError as ex:
+            error = ex
+            sock.close()
+    # Every cached address failed; the host may have moved
+    dns_cache.forget(host, port)
+    raise error or OSError(f"No addresses found for {host}")
+
+
+ssl_context = None
+
+
+def new_connection(scheme, host, port, timeout, allow=None):
+    import http.client
+    global ssl_context
+    if scheme == "https":
+        if ssl_context is None:
+            import ssl
+            ssl_context = ssl.create_default_context()
+        conn = http.client.HTTPSConnection(host, port, timeout=timeout, context=ssl_context)
+    else:
+        conn = http.client.HTTPConnection(host, port, timeout=timeout)
+    conn._create_connection = create_connection if allow is None else functools.partial(create_connection, allow=allow)
+    return conn
+
+
+def connection_alive(conn):
+    """False when a pooled connection's socket is closed or has unexpected bytes waiting"""
+    if conn.sock is None:
+        return False
+    try:
+        # An idle keep-alive socket is never readable: readable means EOF, a reset or stray data
+        readable, _, _ = select.select([conn.sock], [], [], 0)
+    except (OSError, ValueError):
+        return False
+    return not readable
+
+
+class ConnectionPool:
+    def __init__(self, size=POOL_SIZE, idle_timeout=POOL_IDLE_TIMEOUT):
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.idle = {}  # (scheme, host, port) -> [(connection, returned at)]
+        self.lock = threading.Lock()
+
+    def get(self, key, timeout):
+        """Return (connection, reused)"""
+        now = time.monotonic()
+        with self.lock:
+            idle = self.idle.get(key, [])
+            while idle:
+                conn, returned_at = idle.pop()
+                if now - returned_at < self.idle_timeout and connection_alive(conn):
+                    conn.timeout = timeout
+                    conn.sock.settimeout(timeout)
+                    return conn, True
+                conn.close()
+        return new_connection(*key, timeout), False
+
+    def put(self, key, conn):
+        with self.lock:
+            idle = self.idle.setdefault(key, [])
+            if len(idle) < self.size:
+                idle.append((conn, time.monotonic()))
+                return
+        conn.close()
+
+    def clear(self):
+        with self.lock:
+            idle, self.idle = self.idle, {}
+        for connections in idle.values():
+            for conn, _ in connections:
+                conn.close()
+
+
+class Decoder:
+    """Incremental gzip/deflate decoder; identity for any other Content-Encoding"""
+    def __init__(self, encoding):
+        self.encoding = (encoding or "").strip().lower()
+        self.decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS) if self.encoding in ("gzip", "x-gzip") else None
+        self.head = b""  # start of a deflate stream, held until it shows whether it is zlib-wrapped
+
+    def feed(self, chunk):
+        if self.encoding == "deflate" and self.decompressor is None:
+            # "deflate" should be zlib-wrapped, but some servers send a raw stream; the
+            # two-byte zlib header tells them apart, however the body is split into chunks
+            self.head += chunk
+            if len(self.head) < 2:
+                return b""
+            chunk, self.head = self.head, b""
+            zlib_wrapped = chunk[0] & 0x0f == 8 and (chunk[0] << 8 | chunk[1]) % 31 == 0
+            self.decompressor = zlib.decompressobj(zlib.MAX_WBITS if zlib_wrapped else -zlib.MAX_WBITS)
+        return self.decompressor.decompress(chunk) if self.decompressor else chunk
+
+    def flush(self):
+        if self.head:
+            # Too short for a zlib header, so it can only be raw
+            self.decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+            return self.decompressor.decompress(self.head) + self.decompressor.flush()
+        return self.decompressor.flush() if self.decompressor else b""
+
+
+def read_body(response, encoding):
+    """Read and decompress a response body chunk by chunk, counting bytes before and after"""
+    decoder = Decoder(encoding)
+    parts = []
+    received = 0
+    while True:
+        chunk = response.read(READ_CHUNK)
+        if not chunk:
+            break
+        received += len(chunk)
+        parts.append(decoder.feed(chunk))
+    parts.append(decoder.flush())
+    data = b"".join(parts)
+    wire_bytes.inc(received, direction="received")
+    body_bytes.inc(len(data), direction="received")
+    return data
+
+
+def encode_body(body, headers):
+    """gzip a request body when it is large enough and compression is enabled, updating headers"""
+    if body is None:
+        return None
+    body_bytes.inc(len(body), direction="sent")
+    if COMPRESS_MIN_BYTES and len(body) >= COMPRESS_MIN_BYTES:
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        body = compressor.compress(body) + compressor.flush()
+        headers['Content-Encoding'] = "gzip"
+    wire_bytes.inc(len(body), direction="sent")
+    return body
+
+
+def pool_key(parts):
+    return (parts.scheme, parts.hostname, parts.port or (443 if parts.scheme == "https" else 80))
+
+
+def proxied(url):
+    import urllib.request
+    parts = urlsplit(url)
+    return parts.scheme in urllib.request.getproxies() and not urllib.request.proxy_bypass(parts.hostname or "")
+
+
+def send_once(url, method, body, headers, timeout, idempotent=False):
+    import http.client
+    parts = urlsplit(url)
+    key = pool_key(parts)
+    target = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+    for attempt in range(2):
+        conn, reused = pool.get(key, timeout)
+        connections_total.inc(connection="reused" if reused else "new")
+        written = False
+        try:
+            conn.request(method, target, body=body, headers=headers)
+            written = True
+            response = conn.getresponse()
+            data = read_body(response, response.getheader('content-encoding'))
+        except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+            conn.close()
+            # The server closed a pooled connection while it sat idle. A request it may have
+            # received could already be applied even without an answer, so only one that never
+            # got out, or that is safe to repeat, is resent once on a fresh connection.
+            if reused and attempt == 0 and (not written or idempotent or method in IDEMPOTENT_METHODS):
+                continue
+            raise
+        except Exception:
+            conn.close()
+            raise
+        if response.will_close:
+            conn.close()
+        else:
+            pool.put(key, conn)
+        return response.status, response.reason, {name.lower(): value for name, value in response.getheaders()}, data
+
+
+def send_urllib(url, method, body, headers, timeout, follow_redirects):
+    """urllib fallback, which honours proxy settings"""
+    import urllib.error
+    import urllib.request
+
+    class RedirectHandler(urllib.request.HTTPRedirectHandler):
+        def redirect_request(self, req, fp, code, msg, headers, newurl):
+            # Without follow_redirects, 3xx responses surface as HTTPError instead of being followed
+            if not follow_redirects:
+                return None
+            new_req = super().redirect_request(req, fp, code, msg, headers, newurl)
+            if new_req is not None and pool_key(urlsplit(newurl)) != pool_key(urlsplit(req.full_url)):
+                for name in [name for name in new_req.headers if name.lower() in CREDENTIAL_HEADERS]:
+                    del new_req.headers[name]
+            return new_req
+
+    req = urllib.request.Request(url, data=body, headers=headers, method=method)
+    opener = urllib.request.build_opener(RedirectHandler)
+    try:
+        with opener.open(req, timeout=timeout) as response:
+            return response.status, response.reason, {name.lower(): value for name, value in response.headers.items()}, read_body(response, response.headers.get('content-encoding'))
+    except urllib.error.HTTPError as e:
+        headers = {name.lower(): value for name, value in (e.headers or {}).items()}
+        return e.code, e.reason, headers, read_body(e, headers.get('content-encoding'))
+
+
+def request(url, method="GET", body=None, headers=None, timeout=10, follow_redirects=True, idempotent=False):
+    """
+    Send a request and return (status, reason, lower-cased headers, body bytes).
+    idempotent marks a write that is safe to resend, such as one carrying an idempotency key.
+    """
+    started = time.monotonic()
+    headers = dict(headers or {}, **{'Accept-Encoding': ACCEPT_ENCODING})
+    body = encode_body(body, headers)
+    if proxied(url):
+        result = send_urllib(url, method, body, headers, timeout, follow_redirects)
+    else:
+        for _ in range(MAX_REDIRECTS + 1):
+            result = send_once(url, method, body, headers, timeout, idempotent)
+            location = result[2].get('location')
+            if not (follow_redirects and result[0] in REDIRECT_STATUSES and location and method in ("GET", "HEAD")):
+                break
+            next_url = urljoin(url, location)
+            if pool_key(urlsplit(next_url)) != pool_key(urlsplit(url)):
+                headers = {name: value for name, value in headers.items() if name.lower() not in CREDENTIAL_HEADERS}
+            url = next_url
+    if mark_startup("first_response"):
+        first_request_seconds.set(round(time.monotonic() - started, 4))
+    return result
+
+
+def warm_up(base_url, timeout=5):
+    """Resolve base_url's host and open a connection to it, leaving it in the pool for the first request"""
+    parts = urlsplit(base_url)
+    if proxied(base_url):
+        return
+    key = pool_key(parts)
+    try:
+        dns_cache.resolve(parts.hostname, key[2])
+        mark_startup("dns_resolved")
+        conn = new_connection(*key, timeout)
+        conn.connect()
+        pool.put(key, conn)
+        mark_startup("connected")
+    except OSError as ex:
+        # The first real request will report the problem
+        log_error("warm-up failed", ex, url=base_url)
+
+
+def warm_up_in_background(base_url):
+    if 'pyodide' in sys.modules:
+        return None
+    thread = threading.Thread(target=warm_up, args=(base_url,), name="ditto-warmup", daemon=True)
+    thread.start()
+    return thread
+
+
+dns_cache = DnsCache()
+pool = ConnectionPool()
@@ -0,0 +1,292 @@
+"""
+Scheduled alias actions: pause, resume, delete or change the target URL at a set time.
+
+Pending jobs sit on one heap ordered by due time, and a single loop timer is armed for
+the earliest of them, so tens of thousands of jobs cost a heap entry each rather than a
+task. Due jobs run through alias_request in the bulk priority class, BULK_CONCURRENCY
+at a time.
+
+Jobs are saved to DITTO_JOBS_FILE (default ~/.ditto/jobs.json, readable only by its
+owner) along with the token of every alias that has jobs pending, and are loaded again
+on start; jobs that came due while Ditto was down run straight away. While an alias has
+jobs pending, the same timer refreshes its token every TOKEN_REFRESH_TIME minutes so it
+is still valid when they fire.
+"""
+import asyncio
+import heapq
+import itertools
+import json
+import os
+import time
+from collections import deque
+from datetime import datetime
+from urllib.parse import urlencode
+
+import ditto_metrics
+from ditto_api import BULK_ACTIONS, BULK_CONCURRENCY, TOKEN_REFRESH_TIME, SessionData, alias_request, alias_token, run_bulk
+from ditto_logging import log_error
+
+JOBS_FILE = os.environ.get("DITTO_JOBS_FILE", os.path.join(os.path.expanduser("~"), ".ditto", "jobs.json"))
+SAVE_DELAY = 1.0  # seconds of changes batched into one rewrite of the jobs file
+MAX_SLEEP = 300  # the timer re-checks the wall clock at least this often, in case it jumped
+REFRESH_RETRY = 60  # seconds before retrying a token refresh that failed
+HISTORY_LIMIT = 200  # finished jobs kept for display
+
+# action -> (label, method, endpoint); change_url sends the new URL as a query parameter
+JOB_ACTIONS = {
+    'pause': BULK_ACTIONS['pause'],
+    'resume': BULK_ACTIONS['resume'],
+    'change_url': ("Change URL", "PATCH", "/change_url"),
+    'delete': BULK_ACTIONS['delete'],
+}
+
+PENDING, DONE, FAILED, CANCELLED = "pending", "done", "failed", "cancelled"
+
+pending_gauge = ditto_metrics.gauge("ditto_jobs_pending", "Scheduled alias actions waiting to run")
+jobs_total = ditto_metrics.counter("ditto_jobs_total", "Scheduled alias actions finished, by action and result")
+# Jobs that came due while Ditto was down start late by however long it was down
+lateness = ditto_metrics.histogram("ditto_jobs_lateness_seconds", "Seconds between a scheduled action's due time and its start",
+                                   buckets=(0.01, 0.1, 1, 10, 60, 600, 3600, 86400))
+
+
+class Job:
+    def __init__(self, job_id, alias, action, due, url=None, status=PENDING, detail="", finished=None):
+        self.id = job_id
+        self.alias = alias
+        self.action = action
+        self.due = due  # epoch seconds
+        self.url = url
+        self.status = status
+        self.detail = detail
+        self.finished = finished
+
+    def to_dict(self):
+        return {
+            'id': self.id, 'alias': self.alias, 'action': self.action, 'due': self.due, 'url': self.url,
+            'status': self.status, 'detail': self.detail, 'finished': self.finished,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['id'], data['alias'], data['action'], data['due'], data.get('url'),
+                   data.get('status', PENDING), data.get('detail', ""), data.get('finished'))
+
+
+class JobContext:
+    """Stands in for the Flet page, like the CLI's context: the request layer only needs session_data"""
+    def __init__(self):
+        self.session_data = SessionData()
+        # Every alias with jobs pending keeps its token, however many there are
+        self.session_data.max_aliases = None
+
+
+class JobScheduler:
+    """Owns its heap and timer on the event loop: call it from the loop's thread only"""
+    def __init__(self, path=JOBS_FILE):
+        self.path = path
+        self.context = JobContext()
+        self.jobs = {}  # job id -> pending Job
+        self.by_alias = {}  # alias -> {pending job ids}
+        self.heap = []  # (due, sequence, job id, alias); job id None is a token refresh for alias
+        self.refreshing = set()  # aliases with a token refresh on the heap
+        self.running = set()  # job ids in flight
+        self.history = deque(maxlen=HISTORY_LIMIT)
+        self.sequence = itertools.count()
+        self.next_id = 1
+        self.loop = None
+        self.timer = None
+        self.save_handle = None
+        self.tasks = set()
+
+    def start(self):
+        """Load saved jobs and arm the timer on the running event loop, once per process"""
+        if self.loop is not None:
+            return
+        self.loop = asyncio.get_running_loop()
+        self.load()
+        self.arm()
+
+    def load(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return
+        for alias, (access_token, token_time) in saved.get('tokens', {}).items():
+            self.context.session_data.alias_tokens[alias] = (access_token, datetime.fromisoformat(token_time))
+        for data in saved.get('jobs', []):
+            job = Job.from_dict(data)
+            self.jobs[job.id] = job
+            self.by_alias.setdefault(job.alias, set()).add(job.id)
+            self.heap.append((job.due, next(self.sequence), job.id, job.alias))
+        heapq.heapify(self.heap)
+        self.history.extend(Job.from_dict(data) for data in saved.get('history', []))
+        self.next_id = max([self.next_id, saved.get('next_id', 1)] + [job.id + 1 for job in self.jobs.values()])
+        for alias in self.by_alias:
+            self.schedule_refresh(alias)
+        pending_gauge.set(len(self.jobs))
+
+    def save(self):
+        self.save_handle = None
+        tokens = self.context.session_data.alias_tokens
+        saved = {
+            'next_id': self.next_id,
+            'jobs': [job.to_dict() for job in self.jobs.values()],
+            'history': [job.to_dict() for job in self.history],
+            'tokens': {alias: [tokens[alias][0], tokens[alias][1].isoformat()] for alias in self.by_alias if alias in tokens},
+        }
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(saved, f)
+        os.chmod(tmp_path, 0o600)
+        os.replace(tmp_path, self.path)
+
+    def changed(self):
+        pending_gauge.set(len(self.jobs))
+        if self.save_handle is None:
+            self.save_handle = self.loop.call_later(SAVE_DELAY, self.save)
+
+    def schedule(self, alias, action, due, access_token, token_time=None, url=None):
+        """
+        Add a job running action on alias at due (epoch seconds), using access_token until it
+        needs refreshing. Returns the Job.
+        """
+        if action not in JOB_ACTIONS:
+            raise ValueError(f"Unknown action '{action}'")
+        if action == 'change_url' and not url:
+            raise ValueError("change_url needs a URL")
+        self.start()
+        token_time = token_time or datetime.now()
+        saved = self.context.session_data.alias_tokens.get(alias)
+        if saved is None or saved[1] <= token_time:
+            self.context.session_data.alias_tokens[alias] = (access_token, token_time)
+
+        job = Job(self.next_id, alias, action, due, url if action == 'change_url' else None)
+        self.next_id += 1
+        self.jobs[job.id] = job
+        self.by_alias.setdefault(alias, set()).add(job.id)
+        self.push(job.due, job.id, alias)
+        self.schedule_refresh(alias)
+        self.changed()
+        return job
+
+    def cancel(self, job_id):
+        """Cancel a pending job; False if it is unknown, finished or already running"""
+        job = self.jobs.get(job_id)
+        if job is None or job_id in self.running:
+            return False
+        self.finish(job, CANCELLED)
+        # Cancelled entries stay on the heap until they come due; rebuild it once they dominate
+        if len(self.heap) > 2 * (len(self.jobs) + len(self.refreshing)) + 1024:
+            self.heap = [entry for entry in self.heap if entry[2] is None or entry[2] in self.jobs]
+            heapq.heapify(self.heap)
+        return True
+
+    def pending_for(self, alias):
+        return sorted((self.jobs[job_id] for job_id in self.by_alias.get(alias, ())), key=lambda job: (job.due, job.id))
+
+    def history_for(self, alias):
+        return [job for job in reversed(self.history) if job.alias == alias]
+
+    def push(self, due, job_id, alias):
+        entry = (due, next(self.sequence), job_id, alias)
+        heapq.heappush(self.heap, entry)
+        if self.heap[0] is entry:
+            self.arm()
+
+    def schedule_refresh(self, alias, delay=None):
+        if alias in self.refreshing:
+            return
+        if delay is None:
+            entry = self.context.session_data.alias_tokens.get(alias)
+            if entry is None:
+                return
+            age = (datetime.now() - entry[1]).total_seconds()
+            delay = max(0, TOKEN_REFRESH_TIME * 60 - age) + 1
+        self.refreshing.add(alias)
+        self.push(time.time() + delay, None, alias)
+
+    def arm(self):
+        """Point the single timer at the earliest entry on the heap"""
+        if self.loop is None:
+            return
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if self.heap:
+            delay = min(max(0, self.heap[0][0] - time.time()), MAX_SLEEP)
+            self.timer = self.loop.call_later(delay, self.on_timer)
+
+    def on_timer(self):
+        self.timer = None
+        now = time.time()
+        due_jobs, refreshes = [], []
+        while self.heap and self.heap[0][0] <= now:
+            due, _, job_id, alias = heapq.heappop(self.heap)
+            if job_id is None:
+                self.refreshing.discard(alias)
+                if alias in self.by_alias:
+                    refreshes.append(alias)
+            elif job_id in self.jobs and job_id not in self.running:
+                # Cancelled jobs are skipped here rather than searched for on the heap
+                self.running.add(job_id)
+                due_jobs.append(self.jobs[job_id])
+        if due_jobs or refreshes:
+            task = self.loop.create_task(self.run_due(due_jobs, refreshes))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+        self.arm()
+
+    async def run_due(self, due_jobs, refreshes):
+        for alias in refreshes:
+            token_time = self.context.session_data.alias_tokens.get(alias, (None, None))[1]
+            await alias_token(self.context, alias)
+            refreshed = self.context.session_data.alias_tokens.get(alias, (None, None))[1] != token_time
+            self.schedule_refresh(alias, None if refreshed else REFRESH_RETRY)
+            if refreshed:
+                self.changed()
+        if due_jobs:
+            await run_bulk(due_jobs, self.run_job, concurrency=BULK_CONCURRENCY)
+
+    async def run_job(self, job):
+        label, method, endpoint = JOB_ACTIONS[job.action]
+        if job.url:
+            endpoint = f"{endpoint}?{urlencode({'url': job.url})}"
+        lateness.observe(max(0.0, time.time() - job.due))
+        try:
+            response = await alias_request(self.context, job.alias, endpoint, method)
+        finally:
+            self.running.discard(job.id)
+        if response['ok']:
+            self.finish(job, DONE)
+            if job.action == 'delete':
+                for job_id in list(self.by_alias.get(job.alias, ())):
+                    if job_id not in self.running:
+                        self.finish(self.jobs[job_id], CANCELLED, "Alias deleted")
+        else:
+            detail = str(response['body'].get("detail", "Request failed"))
+            log_error("job failed", detail, job=job.id, action=job.action, alias=job.alias, status=response['status'])
+            self.finish(job, FAILED, detail)
+        return response
+
+    def finish(self, job, status, detail=""):
+        job.status = status
+        job.detail = detail
+        job.finished = time.time()
+        self.jobs.pop(job.id, None)
+        ids = self.by_alias.get(job.alias)
+        if ids is not None:
+            ids.discard(job.id)
+            if not ids:
+                del self.by_alias[job.alias]
+                self.context.session_data.alias_tokens.pop(job.alias, None)
+        self.history.append(job)
+        jobs_total.inc(action=job.action, result=status)
+        self.changed()
+
+    def stats(self):
+        return {'pending': len(self.jobs), 'running': len(self.running), 'aliases': len(self.by_alias), 'heap': len(self.heap)}
+
+
+jobs = JobScheduler()
@@ -0,0 +1,82 @@
+"""
+Per-endpoint latency tracking for API calls.
+
+Each endpoint keeps a window of its most recent latencies. Timeouts are derived from
+the window's p99 once enough samples are in, with the caller's timeout as the ceiling,
+and slow idempotent GETs are hedged after the endpoint's p95 (DITTO_HEDGE=0 disables).
+"""
+import math
+import os
+from collections import deque
+from urllib.parse import urlsplit
+
+import ditto_metrics
+
+LATENCY_WINDOW = 200  # recent samples kept per endpoint
+MIN_SAMPLES = 20  # fixed timeouts are used until an endpoint has this many samples
+TIMEOUT_FACTOR = 3  # timeout = p99 * factor
+MIN_TIMEOUT = 2.0
+MIN_HEDGE_DELAY = 0.05
+HEDGE_ENABLED = os.environ.get("DITTO_HEDGE", "1") not in ("0", "off", "")
+HEDGED_ENDPOINTS = {"GET /details", "GET /health", "GET /validate_token"}
+MAX_HEDGES_IN_FLIGHT = 4  # hedges are skipped beyond this, so a struggling backend isn't hit twice as hard
+API_PATHS = {
+    "/change_password", "/change_url", "/create", "/delete", "/details", "/health", "/login",
+    "/pause", "/refresh_token", "/reset_hits", "/resume", "/validate_token",
+}
+
+request_seconds = ditto_metrics.histogram("ditto_request_seconds", "API request latency by endpoint")
+hedges_total = ditto_metrics.counter("ditto_hedged_requests_total", "Hedged requests sent, by endpoint and which copy answered first")
+
+
+def endpoint_key(method, url):
+    """'GET /details'; short-link probes are grouped as '/{alias}'"""
+    path = urlsplit(url).path or "/"
+    return f"{method} {path if path in API_PATHS else '/{alias}'}"
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, math.ceil(fraction * len(ordered)) - 1)]
+
+
+class LatencyTracker:
+    def __init__(self, window=LATENCY_WINDOW):
+        self.window = window
+        self.samples = {}
+        self.hedges_in_flight = 0
+
+    def record(self, key, seconds):
+        samples = self.samples.get(key)
+        if samples is None:
+            samples = self.samples[key] = deque(maxlen=self.window)
+        samples.append(seconds)
+        request_seconds.observe(seconds, endpoint=key)
+
+    def quantile(self, key, fraction):
+        samples = self.samples.get(key)
+        if not samples or len(samples) < MIN_SAMPLES:
+            return None
+        return percentile(samples, fraction)
+
+    def timeout_for(self, key, default):
+        p99 = self.quantile(key, 0.99)
+        if p99 is None:
+            return default
+        return min(default, max(MIN_TIMEOUT, p99 * TIMEOUT_FACTOR))
+
+    def hedge_delay(self, key):
+        """Seconds to wait before hedging a request to this endpoint, or None to not hedge"""
+        if not HEDGE_ENABLED or key not in HEDGED_ENDPOINTS or self.hedges_in_flight >= MAX_HEDGES_IN_FLIGHT:
+            return None
+        p95 = self.quantile(key, 0.95)
+        return None if p95 is None else max(MIN_HEDGE_DELAY, p95)
+
+    def stats(self):
+        return {
+            key: {'samples': len(samples), 'p50': percentile(samples, 0.5), 'p95': percentile(samples, 0.95), 'p99': percentile(samples, 0.99)}
+            for key, samples in self.samples.items()
+        }
+
+
+latency = LatencyTracker()
@@ -0,0 +1,227 @@
+"""
+Health checks of the target URLs behind aliases.
+
+A probe sends HEAD to the target and follows redirects itself, one hop at a time, so the
+whole chain is recorded (up to MAX_REDIRECTS hops). HEAD answers of 400 or more are
+confirmed with a GET, as some servers don't implement HEAD; a GET's body is never read
+beyond PROBE_READ_BYTES.
+
+Checks are queued to WORKERS worker tasks, with at most PER_HOST_LIMIT probes in flight
+per host, so checking many aliases on one site doesn't hammer it. Results are cached per
+URL for DITTO_LINK_HEALTH_TTL seconds (default 600), and concurrent checks of a URL share
+one probe. Probes run in worker threads and resolve hosts through ditto_http's DNS
+cache. The browser build can't read cross-origin answers, so it doesn't check links;
+DITTO_LINK_HEALTH=off turns checks off everywhere.
+
+Target URLs come from users, so a probe only connects to public addresses: every hop
+is refused when its host resolves to a loopback, private, link-local or otherwise
+non-global address, checked against the addresses actually connected to. Set
+DITTO_LINK_HEALTH_PRIVATE=1 to check intranet links from a single-user desktop install.
+"""
+import asyncio
+import ipaddress
+import os
+import sys
+import time
+from urllib.parse import urljoin, urlsplit
+
+import ditto_http
+import ditto_metrics
+from ditto_api import LRUCache
+from ditto_tracing import span
+
+ENABLED = os.environ.get("DITTO_LINK_HEALTH", "") not in ("0", "off")
+ALLOW_PRIVATE = os.environ.get("DITTO_LINK_HEALTH_PRIVATE", "") not in ("", "0", "off")
+CACHE_TTL = float(os.environ.get("DITTO_LINK_HEALTH_TTL", "600"))
+CACHE_SIZE = 4096
+WORKERS = 8
+PER_HOST_LIMIT = 2
+PROBE_TIMEOUT = 10
+PROBE_READ_BYTES = 1024
+MAX_REDIRECTS = 10
+PROBE_HEADERS = {'User-Agent': "Ditto-LinkCheck/1.0", 'Accept': "*/*"}
+
+OK, BROKEN, UNREACHABLE, UNKNOWN = "ok", "broken", "unreachable", "unknown"
+
+checks_total = ditto_metrics.counter("ditto_link_checks_total", "Target URL probes, by result")
+cache_total = ditto_metrics.counter("ditto_link_health_cache_total", "Link checks by whether the cache, an in-flight probe or a new probe answered")
+probe_seconds = ditto_metrics.histogram("ditto_link_probe_seconds", "Duration of a target URL probe, redirects included")
+
+
+class LinkStatus:
+    def __init__(self, url, result, status=None, chain=None, detail="", elapsed=0.0):
+        self.url = url
+        self.result = result
+        self.status = status  # HTTP status of the last hop
+        self.chain = chain or []  # [(url, HTTP status)] for every hop, the first being url
+        self.detail = detail
+        self.elapsed = elapsed
+        self.checked = time.time()
+
+    @property
+    def redirects(self):
+        return max(len(self.chain) - 1, 0)
+
+    def summary(self):
+        if self.result == OK:
+            text = f"Link OK ({self.status})"
+        elif self.result == BROKEN:
+            text = f"Link broken ({self.detail or self.status})"
+        elif self.result == UNREACHABLE:
+            text = f"Link unreachable: {self.detail}"
+        else:
+            return self.detail or "Link not checked"
+        if self.redirects:
+            text += f" after {self.redirects} redirect{'s' if self.redirects > 1 else ''}"
+        return text
+
+
+def public_address(ip):
+    """True for globally routable unicast addresses"""
+    try:
+        address = ipaddress.ip_address(ip)
+    except ValueError:
+        return False
+    return address.is_global and not address.is_multicast
+
+
+def send_probe(url, method, timeout, allow=None):
+    """One request, redirects not followed: (status, Location header)"""
+    parts = urlsplit(url)
+    if ditto_http.proxied(url):
+        if allow is not None:
+            # The proxy connects, so the host can only be vetted by resolving it here as well
+            for *_, sockaddr in ditto_http.dns_cache.resolve(parts.hostname, ditto_http.pool_key(parts)[2]):
+                if not allow(sockaddr[0]):
+                    raise ditto_http.AddressNotAllowed(f"{parts.hostname} resolves to {sockaddr[0]}")
+        status, reason, headers, body = ditto_http.send_urllib(url, method, None, dict(PROBE_HEADERS), timeout, False)
+        return status, headers.get('location')
+    target = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+    # A fresh connection: pooled ones are for the API, and a GET is abandoned after PROBE_READ_BYTES
+    conn = ditto_http.new_connection(*ditto_http.pool_key(parts), timeout, allow)
+    try:
+        conn.request(method, target, headers=PROBE_HEADERS)
+        response = conn.getresponse()
+        if method == "GET":
+            response.read(PROBE_READ_BYTES)
+        return response.status, response.getheader('location')
+    finally:
+        conn.close()
+
+
+def probe(url, timeout=PROBE_TIMEOUT, allow_private=ALLOW_PRIVATE):
+    """Check url, following its redirects; runs in a worker thread"""
+    started = time.monotonic()
+    chain = []
+    current = url
+    allow = None if allow_private else public_address
+    try:
+        while True:
+            parts = urlsplit(current)
+            if parts.scheme not in ("http", "https") or not parts.hostname:
+                return LinkStatus(url, UNKNOWN, chain=chain, detail=f"Can't check {parts.scheme or 'relative'} links")
+            status, location = send_probe(current, "HEAD", timeout, allow)
+            if status >= 400:
+                status, location = send_probe(current, "GET", timeout, allow)
+            chain.append((current, status))
+            if status not in ditto_http.REDIRECT_STATUSES:
+                break
+            if not location:
+                return LinkStatus(url, BROKEN, status, chain, "redirect without a Location", time.monotonic() - started)
+            current = urljoin(current, location)
+            if any(current == hop for hop, _ in chain):
+                return LinkStatus(url, BROKEN, status, chain, "redirect loop", time.monotonic() - started)
+            if len(chain) > MAX_REDIRECTS:
+                return LinkStatus(url, BROKEN, status, chain, "too many redirects", time.monotonic() - started)
+    except ditto_http.AddressNotAllowed as ex:
+        return LinkStatus(url, UNKNOWN, chain=chain, detail=f"Not checked: {ex}, not a public address", elapsed=time.monotonic() - started)
+    except Exception as ex:
+        return LinkStatus(url, UNREACHABLE, chain=chain, detail=str(ex) or type(ex).__name__, elapsed=time.monotonic() - started)
+    return LinkStatus(url, OK if status < 400 else BROKEN, status, chain, elapsed=time.monotonic() - started)
+
+
+class LinkChecker:
+    def __init__(self, workers=WORKERS, per_host=PER_HOST_LIMIT, ttl=CACHE_TTL, timeout=PROBE_TIMEOUT, allow_private=ALLOW_PRIVATE):
+        self.workers = workers
+        self.per_host = per_host
+        self.timeout = timeout
+        self.allow_private = allow_private
+        self.cache = LRUCache(CACHE_SIZE, ttl)
+        self.loop = None
+        self.queue = None
+        self.tasks = []
+        self.pending = {}  # url -> future of its queued or running probe
+        self.host_slots = {}  # host -> [semaphore of per_host, probes running or waiting]
+
+    def available(self):
+        return ENABLED and 'pyodide' not in sys.modules
+
+    def cached(self, url):
+        return self.cache.get(url)
+
+    def start(self):
+        """Start the workers on the running event loop"""
+        loop = asyncio.get_running_loop()
+        if self.loop is loop:
+            return
+        self.loop = loop
+        self.queue = asyncio.Queue()
+        self.pending = {}
+        self.host_slots = {}
+        self.tasks = [loop.create_task(self.work()) for _ in range(self.workers)]
+
+    async def check(self, url, force=False):
+        """LinkStatus of url, from the cache unless force"""
+        if not self.available():
+            return LinkStatus(url, UNKNOWN, detail="Link checks are off")
+        if not force:
+            cached = self.cache.get(url)
+            if cached is not None:
+                cache_total.inc(result="hit")
+                return cached
+        self.start()
+        future = self.pending.get(url)
+        if future is None:
+            cache_total.inc(result="miss")
+            future = self.pending[url] = self.loop.create_future()
+            self.queue.put_nowait((url, future))
+        else:
+            cache_total.inc(result="shared")
+        # Shielded so one caller being cancelled doesn't fail the probe for the others
+        return await asyncio.shield(future)
+
+    async def check_many(self, urls, force=False):
+        """{url: LinkStatus} for every URL, probed through the same pool"""
+        urls = list(dict.fromkeys(urls))
+        results = await asyncio.gather(*(self.check(url, force) for url in urls))
+        return dict(zip(urls, results))
+
+    async def work(self):
+        while True:
+            url, future = await self.queue.get()
+            host = urlsplit(url).hostname or ""
+            slots = self.host_slots.get(host)
+            if slots is None:
+                slots = self.host_slots[host] = [asyncio.Semaphore(self.per_host), 0]
+            slots[1] += 1
+            try:
+                async with slots[0]:
+                    with span("link_health.probe", **{'http.host': host}) as probe_span:
+                        result = await asyncio.to_thread(probe, url, self.timeout, self.allow_private)
+                        probe_span.set('link.result', result.result)
+            except Exception as ex:
+                result = LinkStatus(url, UNREACHABLE, detail=str(ex) or type(ex).__name__)
+            finally:
+                # Forget hosts nobody is probing or waiting for
+                slots[1] -= 1
+                if not slots[1]:
+                    del self.host_slots[host]
+            probe_seconds.observe(result.elapsed)
+            checks_total.inc(result=result.result)
+            self.cache.set(url, result)
+            self.pending.pop(url, None)
+            if not future.done():
+                future.set_result(result)
+
+
+link_checker = LinkChecker()
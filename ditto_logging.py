@@ -0,0 +1,175 @@
+"""
+Structured JSON logs for operators: one line per API request, page navigation and error.
+
+Off unless DITTO_LOG is set:
+
+    DITTO_LOG=stderr                                  JSON lines on stderr
+    DITTO_LOG=file  DITTO_LOG_FILE=ditto.log.jsonl    JSON lines appended to a file
+    DITTO_LOG_LEVEL=WARNING                           drop records below this level (default INFO)
+    DITTO_LOG_SAMPLE=request=0.1,navigation=0.5       fraction of records kept per category (default 1)
+
+Records are put on a bounded queue and formatted and written by a background thread, so
+logging never waits on the disk or the terminal; when the queue is full, records are
+dropped and counted in ditto_log_dropped_total. Passwords and tokens are replaced by
+"[redacted]" anywhere in a record's fields, so /login and /change_password payloads can
+be logged as sent. A record made inside a sampled trace carries its trace and span ids.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+
+import ditto_metrics
+from ditto_tracing import current_span
+
+LOG_QUEUE_SIZE = 10000
+REDACTED = "[redacted]"
+REDACTED_FIELDS = frozenset({
+    'url_pass', 'old_url_pass', 'new_url_pass', 'password',
+    'access_token', 'refresh_token', 'auth_token', 'token', 'authorization',
+})
+
+REQUEST, NAVIGATION, ERROR = "request", "navigation", "error"
+
+dropped_total = ditto_metrics.counter("ditto_log_dropped_total", "Log records dropped because the log queue was full")
+
+logger = logging.getLogger("ditto")
+logger.propagate = False
+
+
+def redact(value):
+    """Copy of value with the secrets in every nested dict replaced"""
+    if isinstance(value, dict):
+        return {key: REDACTED if str(key).lower() in REDACTED_FIELDS else redact(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [redact(item) for item in value]
+    return value
+
+
+def parse_sample_rates(value):
+    """'request=0.1,navigation=0.5' -> {'request': 0.1, 'navigation': 0.5}"""
+    rates = {}
+    for part in value.split(","):
+        category, _, rate = part.partition("=")
+        if category.strip() and rate.strip():
+            rates[category.strip()] = min(max(float(rate), 0.0), 1.0)
+    return rates
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname.lower(),
+            'category': getattr(record, 'category', record.name),
+            'event': record.getMessage(),
+        }
+        entry.update(getattr(record, 'fields', {}))
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class DroppingQueueHandler(logging.Handler):
+    """Hands records to the listener thread as they are, dropping them when the queue is full"""
+    def __init__(self, records):
+        super().__init__()
+        self.queue = records
+
+    def emit(self, record):
+        # Formatting is left to the listener thread; fields are built fresh for each record
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            dropped_total.inc()
+
+
+class Logs:
+    def __init__(self):
+        self.enabled = False
+        self.level = logging.INFO
+        self.sample_rates = {}
+        self.listener = None
+
+    def configure(self, mode, path, level, sample_rates):
+        self.stop()
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+            handler.close()
+        self.level = logging.getLevelName(level.upper()) if isinstance(level, str) else level
+        if not isinstance(self.level, int):
+            self.level = logging.INFO
+        logger.setLevel(self.level)
+        self.sample_rates = sample_rates
+        self.enabled = mode not in ("", "off", "0")
+        if not self.enabled:
+            return
+        output = logging.StreamHandler(sys.stderr) if mode == "stderr" else logging.FileHandler(path, encoding='utf-8')
+        output.setFormatter(JsonFormatter())
+        # No background threads in the browser build, where console writes don't block anyway
+        if 'pyodide' in sys.modules:
+            logger.addHandler(output)
+            return
+        # Only imported once logs are on: with its pickle and socket imports it costs more than this module
+        from logging.handlers import QueueListener
+        logger.addHandler(DroppingQueueHandler(queue.Queue(LOG_QUEUE_SIZE)))
+        self.listener = QueueListener(logger.handlers[0].queue, output)
+        self.listener.start()
+
+    def stop(self):
+        """Write out the queued records and stop the listener thread"""
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+
+    def sampled(self, category):
+        rate = self.sample_rates.get(category, 1.0)
+        return rate >= 1.0 or random.random() < rate
+
+    def log(self, category, event, level=logging.INFO, exc_info=None, **fields):
+        if not self.enabled or level < self.level or not self.sampled(category):
+            return
+        span = current_span.get()
+        if span is not None and span.sampled:
+            fields['trace_id'] = span.trace_id
+            fields['span_id'] = span.span_id
+        logger.log(level, event, exc_info=exc_info, extra={'category': category, 'fields': redact(fields)})
+
+
+def configure(mode=None, path=None, level=None, sample_rates=None):
+    """(Re)configure the global logs; arguments default to the DITTO_LOG* environment"""
+    mode = (mode if mode is not None else os.environ.get("DITTO_LOG", "")).lower()
+    if sample_rates is None:
+        sample_rates = parse_sample_rates(os.environ.get("DITTO_LOG_SAMPLE", ""))
+    logs.configure(
+        mode,
+        path or os.environ.get("DITTO_LOG_FILE", "ditto.log.jsonl"),
+        level or os.environ.get("DITTO_LOG_LEVEL", "INFO"),
+        sample_rates,
+    )
+    return logs
+
+
+def log(category, event, level=logging.INFO, **fields):
+    """One structured record in category (request, navigation, error...), kept at the category's sample rate"""
+    logs.log(category, event, level, **fields)
+
+
+def log_error(event, error=None, **fields):
+    """An error record, with the traceback of error when it is an exception being handled"""
+    if isinstance(error, BaseException):
+        fields.setdefault('error', str(error) or type(error).__name__)
+        logs.log(ERROR, event, logging.ERROR, exc_info=(type(error), error, error.__traceback__), **fields)
+    else:
+        if error is not None:
+            fields.setdefault('error', error)
+        logs.log(ERROR, event, logging.ERROR, **fields)
+
+
+logs = Logs()
+configure()
+atexit.register(logs.stop)
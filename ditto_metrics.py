@@ -0,0 +1,191 @@
+"""
+Process-wide metrics for Ditto: counters, gauges and histograms with optional labels.
+
+snapshot() returns everything as plain data, render() as Prometheus text. Set
+DITTO_METRICS_PORT to serve /metrics from the Flet server; the CLI prints a
+snapshot with --metrics.
+"""
+import threading
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+registry = {}
+registry_lock = threading.Lock()
+
+
+def label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def format_labels(key):
+    if not key:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in key) + "}"
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name, description):
+        self.name = name
+        self.description = description
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}"]
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{format_labels(key)} {value}")
+        return lines
+
+    def snapshot(self):
+        with self.lock:
+            return {format_labels(key) or "": value for key, value in self.values.items()}
+
+    def remove(self, **labels):
+        with self.lock:
+            self.values.pop(label_key(labels), None)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = label_key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[label_key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = label_key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, description, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, description)
+        self.buckets = buckets
+
+    def observe(self, value, **labels):
+        key = label_key(labels)
+        with self.lock:
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = {'count': 0, 'sum': 0.0, 'max': 0.0, 'buckets': [0] * len(self.buckets)}
+            state['count'] += 1
+            state['sum'] += value
+            state['max'] = max(state['max'], value)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state['buckets'][i] += 1
+                    break
+
+    def quantile(self, fraction, **labels):
+        """Upper bucket bound containing the given quantile (an estimate, like Prometheus)"""
+        with self.lock:
+            state = self.values.get(label_key(labels))
+            if not state or not state['count']:
+                return None
+            target = fraction * state['count']
+            seen = 0
+            for bound, count in zip(self.buckets, state['buckets']):
+                seen += count
+                if seen >= target:
+                    return bound
+            return state['max']
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for key, state in sorted(self.values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, state['buckets']):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{format_labels(key + (('le', bound),))} {cumulative}")
+                lines.append(f"{self.name}_bucket{format_labels(key + (('le', '+Inf'),))} {state['count']}")
+                lines.append(f"{self.name}_sum{format_labels(key)} {state['sum']}")
+                lines.append(f"{self.name}_count{format_labels(key)} {state['count']}")
+        return lines
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                format_labels(key) or "": {
+                    'count': state['count'],
+                    'sum': state['sum'],
+                    'max': state['max'],
+                    'avg': state['sum'] / state['count'] if state['count'] else 0,
+                }
+                for key, state in self.values.items()
+            }
+
+
+def get_or_create(cls, name, description, **kwargs):
+    with registry_lock:
+        metric = registry.get(name)
+        if metric is None:
+            metric = registry[name] = cls(name, description, **kwargs)
+        return metric
+
+
+def counter(name, description):
+    return get_or_create(Counter, name, description)
+
+
+def gauge(name, description):
+    return get_or_create(Gauge, name, description)
+
+
+def histogram(name, description, buckets=DEFAULT_BUCKETS):
+    return get_or_create(Histogram, name, description, buckets=buckets)
+
+
+def snapshot():
+    with registry_lock:
+        metrics = list(registry.values())
+    return {metric.name: metric.snapshot() for metric in metrics}
+
+
+def render():
+    with registry_lock:
+        metrics = sorted(registry.values(), key=lambda metric: metric.name)
+    return "\n".join(line for metric in metrics for line in metric.render()) + "\n"
+
+
+def serve(port, host="127.0.0.1"):
+    """Serve render() at /metrics from a daemon thread"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+            body = render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="ditto-metrics", daemon=True).start()
+    return server
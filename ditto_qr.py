@@ -0,0 +1,326 @@
+"""
+QR codes for short links, encoded locally in pure Python and rendered as PNG.
+
+Byte-mode encoding at the smallest version (1-40) that fits, with the mask chosen by the
+standard penalty rules. Rendered images are kept in an LRU cache keyed by text and
+rendering options, so showing a link again or exporting many links doesn't re-encode.
+"""
+import base64
+import re
+import struct
+import zlib
+
+import ditto_metrics
+from ditto_api import LRUCache
+
+QR_CACHE_SIZE = 256
+DEFAULT_SCALE = 8  # pixels per module
+DEFAULT_BORDER = 4  # quiet zone in modules, the minimum the standard allows
+
+# Error correction level -> (index into the tables below, format bits)
+ECC_LEVELS = {'L': (0, 1), 'M': (1, 0), 'Q': (2, 3), 'H': (3, 2)}
+
+# Error correction codewords per block and number of blocks, by level then version (index 0 unused)
+ECC_CODEWORDS_PER_BLOCK = (
+    (-1, 7, 10, 15, 20, 26, 18, 20, 24, 30, 18, 20, 24, 26, 30, 22, 24, 28, 30, 28, 28, 28, 28, 30, 30, 26, 28, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30),
+    (-1, 10, 16, 26, 18, 24, 16, 18, 22, 22, 26, 30, 22, 22, 24, 24, 28, 28, 26, 26, 26, 26, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28),
+    (-1, 13, 22, 18, 26, 18, 24, 18, 22, 20, 24, 28, 26, 24, 20, 30, 24, 28, 28, 26, 30, 28, 30, 30, 30, 30, 28, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30),
+    (-1, 17, 28, 22, 16, 22, 28, 26, 26, 24, 28, 24, 28, 22, 24, 24, 30, 28, 28, 26, 28, 30, 24, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30),
+)
+NUM_ERROR_CORRECTION_BLOCKS = (
+    (-1, 1, 1, 1, 1, 1, 2, 2, 2, 2, 4, 4, 4, 4, 4, 6, 6, 6, 6, 7, 8, 8, 9, 9, 10, 12, 12, 12, 13, 14, 15, 16, 17, 18, 19, 19, 20, 21, 22, 24, 25),
+    (-1, 1, 1, 1, 2, 2, 4, 4, 4, 5, 5, 5, 8, 9, 9, 10, 10, 11, 13, 14, 16, 17, 17, 18, 20, 21, 23, 25, 26, 28, 29, 31, 33, 35, 37, 38, 40, 43, 45, 47, 49),
+    (-1, 1, 1, 2, 2, 4, 4, 6, 6, 8, 8, 8, 10, 12, 16, 12, 17, 16, 18, 21, 20, 23, 23, 25, 27, 29, 34, 34, 35, 38, 40, 43, 45, 48, 51, 53, 56, 59, 62, 65, 68),
+    (-1, 1, 1, 2, 4, 4, 4, 5, 6, 8, 8, 11, 11, 16, 16, 18, 16, 19, 21, 25, 25, 25, 34, 30, 32, 35, 37, 40, 42, 45, 48, 51, 54, 57, 60, 63, 66, 70, 74, 77, 81),
+)
+
+MASKS = (
+    lambda x, y: (x + y) % 2 == 0,
+    lambda x, y: y % 2 == 0,
+    lambda x, y: x % 3 == 0,
+    lambda x, y: (x + y) % 3 == 0,
+    lambda x, y: (x // 3 + y // 2) % 2 == 0,
+    lambda x, y: x * y % 2 + x * y % 3 == 0,
+    lambda x, y: (x * y % 2 + x * y % 3) % 2 == 0,
+    lambda x, y: ((x + y) % 2 + x * y % 3) % 2 == 0,
+)
+RUN_RE = re.compile(r'0{5,}|1{5,}')
+FINDER_LIKE = ("10111010000", "00001011101")
+
+qr_cache_total = ditto_metrics.counter("ditto_qr_cache_total", "QR code images served, by whether the cache had them")
+
+
+def gf_multiply(x, y):
+    """Multiply in GF(2^8) modulo the QR polynomial x^8 + x^4 + x^3 + x^2 + 1"""
+    z = 0
+    for i in reversed(range(8)):
+        z = (z << 1) ^ ((z >> 7) * 0x11D)
+        z ^= ((y >> i) & 1) * x
+    return z
+
+
+def rs_divisor(degree):
+    result = [0] * (degree - 1) + [1]
+    root = 1
+    for _ in range(degree):
+        for j in range(degree):
+            result[j] = gf_multiply(result[j], root)
+            if j + 1 < degree:
+                result[j] ^= result[j + 1]
+        root = gf_multiply(root, 0x02)
+    return result
+
+
+def rs_remainder(data, divisor):
+    result = [0] * len(divisor)
+    for b in data:
+        factor = b ^ result.pop(0)
+        result.append(0)
+        for i, coefficient in enumerate(divisor):
+            result[i] ^= gf_multiply(coefficient, factor)
+    return result
+
+
+def raw_data_modules(version):
+    """Modules left for data and error correction once the function patterns are drawn"""
+    result = (16 * version + 128) * version + 64
+    if version >= 2:
+        num_align = version // 7 + 2
+        result -= (25 * num_align - 10) * num_align - 55
+        if version >= 7:
+            result -= 36
+    return result
+
+
+def data_codewords(version, level):
+    return raw_data_modules(version) // 8 - ECC_CODEWORDS_PER_BLOCK[level][version] * NUM_ERROR_CORRECTION_BLOCKS[level][version]
+
+
+def alignment_positions(version):
+    if version == 1:
+        return []
+    num_align = version // 7 + 2
+    step = (version * 8 + num_align * 3 + 5) // (num_align * 4 - 4) * 2
+    size = version * 4 + 17
+    return [6] + sorted(size - 7 - i * step for i in range(num_align - 1))
+
+
+def encode_data(data, level):
+    """Pick the smallest version for data in byte mode; return (version, data codewords)"""
+    for version in range(1, 41):
+        count_bits = 8 if version <= 9 else 16
+        capacity = data_codewords(version, level) * 8
+        if 4 + count_bits + len(data) * 8 <= capacity:
+            break
+    else:
+        raise ValueError("Text too long for a QR code")
+
+    bits = f"0100{len(data):0{count_bits}b}" + "".join(f"{b:08b}" for b in data)
+    bits += "0" * min(4, capacity - len(bits))
+    bits += "0" * (-len(bits) % 8)
+    codewords = [int(bits[i:i + 8], 2) for i in range(0, len(bits), 8)]
+    pad = (0xEC, 0x11)
+    codewords += [pad[i % 2] for i in range(capacity // 8 - len(codewords))]
+    return version, codewords
+
+
+def add_error_correction(codewords, version, level):
+    """Split into blocks, append each block's Reed-Solomon codewords and interleave them"""
+    num_blocks = NUM_ERROR_CORRECTION_BLOCKS[level][version]
+    ecc_len = ECC_CODEWORDS_PER_BLOCK[level][version]
+    raw_codewords = raw_data_modules(version) // 8
+    num_short = num_blocks - raw_codewords % num_blocks
+    short_len = raw_codewords // num_blocks
+    divisor = rs_divisor(ecc_len)
+    blocks = []
+    k = 0
+    for i in range(num_blocks):
+        block = codewords[k:k + short_len - ecc_len + (0 if i < num_short else 1)]
+        k += len(block)
+        ecc = rs_remainder(block, divisor)
+        if i < num_short:
+            block.append(0)  # placeholder so every block has the same length while interleaving
+        blocks.append(block + ecc)
+    return [
+        block[i]
+        for i in range(len(blocks[0]))
+        for j, block in enumerate(blocks)
+        if i != short_len - ecc_len or j >= num_short
+    ]
+
+
+class QrMatrix:
+    def __init__(self, version):
+        self.version = version
+        self.size = version * 4 + 17
+        self.modules = [[False] * self.size for _ in range(self.size)]
+        self.function = [[False] * self.size for _ in range(self.size)]
+
+    def set_function(self, x, y, dark):
+        self.modules[y][x] = dark
+        self.function[y][x] = True
+
+    def draw_function_patterns(self):
+        size = self.size
+        for i in range(size):
+            self.set_function(6, i, i % 2 == 0)
+            self.set_function(i, 6, i % 2 == 0)
+        for cx, cy in ((3, 3), (size - 4, 3), (3, size - 4)):
+            for dy in range(-4, 5):
+                for dx in range(-4, 5):
+                    x, y = cx + dx, cy + dy
+                    if 0 <= x < size and 0 <= y < size:
+                        self.set_function(x, y, max(abs(dx), abs(dy)) not in (2, 4))
+        positions = alignment_positions(self.version)
+        last = len(positions) - 1
+        for i, cx in enumerate(positions):
+            for j, cy in enumerate(positions):
+                # Skip the three that would overlap the finder patterns
+                if (i, j) in ((0, 0), (0, last), (last, 0)):
+                    continue
+                for dy in range(-2, 3):
+                    for dx in range(-2, 3):
+                        self.set_function(cx + dx, cy + dy, max(abs(dx), abs(dy)) != 1)
+        self.draw_format_bits(0, 0)  # reserve the format areas; redrawn once the mask is chosen
+        self.draw_version()
+
+    def draw_format_bits(self, format_bits, mask):
+        data = format_bits << 3 | mask
+        remainder = data
+        for _ in range(10):
+            remainder = (remainder << 1) ^ ((remainder >> 9) * 0x537)
+        bits = (data << 10 | remainder) ^ 0x5412
+        bit = lambda i: (bits >> i) & 1 != 0
+        size = self.size
+        for i in range(6):
+            self.set_function(8, i, bit(i))
+        self.set_function(8, 7, bit(6))
+        self.set_function(8, 8, bit(7))
+        self.set_function(7, 8, bit(8))
+        for i in range(9, 15):
+            self.set_function(14 - i, 8, bit(i))
+        for i in range(8):
+            self.set_function(size - 1 - i, 8, bit(i))
+        for i in range(8, 15):
+            self.set_function(8, size - 15 + i, bit(i))
+        self.set_function(8, size - 8, True)  # always dark
+
+    def draw_version(self):
+        if self.version < 7:
+            return
+        remainder = self.version
+        for _ in range(12):
+            remainder = (remainder << 1) ^ ((remainder >> 11) * 0x1F25)
+        bits = self.version << 12 | remainder
+        for i in range(18):
+            dark = (bits >> i) & 1 != 0
+            a, b = self.size - 11 + i % 3, i // 3
+            self.set_function(a, b, dark)
+            self.set_function(b, a, dark)
+
+    def draw_codewords(self, codewords):
+        """Place the bits in the zigzag order, two columns at a time from the bottom right"""
+        size = self.size
+        i = 0
+        total = len(codewords) * 8
+        right = size - 1
+        while right >= 1:
+            if right == 6:
+                right = 5  # skip the vertical timing pattern
+            upward = (right + 1) & 2 == 0
+            for vertical in range(size):
+                y = size - 1 - vertical if upward else vertical
+                for x in (right, right - 1):
+                    if not self.function[y][x] and i < total:
+                        self.modules[y][x] = (codewords[i >> 3] >> (7 - (i & 7))) & 1 != 0
+                        i += 1
+            right -= 2
+
+    def apply_mask(self, mask):
+        condition = MASKS[mask]
+        for y in range(self.size):
+            row, function = self.modules[y], self.function[y]
+            for x in range(self.size):
+                if not function[x] and condition(x, y):
+                    row[x] = not row[x]
+
+    def penalty(self):
+        """The standard's four penalty rules: runs, 2x2 blocks, finder-like patterns and balance"""
+        rows = ["".join("1" if dark else "0" for dark in row) for row in self.modules]
+        columns = ["".join(column) for column in zip(*rows)]
+        score = 0
+        for line in rows + columns:
+            score += sum(len(run) - 2 for run in RUN_RE.findall(line))
+            padded = "0000" + line + "0000"
+            score += 40 * sum(padded.count(pattern) for pattern in FINDER_LIKE)
+        for y in range(self.size - 1):
+            upper, lower = rows[y], rows[y + 1]
+            for x in range(self.size - 1):
+                if upper[x] == upper[x + 1] == lower[x] == lower[x + 1]:
+                    score += 3
+        dark = sum(row.count("1") for row in rows)
+        total = self.size * self.size
+        score += 10 * ((abs(dark * 20 - total * 10) + total - 1) // total - 1)
+        return score
+
+
+def encode(text, level='M'):
+    """Encode text as a QR code; returns the module matrix as rows of booleans (True is dark)"""
+    level_index, format_bits = ECC_LEVELS[level]
+    version, codewords = encode_data(text.encode('utf-8'), level_index)
+    matrix = QrMatrix(version)
+    matrix.draw_function_patterns()
+    matrix.draw_codewords(add_error_correction(codewords, version, level_index))
+
+    best_mask, best_score = 0, None
+    for mask in range(len(MASKS)):
+        matrix.apply_mask(mask)
+        matrix.draw_format_bits(format_bits, mask)
+        score = matrix.penalty()
+        if best_score is None or score < best_score:
+            best_mask, best_score = mask, score
+        matrix.apply_mask(mask)  # masks are XOR, so applying again undoes it
+    matrix.apply_mask(best_mask)
+    matrix.draw_format_bits(format_bits, best_mask)
+    return matrix.modules
+
+
+def png_chunk(kind, data):
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+
+def render_png(modules, scale=DEFAULT_SCALE, border=DEFAULT_BORDER):
+    """1-bit greyscale PNG of a module matrix, scale pixels per module with a light border"""
+    width = (len(modules) + 2 * border) * scale
+    light = [False] * border
+    blank = [False] * len(modules)
+    raw = []
+    for row in [blank] * border + modules + [blank] * border:
+        bits = "".join("0" if dark else "1" for dark in light + row + light for _ in range(scale))
+        bits += "1" * (-len(bits) % 8)
+        line = b"\x00" + int(bits, 2).to_bytes(len(bits) // 8, 'big')
+        raw.extend([line] * scale)
+    return (b"\x89PNG\r\n\x1a\n"
+            + png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, width, 1, 0, 0, 0, 0))
+            + png_chunk(b"IDAT", zlib.compress(b"".join(raw), 9))
+            + png_chunk(b"IEND", b""))
+
+
+def qr_png(text, scale=DEFAULT_SCALE, border=DEFAULT_BORDER, level='M'):
+    """PNG bytes of text's QR code, from the cache when it has been rendered before"""
+    key = (text, scale, border, level)
+    png = qr_cache.get(key)
+    if png is not None:
+        qr_cache_total.inc(result="hit")
+        return png
+    qr_cache_total.inc(result="miss")
+    png = render_png(encode(text, level), scale, border)
+    qr_cache.set(key, png)
+    return png
+
+
+def qr_png_base64(text, scale=DEFAULT_SCALE, border=DEFAULT_BORDER, level='M'):
+    return base64.b64encode(qr_png(text, scale, border, level)).decode('ascii')
+
+
+qr_cache = LRUCache(QR_CACHE_SIZE)
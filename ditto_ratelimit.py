@@ -0,0 +1,135 @@
+"""
+Client-side rate limiting for API calls.
+
+Every request takes a token from one process-wide bucket and from its session's bucket,
+waiting if either is empty. Interactive requests may run up to one burst ahead of the
+buckets without waiting, so a queued bulk job never delays a click; the tokens they
+borrow push back the background and bulk requests that reserve after them, and a user
+clicking faster than that waits like everyone else. All requests respect any pause the
+API asked for. A 429 (honouring Retry-After) or an exhausted
+X-RateLimit-Remaining/RateLimit-Remaining quota pauses the global bucket until the
+API is ready again, so one throttled burst doesn't keep hammering the backend.
+"""
+import asyncio
+import os
+import time
+from datetime import datetime, timezone
+
+import ditto_metrics
+
+GLOBAL_RATE = float(os.environ.get("DITTO_RATE_LIMIT", "20"))  # requests/second for the whole process, 0 disables
+GLOBAL_BURST = float(os.environ.get("DITTO_RATE_BURST", "20"))
+SESSION_RATE = float(os.environ.get("DITTO_SESSION_RATE_LIMIT", "8"))  # requests/second per session, 0 disables
+SESSION_BURST = float(os.environ.get("DITTO_SESSION_RATE_BURST", "8"))
+DEFAULT_THROTTLE_BACKOFF = 1.0  # seconds to pause after a 429 without Retry-After
+MAX_RETRY_AFTER = 30  # longer Retry-After values are reported to the user instead of waited out
+RATE_LIMIT_RETRIES = 2
+RATE_LIMIT_HEADERS = ('retry-after', 'x-ratelimit-remaining', 'x-ratelimit-reset', 'ratelimit-remaining', 'ratelimit-reset')
+
+queue_depth = ditto_metrics.gauge("ditto_ratelimit_queue_depth", "Requests currently waiting for a rate-limit token")
+wait_seconds = ditto_metrics.histogram("ditto_ratelimit_wait_seconds", "Time requests waited for a rate-limit token")
+throttled_total = ditto_metrics.counter("ditto_ratelimit_throttled_total", "429 responses received from the API")
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def reserve(self, now, borrow=0.0):
+        """
+        Take one token, returning how long the caller has to wait before using it.
+        borrow is how many tokens the caller may run ahead of the bucket without waiting.
+        """
+        if self.rate <= 0:
+            return 0.0
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+        self.tokens -= 1
+        debt = max(0.0, -self.tokens - borrow) / self.rate
+        return max(0.0, self.updated - now) + debt
+
+    def block_until(self, until):
+        """Hand out no tokens before until (a time.monotonic() value)"""
+        if until > self.updated:
+            self.tokens = min(self.tokens, 1.0)
+            self.updated = until
+
+
+def parse_retry_after(value):
+    """Retry-After is either delay-seconds or an HTTP date"""
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    from email.utils import parsedate_to_datetime
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_reset(value):
+    """Rate-limit reset headers are seconds from now or a Unix timestamp"""
+    try:
+        reset = float(value)
+    except (TypeError, ValueError):
+        return None
+    if reset > 1e9:
+        reset -= time.time()
+    return max(0.0, reset)
+
+
+class RateLimiter:
+    def __init__(self, rate=GLOBAL_RATE, burst=GLOBAL_BURST):
+        self.bucket = TokenBucket(rate, burst)
+
+    async def acquire(self, session_bucket=None, interactive=False):
+        now = time.monotonic()
+        delay = self.bucket.reserve(now, self.bucket.capacity if interactive else 0.0)
+        if session_bucket is not None:
+            delay = max(delay, session_bucket.reserve(now, session_bucket.capacity if interactive else 0.0))
+        wait_seconds.observe(delay)
+        if delay > 0:
+            queue_depth.inc()
+            try:
+                await asyncio.sleep(delay)
+            finally:
+                queue_depth.dec()
+
+    def observe(self, response):
+        """
+        Apply rate-limit information from a response.
+        Returns the seconds to wait before retrying a throttled request, or None if it wasn't throttled.
+        """
+        headers = response.get('headers') or {}
+        now = time.monotonic()
+        if response['status'] == 429:
+            throttled_total.inc()
+            delay = parse_retry_after(headers.get('retry-after'))
+            if delay is None:
+                delay = DEFAULT_THROTTLE_BACKOFF
+            self.bucket.block_until(now + delay)
+            return delay
+
+        remaining = headers.get('x-ratelimit-remaining', headers.get('ratelimit-remaining'))
+        reset = parse_reset(headers.get('x-ratelimit-reset', headers.get('ratelimit-reset')))
+        try:
+            exhausted = remaining is not None and float(remaining) <= 0
+        except ValueError:
+            exhausted = False
+        if exhausted and reset:
+            self.bucket.block_until(now + reset)
+        return None
+
+
+def session_bucket():
+    return TokenBucket(SESSION_RATE, SESSION_BURST)
+
+
+rate_limiter = RateLimiter()
@@ -0,0 +1,106 @@
+"""
+Priority classes for outgoing API requests.
+
+Each class has its own pool of concurrent request slots, so a bulk job or background
+refresh can fill its pool without ever making an interactive click wait for a slot.
+Limits come from DITTO_SCHEDULER_LIMITS, e.g. "interactive=16,background=4,bulk=8".
+"""
+import asyncio
+import os
+from collections import deque
+from time import monotonic
+
+import ditto_metrics
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+BULK = "bulk"
+
+DEFAULT_LIMITS = {INTERACTIVE: 16, BACKGROUND: 4, BULK: 8}
+
+queue_seconds = ditto_metrics.histogram("ditto_scheduler_queue_seconds", "Time requests waited for a slot in their priority class")
+waiting_requests = ditto_metrics.gauge("ditto_scheduler_waiting", "Requests waiting for a slot, by priority class")
+active_requests = ditto_metrics.gauge("ditto_scheduler_active", "Requests in flight, by priority class")
+
+
+def parse_limits(value):
+    limits = dict(DEFAULT_LIMITS)
+    for item in (value or "").split(","):
+        name, _, limit = item.partition("=")
+        if name.strip() in limits and limit.strip().isdigit():
+            limits[name.strip()] = max(1, int(limit))
+    return limits
+
+
+class PriorityClass:
+    def __init__(self, name, limit):
+        self.name = name
+        self.limit = limit
+        self.active = 0
+        self.waiters = deque()
+
+
+class Slot:
+    """Async context manager holding one request slot"""
+    def __init__(self, scheduler, priority):
+        self.scheduler = scheduler
+        self.priority = priority
+
+    async def __aenter__(self):
+        await self.scheduler.acquire(self.priority)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.scheduler.release(self.priority)
+        return False
+
+
+class RequestScheduler:
+    def __init__(self, limits=None):
+        limits = limits or DEFAULT_LIMITS
+        self.classes = {name: PriorityClass(name, limit) for name, limit in limits.items()}
+
+    def slot(self, priority=INTERACTIVE):
+        return Slot(self, priority if priority in self.classes else INTERACTIVE)
+
+    async def acquire(self, priority):
+        request_class = self.classes[priority]
+        started = monotonic()
+        if request_class.active < request_class.limit and not request_class.waiters:
+            request_class.active += 1
+        else:
+            waiter = asyncio.get_running_loop().create_future()
+            request_class.waiters.append(waiter)
+            waiting_requests.inc(priority=priority)
+            try:
+                # release() hands its slot straight to the first waiter
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    self.release(priority)
+                elif waiter in request_class.waiters:
+                    request_class.waiters.remove(waiter)
+                raise
+            finally:
+                waiting_requests.dec(priority=priority)
+        queue_seconds.observe(monotonic() - started, priority=priority)
+        active_requests.set(request_class.active, priority=priority)
+
+    def release(self, priority):
+        request_class = self.classes[priority]
+        while request_class.waiters:
+            waiter = request_class.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        request_class.active -= 1
+        active_requests.set(request_class.active, priority=priority)
+
+    def stats(self):
+        return {
+            name: {'limit': c.limit, 'active': c.active, 'waiting': len(c.waiters), 'queue_p95': queue_seconds.quantile(0.95, priority=name)}
+            for name, c in self.classes.items()
+        }
+
+
+scheduler = RequestScheduler(parse_limits(os.environ.get("DITTO_SCHEDULER_LIMITS")))
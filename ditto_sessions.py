@@ -0,0 +1,129 @@
+"""
+Server-side housekeeping for Flet sessions.
+
+Every page registers here and counts as active whenever it updates. A session with no
+activity for DITTO_SESSION_IDLE_TIMEOUT seconds (DITTO_SESSION_DISCONNECTED_TIMEOUT once
+its socket has dropped) is reaped: its on_reap callback releases the control tree and
+SessionData, and the session stays open so the user can start again. The budgets below
+cap what a single session can hold.
+"""
+import asyncio
+import os
+from time import monotonic
+
+import ditto_metrics
+
+IDLE_TIMEOUT = float(os.environ.get("DITTO_SESSION_IDLE_TIMEOUT", "900"))  # 0 disables reaping
+DISCONNECTED_TIMEOUT = float(os.environ.get("DITTO_SESSION_DISCONNECTED_TIMEOUT", "60"))
+IDLE_AFTER = 60  # seconds without activity before a live session counts as idle
+REAP_INTERVAL = 15
+
+# Per-session budgets
+MAX_INFLIGHT_REQUESTS = max(1, int(os.environ.get("DITTO_SESSION_MAX_INFLIGHT", "16")))
+MAX_ALIAS_TOKENS = max(1, int(os.environ.get("DITTO_SESSION_MAX_ALIASES", "200")))
+MAX_OVERLAY_CONTROLS = 8
+
+sessions_gauge = ditto_metrics.gauge("ditto_sessions", "Registered sessions by state: live, idle or reaped")
+reaped_total = ditto_metrics.counter("ditto_sessions_reaped_total", "Sessions whose state was released by the idle reaper")
+
+
+class TrackedSession:
+    def __init__(self, page, on_reap):
+        self.page = page
+        self.on_reap = on_reap
+        self.last_active = monotonic()
+        self.connected = True
+        self.reaped = False
+        self.reaping = False
+
+    def state(self, now):
+        if self.reaped:
+            return "reaped"
+        return "live" if self.connected and now - self.last_active < IDLE_AFTER else "idle"
+
+    def expired(self, now):
+        timeout = IDLE_TIMEOUT if self.connected else min(IDLE_TIMEOUT, DISCONNECTED_TIMEOUT)
+        return not self.reaped and now - self.last_active >= timeout
+
+
+class SessionRegistry:
+    def __init__(self):
+        self.sessions = {}
+        self.reaper_task = None
+
+    def register(self, page, on_reap):
+        """Track a page; on_reap(page) is called when it has been idle too long"""
+        session = self.sessions[id(page)] = TrackedSession(page, on_reap)
+        update = page.update
+
+        def touching_update(*controls):
+            if not session.reaping:
+                session.last_active = monotonic()
+                session.reaped = False
+                session.connected = True
+            return update(*controls)
+
+        page.update = touching_update
+        self.publish()
+        self.start_reaper()
+        return session
+
+    def disconnected(self, page):
+        session = self.sessions.get(id(page))
+        if session:
+            session.connected = False
+            self.publish()
+
+    def unregister(self, page):
+        self.sessions.pop(id(page), None)
+        self.publish()
+
+    def reap_idle(self, now=None):
+        now = monotonic() if now is None else now
+        reaped = 0
+        for session in list(self.sessions.values()):
+            if not session.expired(now):
+                continue
+            session.reaping = True
+            try:
+                session.on_reap(session.page)
+            except Exception:
+                # A session whose socket is gone can fail to update; its state is released regardless
+                pass
+            finally:
+                session.reaping = False
+            session.reaped = True
+            reaped += 1
+        if reaped:
+            reaped_total.inc(reaped)
+        self.publish()
+        return reaped
+
+    def counts(self):
+        now = monotonic()
+        counts = {'live': 0, 'idle': 0, 'reaped': 0}
+        for session in self.sessions.values():
+            counts[session.state(now)] += 1
+        return counts
+
+    def publish(self):
+        for state, count in self.counts().items():
+            sessions_gauge.set(count, state=state)
+
+    def start_reaper(self):
+        if IDLE_TIMEOUT <= 0 or (self.reaper_task is not None and not self.reaper_task.done()):
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+
+        async def reap_forever():
+            while True:
+                await asyncio.sleep(REAP_INTERVAL)
+                self.reap_idle()
+
+        self.reaper_task = loop.create_task(reap_forever())
+
+
+sessions = SessionRegistry()
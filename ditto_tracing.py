@@ -0,0 +1,269 @@
+"""
+Lightweight span tracing for Ditto, from UI event down to each API call.
+
+Off unless DITTO_TRACE is set:
+
+    DITTO_TRACE=file  DITTO_TRACE_FILE=traces.jsonl   one JSON span per line
+    DITTO_TRACE=otlp  DITTO_TRACE_OTLP_ENDPOINT=http://localhost:4318/v1/traces
+    DITTO_TRACE_SAMPLE=0.1                             fraction of root spans (UI events) kept
+
+The sampling decision is made once per root span and inherited by its children, so a
+sampled trace is always complete. Spans are exported in batches from a background
+thread and never block the event loop.
+"""
+import atexit
+import functools
+import inspect
+import json
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from contextvars import ContextVar
+
+TRACE_BATCH_SIZE = 256
+TRACE_FLUSH_INTERVAL = 2  # seconds between exporter flushes
+
+current_span = ContextVar('ditto_current_span', default=None)
+
+
+class Span:
+    __slots__ = ('name', 'trace_id', 'span_id', 'parent_id', 'sampled', 'attributes', 'start_ns', 'error', 'token')
+
+    def __init__(self, name, parent, sampled, attributes):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else f"{random.getrandbits(128):032x}"
+        self.parent_id = parent.span_id if parent else None
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.sampled = sampled
+        self.attributes = attributes
+        self.start_ns = 0
+        self.error = None
+        self.token = None
+
+    def set(self, key, value):
+        if self.sampled:
+            self.attributes[key] = value
+
+    def __enter__(self):
+        self.token = current_span.set(self)
+        self.start_ns = time.time_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end_ns = time.time_ns()
+        current_span.reset(self.token)
+        if exc_type is not None:
+            self.error = f"{exc_type.__name__}: {exc}"
+        if self.sampled and tracer.exporter:
+            tracer.exporter.submit(self, end_ns)
+        return False
+
+
+class NoopSpan:
+    """Returned when tracing is off, so instrumented code pays almost nothing"""
+    def set(self, key, value):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP_SPAN = NoopSpan()
+
+
+class Tracer:
+    def __init__(self, exporter=None, sample_rate=1.0):
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+
+    def span(self, name, **attributes):
+        if self.exporter is None:
+            return NOOP_SPAN
+        parent = current_span.get()
+        sampled = parent.sampled if parent else random.random() < self.sample_rate
+        return Span(name, parent, sampled, attributes if sampled else {})
+
+
+def span_record(span, end_ns):
+    return {
+        'trace_id': span.trace_id,
+        'span_id': span.span_id,
+        'parent_id': span.parent_id,
+        'name': span.name,
+        'start': span.start_ns / 1e9,
+        'duration_ms': (end_ns - span.start_ns) / 1e6,
+        'attributes': span.attributes,
+        'error': span.error,
+    }
+
+
+def otlp_value(value):
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def otlp_span(span, end_ns):
+    result = {
+        'traceId': span.trace_id,
+        'spanId': span.span_id,
+        'name': span.name,
+        'kind': 1,
+        'startTimeUnixNano': str(span.start_ns),
+        'endTimeUnixNano': str(end_ns),
+        'attributes': [{'key': key, 'value': otlp_value(value)} for key, value in span.attributes.items()],
+        'status': {'code': 2, 'message': span.error} if span.error else {'code': 1},
+    }
+    if span.parent_id:
+        result['parentSpanId'] = span.parent_id
+    return result
+
+
+class BatchExporter:
+    """Queues finished spans and writes them in batches from a daemon thread"""
+    def __init__(self):
+        self.queue = queue.SimpleQueue()
+        self.thread = threading.Thread(target=self.run, name="ditto-trace-exporter", daemon=True)
+        self.thread.start()
+        atexit.register(self.flush)
+
+    def submit(self, span, end_ns):
+        self.queue.put((span, end_ns))
+
+    def drain(self, block):
+        batch = []
+        try:
+            if block:
+                batch.append(self.queue.get(timeout=TRACE_FLUSH_INTERVAL))
+            while len(batch) < TRACE_BATCH_SIZE:
+                batch.append(self.queue.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    def run(self):
+        while True:
+            batch = self.drain(block=True)
+            if batch:
+                self.export_safely(batch)
+
+    def flush(self):
+        batch = self.drain(block=False)
+        while batch:
+            self.export_safely(batch)
+            batch = self.drain(block=False)
+
+    def export_safely(self, batch):
+        try:
+            self.export(batch)
+        except Exception as ex:
+            # ditto_logging imports this module, so it is imported here rather than at the top
+            from ditto_logging import log_error
+            log_error("trace export failed", ex, exporter=type(self).__name__, spans=len(batch))
+
+    def export(self, batch):
+        raise NotImplementedError
+
+
+class FileExporter(BatchExporter):
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        super().__init__()
+
+    def export(self, batch):
+        lines = "".join(json.dumps(span_record(span, end_ns)) + "\n" for span, end_ns in batch)
+        with self.lock, open(self.path, 'a', encoding='utf-8') as f:
+            f.write(lines)
+
+
+class OtlpExporter(BatchExporter):
+    """Posts OTLP/HTTP JSON to a collector's /v1/traces endpoint"""
+    def __init__(self, endpoint, service_name="ditto"):
+        self.endpoint = endpoint
+        self.service_name = service_name
+        super().__init__()
+
+    def export(self, batch):
+        import urllib.request
+        payload = {
+            'resourceSpans': [{
+                'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': self.service_name}}]},
+                'scopeSpans': [{
+                    'scope': {'name': 'ditto'},
+                    'spans': [otlp_span(span, end_ns) for span, end_ns in batch],
+                }],
+            }]
+        }
+        req = urllib.request.Request(
+            self.endpoint,
+            data=json.dumps(payload).encode('utf-8'),
+            headers={'Content-Type': 'application/json'},
+            method="POST"
+        )
+        with urllib.request.urlopen(req, timeout=5) as response:
+            response.read()
+
+
+def configure(mode=None, sample_rate=None, path=None, endpoint=None):
+    """(Re)configure the global tracer; arguments default to the DITTO_TRACE* environment"""
+    mode = (mode if mode is not None else os.environ.get("DITTO_TRACE", "")).lower()
+    if sample_rate is None:
+        sample_rate = float(os.environ.get("DITTO_TRACE_SAMPLE", "1.0"))
+    tracer.sample_rate = sample_rate
+    # No background threads in the browser build
+    if 'pyodide' in sys.modules or mode in ("", "off", "0"):
+        tracer.exporter = None
+    elif mode == "otlp":
+        tracer.exporter = OtlpExporter(endpoint or os.environ.get("DITTO_TRACE_OTLP_ENDPOINT", "http://localhost:4318/v1/traces"))
+    else:
+        tracer.exporter = FileExporter(path or os.environ.get("DITTO_TRACE_FILE", "traces.jsonl"))
+    return tracer
+
+
+def span(name, **attributes):
+    """Context manager timing a block as a child of the current span"""
+    return tracer.span(name, **attributes)
+
+
+def traced(name):
+    """Decorator for event handlers and helpers, sync or async"""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with tracer.span(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with tracer.span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def instrument_page(page):
+    """Time every page.update() call on a Flet page"""
+    update = page.update
+
+    def traced_update(*controls):
+        with tracer.span("page.update", controls=len(controls)):
+            return update(*controls)
+
+    page.update = traced_update
+
+
+tracer = Tracer()
+configure()
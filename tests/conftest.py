@@ -0,0 +1,12 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "tools"))
+
+# Tests never write to the real link history or logs, or trace
+os.environ.setdefault("DITTO_HISTORY_FILE", os.devnull)
+os.environ.setdefault("DITTO_HISTORY_DIR", "off")
+os.environ.setdefault("DITTO_LOG", "off")
+os.environ.setdefault("DITTO_TRACE", "off")
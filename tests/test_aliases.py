@@ -0,0 +1,107 @@
+import asyncio
+
+import pytest
+from mock_backend import MockBackend
+
+import ditto_api
+from ditto_api import LRUCache, SessionData, check_alias_available, find_free_aliases, suggest_aliases
+from ditto_ratelimit import RateLimiter
+
+
+class Context:
+    def __init__(self):
+        self.session_data = SessionData()
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    backend = MockBackend()
+    base_url = backend.start()
+    monkeypatch.setattr(ditto_api, "API_BASE_URL", base_url)
+    monkeypatch.setattr(ditto_api, "transport", None)
+    monkeypatch.setattr(ditto_api, "rate_limiter", RateLimiter(rate=0))
+    monkeypatch.setattr(ditto_api, "alias_cache", LRUCache(16, 60))
+    for alias in ("promo", "promo1", "paused"):
+        backend.aliases[alias] = {'url': "https://example.com", 'url_pass': "", 'url_hits': 0,
+                                  'url_state': alias != "paused", 'url_created_at': "2025-01-01T00:00:00Z"}
+    yield backend
+    backend.stop()
+
+
+def test_lru_cache_evicts_the_least_recently_used():
+    cache = LRUCache(2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c"), len(cache)) == (1, 3, 2)
+
+
+def test_lru_cache_entries_expire(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ditto_api, "monotonic", clock)
+    cache = LRUCache(4, ttl=10)
+    cache.set("a", False)
+    clock.now += 10
+    assert cache.get("a") is False
+    clock.now += 1
+    assert cache.get("a", "gone") == "gone"
+    assert len(cache) == 0
+
+
+def test_alias_check_tells_free_from_taken(backend):
+    assert asyncio.run(check_alias_available(Context(), "summer-sale")) is True
+    assert asyncio.run(check_alias_available(Context(), "promo")) is False
+    # A paused or password-less alias is still taken
+    assert asyncio.run(check_alias_available(Context(), "paused")) is False
+
+
+def test_alias_check_never_visits_the_short_link(backend):
+    asyncio.run(check_alias_available(Context(), "promo"))
+    asyncio.run(find_free_aliases(Context(), "promo"))
+    assert backend.aliases["promo"]['url_hits'] == 0
+    assert backend.aliases["promo1"]['url_hits'] == 0
+
+
+def test_alias_check_answers_from_the_cache(backend):
+    asyncio.run(check_alias_available(Context(), "promo"))
+    requests = backend.requests
+    assert asyncio.run(check_alias_available(Context(), "promo")) is False
+    assert backend.requests == requests
+
+
+def test_unknown_answers_arent_cached(monkeypatch):
+    class DownTransport:
+        async def send(self, url, method, data, forward):
+            return {'ok': False, 'status': 503, 'body': {}, 'headers': {}}
+
+    monkeypatch.setattr(ditto_api, "transport", DownTransport())
+    monkeypatch.setattr(ditto_api, "rate_limiter", RateLimiter(rate=0))
+    monkeypatch.setattr(ditto_api, "alias_cache", LRUCache(16, 60))
+    assert asyncio.run(check_alias_available(Context(), "promo")) is None
+    assert len(ditto_api.alias_cache) == 0
+
+
+def test_suggestions_skip_aliases_known_to_be_taken(monkeypatch):
+    monkeypatch.setattr(ditto_api, "alias_cache", LRUCache(16, 60))
+    ditto_api.alias_cache.set("promo1", False)
+    suggestions = suggest_aliases("promo")
+    assert "promo" not in suggestions and "promo1" not in suggestions
+    assert "promo2" in suggestions and "my-promo" in suggestions
+    assert len(suggestions) == len(set(suggestions))
+
+
+def test_only_free_suggestions_are_offered(backend):
+    backend.aliases["my-promo"] = dict(backend.aliases["promo"])
+    free = asyncio.run(find_free_aliases(Context(), "promo", limit=10))
+    assert free and "promo1" not in free and "my-promo" not in free
+    assert all(candidate not in backend.aliases for candidate in free)
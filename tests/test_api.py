@@ -0,0 +1,156 @@
+import asyncio
+import time
+
+import pytest
+
+import ditto_api
+from ditto_api import SessionData, make_request, send_create
+from ditto_ratelimit import RateLimiter, TokenBucket
+from ditto_scheduler import BACKGROUND, BULK, INTERACTIVE, RequestScheduler
+
+REQUEST_SECONDS = 0.05
+
+
+class SlowTransport:
+    """Answers every request after REQUEST_SECONDS, recording when each priority finished"""
+    def __init__(self):
+        self.sent = 0
+
+    async def send(self, url, method, data, forward):
+        self.sent += 1
+        await asyncio.sleep(REQUEST_SECONDS)
+        return {'ok': True, 'status': 200, 'body': {}, 'headers': {}}
+
+
+class LostCreateTransport:
+    """The first create times out after being applied, so the resend finds the alias taken"""
+    def __init__(self):
+        self.creates = 0
+
+    async def send(self, url, method, data, forward):
+        path = url[len(ditto_api.API_BASE_URL):]
+        if path == "/create":
+            self.creates += 1
+            return {'ok': False, 'status': 504 if self.creates == 1 else 409, 'body': {}, 'headers': {}}
+        if path == "/login":
+            return {'ok': True, 'status': 200, 'body': {'access_token': "token"}, 'headers': {}}
+        return {'ok': True, 'status': 200, 'body': {'data': {'url': "https://example.com"}}, 'headers': {}}
+
+
+class Context:
+    def __init__(self):
+        self.session_data = SessionData()
+        self.session_data.rate_bucket = TokenBucket(0, 0)
+
+
+@pytest.fixture
+def fake_backend(monkeypatch):
+    transport = SlowTransport()
+    monkeypatch.setattr(ditto_api, "transport", transport)
+    monkeypatch.setattr(ditto_api, "rate_limiter", RateLimiter(rate=0))
+    monkeypatch.setattr(ditto_api, "scheduler", RequestScheduler({INTERACTIVE: 16, BACKGROUND: 2, BULK: 2}))
+    return transport
+
+
+def test_queued_bulk_requests_dont_block_the_sessions_clicks(fake_backend):
+    async def run():
+        page = Context()
+        bulk = [asyncio.ensure_future(make_request(page, f"{ditto_api.API_BASE_URL}/bulk/{i}", "POST", priority=BULK)) for i in range(40)]
+        await asyncio.sleep(0)
+        started = time.monotonic()
+        await make_request(page, f"{ditto_api.API_BASE_URL}/details", "POST")
+        click_seconds = time.monotonic() - started
+        await asyncio.gather(*bulk)
+        return click_seconds
+
+    # 40 bulk requests through 2 bulk slots take a second; the click must not wait for them
+    assert asyncio.run(run()) < REQUEST_SECONDS * 4
+    assert fake_backend.sent == 41
+
+
+@pytest.fixture
+def lost_create(fake_backend, monkeypatch):
+    monkeypatch.setattr(ditto_api, "transport", LostCreateTransport())
+    monkeypatch.setattr(ditto_api, "CREATE_RETRY_DELAY", 0)
+
+
+def test_lost_create_without_short_url_base_leaves_the_link_unknown(lost_create, monkeypatch):
+    monkeypatch.setattr(ditto_api, "SHORT_URL_BASE", "")
+    response = asyncio.run(send_create(Context(), ("https://example.com", "promo", "secret"), False))
+    assert response['ok']
+    assert "short_url" not in response['body']
+
+
+def test_lost_create_builds_the_link_on_the_short_url_base(lost_create, monkeypatch):
+    monkeypatch.setattr(ditto_api, "SHORT_URL_BASE", "https://sho.rt")
+    response = asyncio.run(send_create(Context(), ("https://example.com", "summer sale", "secret"), False))
+    assert response['body']['short_url'] == "https://sho.rt/summer%20sale"
+
+
+@pytest.fixture
+def create_headers(fake_backend, monkeypatch):
+    """Headers of every /create sent to the network; each one times out"""
+    sent = []
+
+    async def send_network(page, url, method="GET", data=None, timeout=10, auth_token=None, follow_redirects=True, headers=None):
+        sent.append(headers)
+        return {'ok': False, 'status': 504, 'body': {}, 'headers': {}}
+
+    monkeypatch.setattr(ditto_api, "transport", None)
+    monkeypatch.setattr(ditto_api, "send_network", send_network)
+    monkeypatch.setattr(ditto_api, "CREATE_RETRY_DELAY", 0)
+    return sent
+
+
+def test_idempotency_header_is_off_by_default(create_headers, monkeypatch):
+    monkeypatch.setattr(ditto_api, "IDEMPOTENCY_HEADER", "")
+    context = Context()
+    submission = ("https://example.com", "promo", "secret")
+    asyncio.run(send_create(context, submission, False))
+    assert create_headers == [None] * (ditto_api.CREATE_RETRIES + 1)
+    # The outcome is still unknown, so a resubmit will check whether the alias is already ours
+    assert submission in context.session_data.create_keys
+
+
+def test_resends_reuse_the_idempotency_key(create_headers, monkeypatch):
+    monkeypatch.setattr(ditto_api, "IDEMPOTENCY_HEADER", "Idempotency-Key")
+    context = Context()
+    submission = ("https://example.com", "promo", "secret")
+    asyncio.run(send_create(context, submission, False))
+    asyncio.run(send_create(context, submission, False))
+    keys = {headers['Idempotency-Key'] for headers in create_headers}
+    assert len(create_headers) == 2 * (ditto_api.CREATE_RETRIES + 1)
+    assert keys == {context.session_data.create_keys[submission]}
+
+
+class ThrottlingTransport:
+    """Throttles the first request with Retry-After: retry_after, then answers normally"""
+    def __init__(self, retry_after):
+        self.retry_after = retry_after
+        self.sent = 0
+
+    async def send(self, url, method, data, forward):
+        self.sent += 1
+        if self.sent == 1:
+            return {'ok': False, 'status': 429, 'body': {}, 'headers': {'retry-after': self.retry_after}}
+        return {'ok': True, 'status': 200, 'body': {}, 'headers': {}}
+
+
+def test_throttled_request_is_retried_after_retry_after(fake_backend, monkeypatch):
+    transport = ThrottlingTransport("0.1")
+    monkeypatch.setattr(ditto_api, "transport", transport)
+    monkeypatch.setattr(ditto_api, "rate_limiter", RateLimiter(rate=100, burst=100))
+    started = time.monotonic()
+    response = asyncio.run(make_request(Context(), f"{ditto_api.API_BASE_URL}/details"))
+    assert response['ok']
+    assert transport.sent == 2
+    assert time.monotonic() - started >= 0.1
+
+
+def test_long_retry_after_is_reported_instead_of_waited_out(fake_backend, monkeypatch):
+    transport = ThrottlingTransport("600")
+    monkeypatch.setattr(ditto_api, "transport", transport)
+    response = asyncio.run(make_request(Context(), f"{ditto_api.API_BASE_URL}/details"))
+    assert response['status'] == 429
+    assert transport.sent == 1
+    assert "600 s" in response['body']['detail']
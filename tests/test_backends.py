@@ -0,0 +1,135 @@
+import asyncio
+
+import pytest
+
+import ditto_api
+import ditto_backends
+from ditto_backends import CLOSED, FAILURE_THRESHOLD, HALF_OPEN, OPEN, OPEN_SECONDS, BackendRouter, parse_base_urls
+
+A, B, C = "https://a.example", "https://b.example", "https://c.example"
+OK = {'ok': True, 'status': 200, 'body': {}, 'headers': {}}
+DOWN = {'ok': False, 'status': 0, 'body': {'detail': "Error: connection refused"}, 'headers': {}}
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # Only the module's own name is patched: patching time.monotonic would freeze asyncio
+    clock = Clock()
+    monkeypatch.setattr(ditto_backends, "monotonic", clock)
+    return clock
+
+
+def test_parse_base_urls():
+    assert parse_base_urls(" https://a.example/, https://b.example ,") == [A, B]
+    assert parse_base_urls("") == []
+
+
+def test_single_backend_is_not_routed():
+    router = BackendRouter([A])
+    assert router.route(f"{A}/details") == (f"{A}/details", None)
+
+
+def test_requests_go_to_the_fastest_healthy_backend(clock):
+    router = BackendRouter([A, B, C])
+    latencies = {A: 0.3, B: 0.1, C: 0.2}
+
+    async def probe(url):
+        clock.now += latencies[url]
+        return OK
+
+    asyncio.run(router.check(probe))
+    url, backend = router.route(f"{A}/details?x=1")
+    assert backend.url == B
+    assert url == f"{B}/details?x=1"
+    # URLs outside the API pass through untouched
+    assert router.route("https://example.com/x") == ("https://example.com/x", None)
+
+
+def test_tokens_stay_on_the_backend_that_issued_them(clock):
+    router = BackendRouter([A, B])
+    router.backends[1].observe_latency(0.01)
+    router.backends[0].observe_latency(1.0)
+    router.observe(router.backends[0], {'ok': True, 'status': 200, 'body': {'access_token': "t"}, 'headers': {}})
+    assert router.choose("t").url == A
+    assert router.choose().url == B
+
+
+def test_circuit_opens_after_consecutive_failures_and_recovers(clock):
+    router = BackendRouter([A, B])
+    a = router.backends[0]
+    for _ in range(FAILURE_THRESHOLD - 1):
+        router.observe(a, DOWN)
+    assert a.state == CLOSED
+    router.observe(a, {'ok': False, 'status': 503, 'body': {}, 'headers': {}})
+    assert a.state == OPEN
+    assert router.choose().url == B
+
+    clock.now += OPEN_SECONDS
+    assert a.available(clock.now) and a.state == HALF_OPEN
+    # One failure while half-open opens the circuit again; one success closes it
+    router.observe(a, DOWN)
+    assert a.state == OPEN
+    clock.now += OPEN_SECONDS
+    a.available(clock.now)
+    router.observe(a, OK)
+    assert a.state == CLOSED and a.failures == 0
+
+
+def test_client_errors_dont_count_as_failures(clock):
+    router = BackendRouter([A, B])
+    a = router.backends[0]
+    for _ in range(FAILURE_THRESHOLD * 2):
+        router.observe(a, {'ok': False, 'status': 404, 'body': {}, 'headers': {}})
+    assert a.state == CLOSED
+
+
+def test_with_every_circuit_open_the_longest_resting_backend_is_tried(clock):
+    router = BackendRouter([A, B])
+    for backend in reversed(router.backends):
+        for _ in range(FAILURE_THRESHOLD):
+            router.observe(backend, DOWN)
+        clock.now += 1
+    assert router.choose().url == B
+
+
+class DownTransport:
+    """Backend A refuses connections; every other backend answers"""
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, url, method, data, forward):
+        self.sent.append(url)
+        return DOWN if url.startswith(A) else OK
+
+
+@pytest.fixture
+def two_replicas(monkeypatch):
+    monkeypatch.setattr(ditto_api, "router", BackendRouter([A, B]))
+    transport = DownTransport()
+    monkeypatch.setattr(ditto_api, "transport", transport)
+    return transport
+
+
+class Context:
+    def __init__(self):
+        self.session_data = ditto_api.SessionData()
+
+
+def test_gets_fail_over_to_another_replica(two_replicas):
+    response = asyncio.run(ditto_api.send_routed(Context(), f"{A}/details"))
+    assert response['ok']
+    assert two_replicas.sent == [f"{A}/details", f"{B}/details"]
+
+
+def test_writes_are_not_resent_to_another_replica(two_replicas):
+    response = asyncio.run(ditto_api.send_routed(Context(), f"{A}/create", "POST"))
+    assert response['status'] == 0
+    assert two_replicas.sent == [f"{A}/create"]
@@ -0,0 +1,56 @@
+import asyncio
+
+from ditto_api import run_bulk
+
+
+def test_every_item_runs_once_within_the_concurrency_limit():
+    running, peak, seen = 0, 0, []
+
+    async def worker(item):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        seen.append(item)
+        return {'ok': True, 'status': 200, 'body': {}}
+
+    succeeded, failed = asyncio.run(run_bulk(range(20), worker, concurrency=3))
+    assert sorted(succeeded) == sorted(seen) == list(range(20))
+    assert failed == {}
+    assert peak == 3
+
+
+def test_failures_and_exceptions_are_reported_per_item():
+    async def worker(item):
+        if item == "gone":
+            return {'ok': False, 'status': 404, 'body': {'detail': "Alias not found"}}
+        if item == "broken":
+            raise ConnectionError("reset by peer")
+        if item == "bare":
+            return {'ok': False, 'status': 500, 'body': {}}
+        return {'ok': True, 'status': 200, 'body': {}}
+
+    succeeded, failed = asyncio.run(run_bulk(["fine", "gone", "broken", "bare"], worker))
+    assert succeeded == ["fine"]
+    assert failed == {'gone': "Alias not found", 'broken': "Error: reset by peer", 'bare': "Request failed"}
+
+
+def test_progress_counts_up_to_the_total():
+    progress = []
+
+    async def worker(item):
+        return {'ok': item % 2 == 0, 'status': 200, 'body': {}}
+
+    def on_progress(done, total, item, response):
+        progress.append((done, total))
+
+    asyncio.run(run_bulk(range(5), worker, concurrency=2, on_progress=on_progress))
+    assert progress == [(done, 5) for done in range(1, 6)]
+
+
+def test_no_items():
+    async def worker(item):
+        raise AssertionError("no items to work on")
+
+    assert asyncio.run(run_bulk([], worker)) == ([], {})
@@ -0,0 +1,100 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+from ditto_cassette import Cassette
+
+API = "https://api.example"
+
+
+def answer(body, status=200):
+    async def forward():
+        return {'ok': status < 400, 'status': status, 'body': body, 'headers': {}}
+    return forward
+
+
+async def never_forward():
+    raise AssertionError("replay must not reach the network")
+
+
+def record(path, exchanges):
+    cassette = Cassette(str(path), "record")
+    for url, method, data, body in exchanges:
+        asyncio.run(cassette.send(url, method, data, answer(body)))
+
+
+def replay(path, url, method="GET", data=None, speed=0):
+    return asyncio.run(Cassette(str(path), "replay", speed).send(url, method, data, never_forward))
+
+
+def test_recording_overwrites_the_cassette(tmp_path):
+    path = tmp_path / "flows.jsonl"
+    path.write_text("stale\n", encoding='utf-8')
+    record(path, [(f"{API}/login", "POST", {'url_code': "promo", 'url_pass': "secret"}, {'access_token': "t"})])
+    [entry] = [json.loads(line) for line in path.read_text(encoding='utf-8').splitlines()]
+    assert entry['method'] == "POST" and entry['path'] == "/login" and entry['endpoint'] == "POST /login"
+    # The request body is only kept as a hash
+    assert "secret" not in json.dumps(entry)
+
+
+def test_replay_matches_on_path_and_body(tmp_path):
+    path = tmp_path / "flows.jsonl"
+    record(path, [
+        (f"{API}/create", "POST", {'url_code': "one"}, {'short_url': "s/one"}),
+        (f"{API}/create", "POST", {'url_code': "two"}, {'short_url': "s/two"}),
+    ])
+    assert replay(path, f"{API}/create", "POST", {'url_code': "two"})['body'] == {'short_url': "s/two"}
+    # An unseen body falls back to the first recording for the endpoint
+    assert replay(path, f"{API}/create", "POST", {'url_code': "three"})['body'] == {'short_url': "s/one"}
+
+
+def test_repeated_requests_replay_in_order_then_repeat_the_last(tmp_path):
+    path = tmp_path / "flows.jsonl"
+    record(path, [(f"{API}/details", "GET", None, {'hits': hits}) for hits in (1, 2)])
+    cassette = Cassette(str(path), "replay", 0)
+    bodies = [asyncio.run(cassette.send(f"{API}/details", "GET", None, never_forward))['body']['hits'] for _ in range(3)]
+    assert bodies == [1, 2, 2]
+
+
+def test_short_link_probes_replay_for_any_alias(tmp_path):
+    path = tmp_path / "flows.jsonl"
+    record(path, [(f"{API}/promo", "GET", None, {'detail': "Not found"})])
+    assert replay(path, f"{API}/summer-sale")['body'] == {'detail': "Not found"}
+
+
+def test_unrecorded_request_fails_like_a_transport_error(tmp_path):
+    path = tmp_path / "flows.jsonl"
+    record(path, [])
+    response = replay(path, f"{API}/health")
+    assert response['status'] == 0
+    assert "GET /health" in response['body']['detail']
+
+
+def test_replayed_responses_are_copies(tmp_path):
+    path = tmp_path / "flows.jsonl"
+    record(path, [(f"{API}/details", "GET", None, {'data': {'url_hits': 1}})])
+    cassette = Cassette(str(path), "replay", 0)
+    first = asyncio.run(cassette.send(f"{API}/details", "GET", None, never_forward))
+    first['body']['data']['url_hits'] = 99
+    assert asyncio.run(cassette.send(f"{API}/details", "GET", None, never_forward))['body']['data']['url_hits'] == 1
+
+
+def test_replay_waits_the_recorded_latency_times_speed(tmp_path):
+    path = tmp_path / "flows.jsonl"
+    path.write_text(json.dumps({
+        'method': "GET", 'path': "/health", 'body_hash': None, 'endpoint': "GET /health", 'latency': 0.2,
+        'response': {'ok': True, 'status': 200, 'body': {}, 'headers': {}},
+    }) + "\n", encoding='utf-8')
+    started = time.monotonic()
+    replay(path, f"{API}/health", speed=0.5)
+    assert 0.1 <= time.monotonic() - started < 0.2
+    started = time.monotonic()
+    replay(path, f"{API}/health", speed=0)
+    assert time.monotonic() - started < 0.05
+
+
+def test_unknown_mode_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        Cassette(str(tmp_path / "flows.jsonl"), "rewind")
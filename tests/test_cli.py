@@ -0,0 +1,53 @@
+import argparse
+import asyncio
+
+import pytest
+
+import ditto_api
+import ditto_cli
+import ditto_history
+from ditto_history import LinkHistory
+
+
+class Recorder:
+    def __init__(self):
+        self.emitted = []
+
+    def emit(self, command, response, **fields):
+        self.emitted.append((response, fields))
+
+
+@pytest.fixture
+def history_file(tmp_path, monkeypatch):
+    path = tmp_path / "history.json"
+    monkeypatch.setattr(ditto_history, "LinkHistory", lambda: LinkHistory(str(path)))
+    monkeypatch.setattr(ditto_api, "SHORT_URL_BASE", "")
+    return path
+
+
+def run_qr(tmp_path, *aliases):
+    ctx = Recorder()
+    args = argparse.Namespace(aliases=list(aliases), all=False, output_dir=str(tmp_path / "qr"), scale=2)
+    asyncio.run(ditto_cli.cmd_qr(ctx, args))
+    return ctx.emitted
+
+
+def test_qr_encodes_the_short_url_the_api_returned(tmp_path, history_file):
+    LinkHistory(str(history_file)).add("https://example.com", "promo", "https://sho.rt/promo")
+    [(response, fields)] = run_qr(tmp_path, "promo")
+    assert response['ok']
+    assert (tmp_path / "qr" / "promo.png").read_bytes().startswith(b"\x89PNG")
+
+
+def test_qr_refuses_to_guess_an_unknown_short_url(tmp_path, history_file):
+    [(response, fields)] = run_qr(tmp_path, "promo")
+    assert not response['ok']
+    assert "DITTO_SHORT_URL_BASE" in response['body']['detail']
+    assert not (tmp_path / "qr").exists()
+
+
+def test_qr_falls_back_to_the_short_url_base(tmp_path, history_file, monkeypatch):
+    monkeypatch.setattr(ditto_api, "SHORT_URL_BASE", "https://sho.rt")
+    [(response, fields)] = run_qr(tmp_path, "promo")
+    assert response['ok']
+    assert fields['path'].endswith("promo.png")
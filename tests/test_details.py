@@ -0,0 +1,38 @@
+from datetime import datetime, timezone
+
+from ditto_api import AliasDetails
+
+DETAILS = {
+    'url': "https://example.com/landing",
+    'url_hits': 12,
+    'url_state': True,
+    'url_created_at': "2025-01-01T12:00:00Z",
+    'url_code': "promo",
+}
+
+
+def test_first_update_reports_every_field():
+    details = AliasDetails("promo")
+    assert details.update(DETAILS) == set(AliasDetails.FIELDS)
+    assert details.created_at == datetime(2025, 1, 1, 12, tzinfo=timezone.utc)
+
+
+def test_unchanged_fields_are_not_reported():
+    details = AliasDetails.from_api(DETAILS, "promo")
+    assert details.update(dict(DETAILS)) == set()
+    assert details.update({**DETAILS, 'url_hits': 13}) == {'hits'}
+    assert details.hits == 13
+
+
+def test_cleared_fields_are_reported_and_emptied():
+    details = AliasDetails.from_api(DETAILS, "promo")
+    assert details.update({**DETAILS, 'url': None, 'url_hits': None, 'url_state': None, 'url_created_at': None}) == set(AliasDetails.FIELDS)
+    assert (details.url, details.hits, details.active, details.created_raw, details.created_at) == ("", 0, False, "", None)
+    # Missing and null are the same empty value
+    assert details.update({}) == set()
+
+
+def test_unparseable_timestamp_is_kept_raw():
+    details = AliasDetails.from_api({**DETAILS, 'url_created_at': "yesterday"}, "promo")
+    assert details.created_at is None
+    assert details.to_row()['created_at'] == "yesterday"
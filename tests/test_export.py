@@ -0,0 +1,84 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+import ditto_api
+from ditto_api import export_alias_stats
+
+ALIASES = ["one", "three", "two"]
+
+
+class StatsBackend:
+    """Answers /details from a table of hit counts"""
+    def __init__(self):
+        self.hits = {alias: 0 for alias in ALIASES}
+
+    async def alias_request(self, page, alias, endpoint, method="GET", priority=None):
+        data = {'url': f"https://example.com/{alias}", 'url_hits': self.hits[alias], 'url_state': True,
+                'url_created_at': "2025-01-01T12:00:00Z", 'url_code': alias}
+        return {'ok': True, 'status': 200, 'body': {'data': data}, 'headers': {}}
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    backend = StatsBackend()
+    monkeypatch.setattr(ditto_api, "alias_request", backend.alias_request)
+    return backend
+
+
+def export(path, fmt="csv", incremental=True):
+    written, failed = asyncio.run(export_alias_stats(None, ALIASES, str(path), fmt=fmt, incremental=incremental))
+    assert not failed
+    return written
+
+
+def data_rows(path):
+    return path.read_text(encoding='utf-8').splitlines()[1:]
+
+
+def test_incremental_export_appends_only_changed_aliases(tmp_path, backend):
+    path = tmp_path / "stats.csv"
+    assert export(path) == 3
+    assert export(path) == 0
+    backend.hits["two"] = 5
+    assert export(path) == 1
+    assert len(data_rows(path)) == 4
+    assert data_rows(path)[-1].startswith("two,")
+
+
+def test_missing_export_is_written_in_full(tmp_path, backend):
+    path = tmp_path / "stats.csv"
+    export(path)
+    path.unlink()
+    assert export(path) == 3
+    assert len(data_rows(path)) == 3
+
+
+def test_edited_export_is_rewritten_in_full(tmp_path, backend):
+    path = tmp_path / "stats.csv"
+    export(path)
+    stat = os.stat(path)
+    lines = path.read_text(encoding='utf-8').splitlines(keepends=True)
+    path.write_text("".join(lines[:2]), encoding='utf-8')
+    # Same mtime as when the state was saved: only the row count gives the edit away
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert export(path) == 3
+    assert len(data_rows(path)) == 3
+
+
+def test_touched_export_is_rewritten_in_full(tmp_path, backend):
+    path = tmp_path / "stats.jsonl"
+    export(path, fmt="jsonl")
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert export(path, fmt="jsonl") == 3
+    assert sorted(json.loads(line)['alias'] for line in path.read_text(encoding='utf-8').splitlines()) == ALIASES
+
+
+def test_export_in_another_format_is_written_in_full(tmp_path, backend):
+    path = tmp_path / "stats.out"
+    export(path, fmt="jsonl")
+    assert export(path, fmt="csv") == 3
+    assert path.read_text(encoding='utf-8').startswith(",".join(ditto_api.EXPORT_FIELDS))
@@ -0,0 +1,73 @@
+import json
+import os
+
+import pytest
+
+import ditto_history
+from ditto_history import LinkHistory, history_for, new_user_id, valid_user_id
+
+
+@pytest.fixture
+def history_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(ditto_history, "HISTORY_DIR", str(tmp_path))
+    monkeypatch.setattr(ditto_history, "open_histories", type(ditto_history.open_histories)())
+    return tmp_path
+
+
+def test_search_by_alias_and_url_prefix(tmp_path):
+    history = LinkHistory(str(tmp_path / "history.jsonl"))
+    history.add("https://www.example.com/spring", "spring-sale", "https://s.example/spring-sale")
+    history.add("https://docs.python.org/3/", "pydocs", "https://s.example/pydocs")
+    history.add("https://example.com/summer", "summer", "https://s.example/summer")
+
+    assert [entry['alias'] for entry in history.search("")] == ["summer", "pydocs", "spring-sale"]
+    assert [entry['alias'] for entry in history.search("S")] == ["summer", "spring-sale"]
+    assert [entry['alias'] for entry in history.search("example.com/s")] == ["summer", "spring-sale"]
+    assert [entry['alias'] for entry in history.search("https://docs")] == ["pydocs"]
+    assert history.search("nothing") == []
+
+
+def test_file_is_read_lazily_and_kept_up_to_date(tmp_path):
+    path = tmp_path / "history.jsonl"
+    path.write_text(json.dumps({'url': "https://a.example", 'alias': "a", 'short_url': ""}) + "\n" + "{cut short\n")
+    history = LinkHistory(str(path))
+    history.add("https://b.example", "b", "")
+    assert history.entries is None
+    assert len(history) == 2  # the corrupt line is skipped
+    history.add("https://c.example", "c", "")
+    assert [entry['alias'] for entry in history.search("")] == ["c", "b", "a"]
+    assert len(path.read_text().splitlines()) == 4
+
+
+def test_memory_only_history_writes_nothing(tmp_path):
+    history = LinkHistory(None)
+    history.add("https://a.example", "a", "")
+    assert len(history) == 1
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_users_get_separate_files(history_dir):
+    first, second = new_user_id(), new_user_id()
+    history_for(first).add("https://private.example/one", "one", "")
+    history_for(second).add("https://private.example/two", "two", "")
+    assert [entry['alias'] for entry in history_for(first).search("")] == ["one"]
+    assert [entry['alias'] for entry in history_for(second).search("")] == ["two"]
+    assert sorted(os.listdir(history_dir)) == sorted([f"{first}.jsonl", f"{second}.jsonl"])
+
+
+def test_a_users_tabs_share_one_history(history_dir):
+    user_id = new_user_id()
+    assert history_for(user_id) is history_for(user_id)
+
+
+@pytest.mark.parametrize("user_id", [None, "", "../history", "../../etc/passwd", "A" * 32, "0" * 31, 12345, {"id": 1}])
+def test_unusable_ids_get_a_private_memory_history(history_dir, user_id):
+    assert not valid_user_id(user_id)
+    history = history_for(user_id)
+    assert history.path is None
+    assert history is not history_for(user_id)
+
+
+def test_histories_off(history_dir, monkeypatch):
+    monkeypatch.setattr(ditto_history, "HISTORY_DIR", "off")
+    assert history_for(new_user_id()).path is None
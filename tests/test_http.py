@@ -0,0 +1,227 @@
+import json
+import socket
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import ditto_http
+import ditto_logging
+from ditto_http import Decoder, encode_body
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    """Keep-alive server that closes connections idle for longer than timeout, like most proxies"""
+    protocol_version = "HTTP/1.1"
+    timeout = 0.3
+    received = []  # "METHOD path body" of every request answered
+
+    def answer(self):
+        if self.path.startswith("/redirect?to="):
+            self.send_response(302)
+            self.send_header("Location", self.path.split("=", 1)[1])
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if self.path == "/credentials":
+            reply = f"{self.headers.get('Authorization')} {self.headers.get('Cookie')}".encode()
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(reply)))
+            self.end_headers()
+            self.wfile.write(reply)
+            return
+        length = int(self.headers.get('content-length') or 0)
+        body = self.rfile.read(length) if length else b""
+        reply = f"{self.command} {self.path} {body.decode()}".encode()
+        self.received.append(reply.decode())
+        if self.path == "/drop":
+            # Acts on the request, then the connection dies before the answer goes out
+            self.close_connection = True
+            return
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(reply)))
+        self.end_headers()
+        self.wfile.write(reply)
+
+    do_GET = do_POST = do_PATCH = do_DELETE = answer
+
+    def log_message(self, *args):
+        pass
+
+
+def start_server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), KeepAliveHandler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd
+
+
+@pytest.fixture
+def server():
+    httpd = start_server()
+    ditto_http.pool.clear()
+    KeepAliveHandler.received.clear()
+    yield f"http://127.0.0.1:{httpd.server_port}"
+    httpd.shutdown()
+    httpd.server_close()
+    ditto_http.pool.clear()
+
+
+@pytest.fixture
+def other_server():
+    httpd = start_server()
+    yield f"http://127.0.0.1:{httpd.server_port}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def send(url, method, body=None, idempotent=False):
+    return ditto_http.request(url, method, body, {'Content-Type': "text/plain"}, timeout=5, idempotent=idempotent)
+
+
+def test_pooled_connection_is_reused(server):
+    send(f"{server}/a", "GET")
+    _, reused = ditto_http.pool.get(ditto_http.pool_key(ditto_http.urlsplit(server)), 5)
+    assert reused
+
+
+@pytest.mark.parametrize("method", ["POST", "PATCH"])
+def test_write_after_server_closed_idle_connection(server, method):
+    assert send(f"{server}/change_password", method, b"first")[0] == 200
+    time.sleep(0.6)  # the server has closed the pooled connection by now
+    status, _, _, body = send(f"{server}/change_password", method, b"second")
+    assert status == 200
+    assert body == f"{method} /change_password second".encode()
+    # The closed connection was noticed before sending, so the write went out exactly once
+    assert KeepAliveHandler.received == [f"{method} /change_password first", f"{method} /change_password second"]
+
+
+@pytest.mark.parametrize("method", ["POST", "PATCH"])
+def test_write_isnt_resent_when_it_may_have_been_applied(server, method):
+    send(f"{server}/a", "GET")
+    with pytest.raises(ConnectionError):
+        send(f"{server}/drop", method, b"second")
+    assert KeepAliveHandler.received == ["GET /a ", f"{method} /drop second"]
+
+
+@pytest.mark.parametrize("method, idempotent", [("GET", False), ("DELETE", False), ("POST", True)])
+def test_repeatable_request_is_resent_once(server, method, idempotent):
+    send(f"{server}/a", "GET")
+    with pytest.raises(ConnectionError):
+        send(f"{server}/drop", method, b"second", idempotent=idempotent)
+    # Resent once on a fresh connection, which dropped it too
+    assert KeepAliveHandler.received[1:] == [f"{method} /drop second"] * 2
+
+
+def test_write_that_never_got_out_is_resent(server, monkeypatch):
+    send(f"{server}/change_password", "POST", b"first")
+    key = ditto_http.pool_key(ditto_http.urlsplit(server))
+    conn, _ = ditto_http.pool.idle[key][-1]
+    # Sending on this connection now fails before a byte reaches the server
+    conn.sock.shutdown(socket.SHUT_WR)
+    monkeypatch.setattr(ditto_http, "connection_alive", lambda conn: True)
+    status, _, _, body = send(f"{server}/change_password", "POST", b"second")
+    assert (status, body) == (200, b"POST /change_password second")
+    assert KeepAliveHandler.received == ["POST /change_password first", "POST /change_password second"]
+
+
+def test_connection_alive(server):
+    send(f"{server}/a", "GET")
+    key = ditto_http.pool_key(ditto_http.urlsplit(server))
+    conn, _ = ditto_http.pool.idle[key][-1]
+    assert ditto_http.connection_alive(conn)
+    time.sleep(0.6)
+    assert not ditto_http.connection_alive(conn)
+
+
+CREDENTIALS = {'Authorization': "Bearer secret", 'Cookie': "session=1"}
+
+
+def test_redirect_on_same_origin_keeps_credentials(server):
+    status, _, _, body = ditto_http.request(f"{server}/redirect?to=/credentials", headers=CREDENTIALS, timeout=5)
+    assert status == 200
+    assert body == b"Bearer secret session=1"
+
+
+def test_redirect_to_other_origin_drops_credentials(server, other_server):
+    status, _, _, body = ditto_http.request(f"{server}/redirect?to={other_server}/credentials", headers=CREDENTIALS, timeout=5)
+    assert status == 200
+    assert body == b"None None"
+
+
+def test_proxied_redirect_to_other_origin_drops_credentials(server, other_server):
+    # Requests through a proxy go through urllib, which keeps credentials across hosts by default
+    status, _, _, body = ditto_http.send_urllib(f"{server}/redirect?to={other_server}/credentials", "GET", None, dict(CREDENTIALS), 5, True)
+    assert status == 200
+    assert body == b"None None"
+
+
+def test_warm_up_failure_is_logged(tmp_path):
+    path = tmp_path / "ditto.log.jsonl"
+    ditto_logging.configure("file", str(path), "INFO", {})
+    try:
+        closed = socket.socket()
+        closed.bind(("127.0.0.1", 0))
+        port = closed.getsockname()[1]
+        closed.close()
+        ditto_http.warm_up(f"http://127.0.0.1:{port}", timeout=1)
+        ditto_logging.logs.stop()
+    finally:
+        ditto_logging.configure("off")
+    [record] = [json.loads(line) for line in path.read_text(encoding='utf-8').splitlines()]
+    assert (record['level'], record['event'], record['url']) == ("error", "warm-up failed", f"http://127.0.0.1:{port}")
+
+
+BODY = json.dumps([{'alias': f"alias-{i}", 'url': f"https://example.com/{i}"} for i in range(200)]).encode()
+
+
+def compress(data, wbits):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, wbits)
+    return compressor.compress(data) + compressor.flush()
+
+
+@pytest.mark.parametrize("encoding, wbits", [
+    ("gzip", 16 + zlib.MAX_WBITS),
+    ("x-gzip", 16 + zlib.MAX_WBITS),
+    ("deflate", zlib.MAX_WBITS),
+    ("deflate", -zlib.MAX_WBITS),
+])
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 1024, 1 << 20])
+def test_decoder_round_trip(encoding, wbits, chunk_size):
+    wire = compress(BODY, wbits)
+    decoder = Decoder(encoding)
+    parts = [decoder.feed(wire[i:i + chunk_size]) for i in range(0, len(wire), chunk_size)]
+    assert b"".join(parts) + decoder.flush() == BODY
+
+
+@pytest.mark.parametrize("wbits", [zlib.MAX_WBITS, -zlib.MAX_WBITS])
+def test_deflate_decoder_on_empty_body(wbits):
+    wire = compress(b"", wbits)
+    decoder = Decoder("deflate")
+    assert decoder.feed(wire[:1]) == b""
+    assert decoder.feed(wire[1:]) + decoder.flush() == b""
+
+
+@pytest.mark.parametrize("encoding", [None, "", "identity", "br"])
+def test_other_encodings_pass_through(encoding):
+    decoder = Decoder(encoding)
+    assert decoder.feed(BODY[:10]) + decoder.feed(BODY[10:]) + decoder.flush() == BODY
+
+
+def test_large_request_bodies_are_gzipped(monkeypatch):
+    monkeypatch.setattr(ditto_http, "COMPRESS_MIN_BYTES", 1024)
+    headers = {}
+    wire = encode_body(BODY, headers)
+    assert headers == {'Content-Encoding': "gzip"}
+    assert len(wire) < len(BODY)
+    assert zlib.decompress(wire, 16 + zlib.MAX_WBITS) == BODY
+
+
+@pytest.mark.parametrize("min_bytes, body", [(1024, b'{"url_code": "promo"}'), (0, BODY), (1024, None)])
+def test_small_or_uncompressed_request_bodies_are_sent_as_is(monkeypatch, min_bytes, body):
+    monkeypatch.setattr(ditto_http, "COMPRESS_MIN_BYTES", min_bytes)
+    headers = {}
+    assert encode_body(body, headers) == body
+    assert headers == {}
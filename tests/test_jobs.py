@@ -0,0 +1,150 @@
+import asyncio
+import json
+import os
+import stat
+import time
+
+import pytest
+
+import ditto_jobs
+from ditto_jobs import CANCELLED, DONE, FAILED, PENDING, JobScheduler
+
+
+class FakeApi:
+    """Stands in for alias_request, recording each call; aliases in failing get a 404"""
+    def __init__(self):
+        self.calls = []
+        self.failing = set()
+
+    async def alias_request(self, context, alias, endpoint, method="GET", priority=None):
+        self.calls.append((alias, method, endpoint))
+        if alias in self.failing:
+            return {'ok': False, 'status': 404, 'body': {'detail': "Alias not found"}, 'headers': {}}
+        return {'ok': True, 'status': 200, 'body': {}, 'headers': {}}
+
+
+@pytest.fixture
+def api(monkeypatch):
+    api = FakeApi()
+    monkeypatch.setattr(ditto_jobs, "alias_request", api.alias_request)
+    monkeypatch.setattr(ditto_jobs, "SAVE_DELAY", 0)
+    return api
+
+
+@pytest.fixture
+def jobs_path(tmp_path):
+    return str(tmp_path / "jobs.json")
+
+
+def run(coroutine_function):
+    return asyncio.run(coroutine_function())
+
+
+def test_jobs_run_when_due_in_order(api, jobs_path):
+    async def scenario():
+        jobs = JobScheduler(jobs_path)
+        now = time.time()
+        jobs.schedule("promo", "resume", now + 0.1, "token")
+        jobs.schedule("promo", "pause", now + 0.05, "token")
+        await asyncio.sleep(0.02)
+        assert api.calls == []
+        await asyncio.sleep(0.2)
+        return jobs
+
+    jobs = run(scenario)
+    assert [call[2] for call in api.calls] == ["/pause", "/resume"]
+    assert not jobs.jobs and not jobs.by_alias
+    assert [job.status for job in jobs.history_for("promo")] == [DONE, DONE]
+
+
+def test_change_url_sends_the_new_url(api, jobs_path):
+    async def scenario():
+        jobs = JobScheduler(jobs_path)
+        jobs.schedule("promo", "change_url", time.time(), "token", url="https://example.com/?a=1&b=2")
+        await asyncio.sleep(0.05)
+
+    run(scenario)
+    assert api.calls == [("promo", "PATCH", "/change_url?url=https%3A%2F%2Fexample.com%2F%3Fa%3D1%26b%3D2")]
+
+
+def test_invalid_jobs_are_rejected(jobs_path):
+    jobs = JobScheduler(jobs_path)
+    with pytest.raises(ValueError):
+        jobs.schedule("promo", "rename", time.time(), "token")
+    with pytest.raises(ValueError):
+        jobs.schedule("promo", "change_url", time.time(), "token")
+
+
+def test_failed_jobs_keep_the_apis_reason(api, jobs_path):
+    api.failing.add("gone")
+
+    async def scenario():
+        jobs = JobScheduler(jobs_path)
+        jobs.schedule("gone", "pause", time.time(), "token")
+        await asyncio.sleep(0.05)
+        return jobs
+
+    [job] = run(scenario).history_for("gone")
+    assert (job.status, job.detail) == (FAILED, "Alias not found")
+
+
+def test_cancelled_jobs_never_run(api, jobs_path):
+    async def scenario():
+        jobs = JobScheduler(jobs_path)
+        job = jobs.schedule("promo", "delete", time.time() + 0.05, "token")
+        assert jobs.cancel(job.id)
+        assert not jobs.cancel(job.id)
+        await asyncio.sleep(0.1)
+        return jobs
+
+    jobs = run(scenario)
+    assert api.calls == []
+    assert [job.status for job in jobs.history_for("promo")] == [CANCELLED]
+
+
+def test_deleting_an_alias_cancels_its_other_jobs(api, jobs_path):
+    async def scenario():
+        jobs = JobScheduler(jobs_path)
+        jobs.schedule("promo", "delete", time.time(), "token")
+        jobs.schedule("promo", "resume", time.time() + 60, "token")
+        jobs.schedule("other", "pause", time.time() + 60, "token")
+        await asyncio.sleep(0.05)
+        return jobs
+
+    jobs = run(scenario)
+    assert [(job.action, job.status, job.detail) for job in jobs.history_for("promo")] == [
+        ("resume", CANCELLED, "Alias deleted"), ("delete", DONE, "")]
+    assert [job.alias for job in jobs.jobs.values()] == ["other"]
+    # A deleted alias's token is dropped with its last job
+    assert "promo" not in jobs.context.session_data.alias_tokens
+
+
+def test_jobs_and_tokens_survive_a_restart(api, jobs_path):
+    async def schedule():
+        jobs = JobScheduler(jobs_path)
+        jobs.schedule("promo", "pause", time.time() + 0.05, "secret-token")
+        jobs.schedule("later", "resume", time.time() + 3600, "other-token")
+        await asyncio.sleep(0.01)
+        # Stopped before the pause came due: the jobs file is all that is left
+        jobs.timer.cancel()
+
+    run(schedule)
+    assert stat.S_IMODE(os.stat(jobs_path).st_mode) == 0o600
+    with open(jobs_path, encoding='utf-8') as f:
+        saved = json.load(f)
+    assert [job['status'] for job in saved['jobs']] == [PENDING, PENDING]
+    assert set(saved['tokens']) == {"promo", "later"}
+
+    async def restart():
+        time.sleep(0.06)
+        jobs = JobScheduler(jobs_path)
+        jobs.start()
+        # The pause came due while Ditto was down, so it runs straight away
+        await asyncio.sleep(0.05)
+        return jobs
+
+    jobs = run(restart)
+    assert api.calls == [("promo", "PATCH", "/pause")]
+    assert [job.alias for job in jobs.jobs.values()] == ["later"]
+    assert jobs.context.session_data.alias_tokens["later"][0] == "other-token"
+    assert jobs.next_id == 3
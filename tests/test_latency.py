@@ -0,0 +1,103 @@
+import asyncio
+import time
+
+import pytest
+
+import ditto_api
+import ditto_latency
+from ditto_latency import MIN_SAMPLES, MIN_TIMEOUT, LatencyTracker, endpoint_key, percentile
+
+DETAILS = "GET /details"
+
+
+def test_endpoint_key_groups_short_link_probes():
+    assert endpoint_key("GET", "https://api.example/details?x=1") == DETAILS
+    assert endpoint_key("GET", "https://api.example/promo") == "GET /{alias}"
+    assert endpoint_key("HEAD", "https://api.example") == "HEAD /{alias}"
+
+
+def test_percentile():
+    samples = list(range(1, 101))
+    assert percentile(samples, 0.5) == 50
+    assert percentile(samples, 0.99) == 99
+    assert percentile([3.0], 0.95) == 3.0
+
+
+def test_timeout_follows_p99_once_enough_samples_are_in():
+    tracker = LatencyTracker()
+    for _ in range(MIN_SAMPLES - 1):
+        tracker.record(DETAILS, 2.0)
+    assert tracker.timeout_for(DETAILS, 10) == 10
+    tracker.record(DETAILS, 2.0)
+    assert tracker.timeout_for(DETAILS, 10) == 6.0
+    # The caller's timeout stays the ceiling, and fast endpoints keep a floor
+    assert tracker.timeout_for(DETAILS, 5) == 5
+    fast = LatencyTracker()
+    for _ in range(MIN_SAMPLES):
+        fast.record(DETAILS, 0.01)
+    assert fast.timeout_for(DETAILS, 10) == MIN_TIMEOUT
+
+
+def test_window_keeps_only_recent_samples():
+    tracker = LatencyTracker(window=MIN_SAMPLES)
+    for _ in range(MIN_SAMPLES):
+        tracker.record(DETAILS, 5.0)
+    for _ in range(MIN_SAMPLES):
+        tracker.record(DETAILS, 1.0)
+    assert tracker.quantile(DETAILS, 0.99) == 1.0
+
+
+def test_only_idempotent_endpoints_are_hedged(monkeypatch):
+    monkeypatch.setattr(ditto_latency, "HEDGE_ENABLED", True)
+    tracker = LatencyTracker()
+    for _ in range(MIN_SAMPLES):
+        tracker.record(DETAILS, 0.2)
+        tracker.record("POST /create", 0.2)
+    assert tracker.hedge_delay(DETAILS) == 0.2
+    assert tracker.hedge_delay("POST /create") is None
+    tracker.hedges_in_flight = ditto_latency.MAX_HEDGES_IN_FLIGHT
+    assert tracker.hedge_delay(DETAILS) is None
+
+
+class StuckFirstTransport:
+    """The first request hangs for a second; every later one answers at once"""
+    def __init__(self):
+        self.sent = 0
+
+    async def send(self, url, method, data, forward):
+        self.sent += 1
+        if self.sent == 1:
+            await asyncio.sleep(1)
+        return {'ok': True, 'status': 200, 'body': {'copy': self.sent}, 'headers': {}}
+
+
+class Context:
+    def __init__(self):
+        self.session_data = ditto_api.SessionData()
+
+
+@pytest.fixture
+def warm_tracker(monkeypatch):
+    monkeypatch.setattr(ditto_latency, "HEDGE_ENABLED", True)
+    tracker = LatencyTracker()
+    for _ in range(MIN_SAMPLES):
+        tracker.record(DETAILS, 0.01)
+        tracker.record("POST /create", 0.01)
+    monkeypatch.setattr(ditto_api, "latency", tracker)
+    transport = StuckFirstTransport()
+    monkeypatch.setattr(ditto_api, "transport", transport)
+    return transport
+
+
+def test_slow_get_is_answered_by_its_hedge(warm_tracker):
+    started = time.monotonic()
+    response = asyncio.run(ditto_api.send_timed(Context(), f"{ditto_api.API_BASE_URL}/details"))
+    assert time.monotonic() - started < 0.5
+    assert response['body'] == {'copy': 2}
+    assert warm_tracker.sent == 2
+
+
+def test_writes_are_never_hedged(warm_tracker):
+    response = asyncio.run(ditto_api.send_timed(Context(), f"{ditto_api.API_BASE_URL}/create", "POST"))
+    assert response['body'] == {'copy': 1}
+    assert warm_tracker.sent == 1
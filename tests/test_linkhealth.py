@@ -0,0 +1,156 @@
+import asyncio
+
+import pytest
+
+import ditto_linkhealth
+from ditto_linkhealth import BROKEN, OK, UNKNOWN, UNREACHABLE, LinkChecker, probe, public_address
+from mock_backend import MockBackend
+
+
+@pytest.fixture
+def stub():
+    backend = MockBackend()
+    base_url = backend.start()
+    yield backend, base_url
+    backend.stop()
+
+
+@pytest.mark.parametrize("ip, public", [
+    ("93.184.216.34", True),
+    ("2606:4700::1111", True),
+    ("127.0.0.1", False),
+    ("::1", False),
+    ("10.1.2.3", False),
+    ("172.16.0.1", False),
+    ("192.168.1.1", False),
+    ("169.254.169.254", False),
+    ("fe80::1", False),
+    ("100.64.0.1", False),
+    ("::ffff:127.0.0.1", False),
+    ("0.0.0.0", False),
+    ("224.0.0.1", False),
+])
+def test_public_address(ip, public):
+    assert public_address(ip) is public
+
+
+@pytest.mark.parametrize("url", [
+    "http://127.0.0.1/",
+    "http://localhost/",
+    "http://169.254.169.254/latest/meta-data/",
+    "http://10.0.0.1/",
+    "http://[::1]/",
+])
+def test_private_targets_are_not_probed(url):
+    result = probe(url, timeout=1, allow_private=False)
+    assert result.result == UNKNOWN
+    assert "not a public address" in result.detail
+
+
+def test_private_targets_are_refused_on_every_hop(stub, monkeypatch):
+    backend, base_url = stub
+    port = backend.server.server_port
+    backend.aliases['hop'] = {'url': f"http://127.0.0.2:{port}/status/200", 'url_pass': "", 'url_hits': 0, 'url_state': True, 'url_created_at': ""}
+    # Treat the stub as a public site that redirects into the private network
+    monkeypatch.setattr(ditto_linkhealth, "public_address", lambda ip: ip == "127.0.0.1")
+    result = probe(f"{base_url}/hop", timeout=1, allow_private=False)
+    assert result.result == UNKNOWN
+    assert result.chain == [(f"{base_url}/hop", 307)]
+    assert "127.0.0.2" in result.detail
+
+
+def test_private_targets_can_be_allowed(stub):
+    _, base_url = stub
+    assert probe(f"{base_url}/status/200", timeout=1, allow_private=True).result == OK
+
+
+def check(checker, urls):
+    async def run():
+        return await checker.check_many(urls)
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize("path, result, status", [
+    ("/status/200", OK, 200),
+    ("/status/204", OK, 204),
+    ("/status/404", BROKEN, 404),
+    ("/status/410", BROKEN, 410),
+    ("/status/500", BROKEN, 500),
+    ("/status/503", BROKEN, 503),
+])
+def test_status(stub, path, result, status):
+    _, base_url = stub
+    checked = probe(f"{base_url}{path}", timeout=2, allow_private=True)
+    assert (checked.result, checked.status) == (result, status)
+
+
+def test_head_errors_are_confirmed_with_get(stub):
+    backend, base_url = stub
+    probe(f"{base_url}/status/404", timeout=2, allow_private=True)
+    assert backend.requests == 2
+
+
+def test_redirect_chain(stub):
+    _, base_url = stub
+    checked = probe(f"{base_url}/redirect/3", timeout=2, allow_private=True)
+    assert checked.result == OK
+    assert checked.redirects == 3
+    assert [hop for hop, _ in checked.chain] == [f"{base_url}/redirect/{n}" for n in (3, 2, 1, 0)]
+    assert "after 3 redirects" in checked.summary()
+
+
+def test_redirect_loop(stub):
+    backend, base_url = stub
+    backend.aliases['loop'] = {'url': f"{base_url}/loop", 'url_pass': "", 'url_hits': 0, 'url_state': True, 'url_created_at': ""}
+    checked = probe(f"{base_url}/loop", timeout=2, allow_private=True)
+    assert (checked.result, checked.detail) == (BROKEN, "redirect loop")
+
+
+def test_too_many_redirects(stub):
+    _, base_url = stub
+    checked = probe(f"{base_url}/redirect/{ditto_linkhealth.MAX_REDIRECTS + 1}", timeout=2, allow_private=True)
+    assert (checked.result, checked.detail) == (BROKEN, "too many redirects")
+
+
+def test_timeout():
+    backend = MockBackend(latency=1.0)
+    base_url = backend.start()
+    try:
+        checker = LinkChecker(timeout=0.2, allow_private=True)
+        checked = check(checker, [f"{base_url}/status/200"])[f"{base_url}/status/200"]
+    finally:
+        backend.stop()
+    assert checked.result == UNREACHABLE
+    assert "timed out" in checked.detail
+
+
+def test_per_host_limit():
+    backend = MockBackend(latency=0.2)
+    base_url = backend.start()
+    try:
+        checker = LinkChecker(workers=8, per_host=2, allow_private=True)
+        results = check(checker, [f"{base_url}/status/200?n={n}" for n in range(6)])
+    finally:
+        backend.stop()
+    assert all(checked.result == OK for checked in results.values())
+    assert backend.peak == 2
+    assert not checker.host_slots
+
+
+def test_cache_and_shared_probes(stub):
+    backend, base_url = stub
+    url = f"{base_url}/status/200"
+    checker = LinkChecker(allow_private=True)
+
+    async def run():
+        first = await asyncio.gather(*(checker.check(url) for _ in range(5)))
+        cached = await checker.check(url)
+        forced = await checker.check(url, force=True)
+        return first, cached, forced
+
+    first, cached, forced = asyncio.run(run())
+    # Five concurrent checks share one HEAD, the cached answer costs nothing, force probes again
+    assert backend.requests == 2
+    assert all(result is first[0] for result in first)
+    assert cached is first[0]
+    assert forced is not first[0]
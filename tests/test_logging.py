@@ -0,0 +1,116 @@
+import asyncio
+import json
+import logging
+import queue
+
+import pytest
+
+import ditto_api
+import ditto_logging
+import ditto_tracing
+from ditto_logging import REDACTED, DroppingQueueHandler, log, log_error, parse_sample_rates, redact
+
+
+@pytest.fixture
+def log_file(tmp_path):
+    path = tmp_path / "ditto.log.jsonl"
+
+    def records():
+        ditto_logging.logs.stop()
+        return [json.loads(line) for line in path.read_text(encoding='utf-8').splitlines()]
+
+    ditto_logging.configure("file", str(path), "INFO", {})
+    yield records
+    ditto_logging.configure("off")
+
+
+def test_secrets_are_redacted_at_any_depth():
+    record = {
+        'url': "/login",
+        'data': {'url_code': "promo", 'URL_PASS': "secret", 'nested': [{'access_token': "t", 'hits': 3}]},
+        'Authorization': "Bearer t",
+    }
+    assert redact(record) == {
+        'url': "/login",
+        'data': {'url_code': "promo", 'URL_PASS': REDACTED, 'nested': [{'access_token': REDACTED, 'hits': 3}]},
+        'Authorization': REDACTED,
+    }
+    # The caller's record is left alone
+    assert record['data']['URL_PASS'] == "secret"
+
+
+def test_parse_sample_rates():
+    assert parse_sample_rates("request=0.1, navigation=2,error=-1,bad,=0.5") == {'request': 0.1, 'navigation': 1.0, 'error': 0.0}
+    assert parse_sample_rates("") == {}
+
+
+def test_records_are_json_lines_without_secrets(log_file):
+    log("request", "request", method="POST", data={'url_pass': "secret"})
+    [record] = log_file()
+    assert record['category'] == "request" and record['level'] == "info" and record['method'] == "POST"
+    assert record['data'] == {'url_pass': REDACTED}
+    assert "secret" not in json.dumps(record)
+
+
+def test_level_and_sampling_drop_records(tmp_path):
+    path = tmp_path / "ditto.log.jsonl"
+    ditto_logging.configure("file", str(path), "WARNING", {'navigation': 0.0})
+    try:
+        log("request", "kept", logging.WARNING)
+        log("request", "too quiet", logging.INFO)
+        log("navigation", "sampled out", logging.ERROR)
+        ditto_logging.logs.stop()
+    finally:
+        ditto_logging.configure("off")
+    assert [json.loads(line)['event'] for line in path.read_text(encoding='utf-8').splitlines()] == ["kept"]
+
+
+def test_errors_carry_their_traceback(log_file):
+    try:
+        raise KeyError("missing")
+    except KeyError as ex:
+        log_error("lookup failed", ex, alias="promo")
+    [record] = log_file()
+    assert record['level'] == "error" and record['alias'] == "promo"
+    assert record['error'] == "'missing'"
+    assert "KeyError" in record['exception']
+
+
+class DiscardingExporter:
+    def submit(self, span, end_ns):
+        pass
+
+
+def test_records_in_a_sampled_trace_carry_its_ids(log_file, monkeypatch):
+    monkeypatch.setattr(ditto_tracing.tracer, "exporter", DiscardingExporter())
+    monkeypatch.setattr(ditto_tracing.tracer, "sample_rate", 1.0)
+    with ditto_tracing.span("ui.test") as span:
+        log("navigation", "view")
+    [record] = log_file()
+    assert (record['trace_id'], record['span_id']) == (span.trace_id, span.span_id)
+
+
+def test_full_queue_drops_records_and_counts_them():
+    handler = DroppingQueueHandler(queue.Queue(1))
+    dropped = ditto_logging.dropped_total.snapshot().get("", 0)
+    for i in range(3):
+        handler.handle(logging.LogRecord("ditto", logging.INFO, __file__, 0, "event %d", (i,), None))
+    assert handler.queue.qsize() == 1
+    assert ditto_logging.dropped_total.snapshot()[""] == dropped + 2
+
+
+class LoginTransport:
+    async def send(self, url, method, data, forward):
+        return {'ok': True, 'status': 200, 'body': {'access_token': "t"}, 'headers': {}}
+
+
+def test_login_requests_are_logged_without_the_password(log_file, monkeypatch):
+    monkeypatch.setattr(ditto_api, "transport", LoginTransport())
+
+    class Context:
+        session_data = ditto_api.SessionData()
+
+    asyncio.run(ditto_api.make_request(Context(), f"{ditto_api.API_BASE_URL}/login", "POST", data={'url_code': "promo", 'url_pass': "secret"}, flag=False))
+    [record] = log_file()
+    assert record['status'] == 200 and record['method'] == "POST"
+    assert "secret" not in json.dumps(record)
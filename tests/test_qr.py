@@ -0,0 +1,147 @@
+import struct
+import zlib
+
+import pytest
+
+import ditto_qr
+from ditto_qr import (ECC_LEVELS, MASKS, QrMatrix, add_error_correction, encode, encode_data, qr_png, raw_data_modules,
+                      render_png, rs_divisor, rs_remainder)
+
+LEVEL_BITS = {name: bits for name, (_, bits) in ECC_LEVELS.items()}
+
+
+def test_reed_solomon_matches_the_standards_example():
+    # "HELLO WORLD" at 1-M, from the worked example of ISO/IEC 18004
+    data = [32, 91, 11, 120, 209, 114, 220, 77, 67, 64, 236, 17, 236, 17, 236, 17]
+    assert rs_remainder(data, rs_divisor(10)) == [196, 35, 39, 119, 235, 215, 231, 226, 93, 23]
+
+
+def test_byte_mode_data_is_terminated_and_padded():
+    version, codewords = encode_data(b"ditto", ECC_LEVELS['M'][0])
+    assert version == 1
+    # Mode 0100, count 5, the bytes, terminator, then alternating pad codewords
+    assert codewords == [64, 86, 70, 151, 71, 70, 240] + [236, 17] * 4 + [236]
+
+
+def test_blocks_are_interleaved():
+    level = ECC_LEVELS['Q'][0]
+    # 5-Q: two blocks of 15 data codewords then two of 16, with 18 error correction codewords each
+    result = add_error_correction(list(range(62)), 5, level)
+    assert len(result) == raw_data_modules(5) // 8
+    assert result[:4] == [0, 15, 30, 46]
+    # Only the long blocks have a 16th codeword; then the error correction codewords follow
+    first_ecc = [rs_remainder(block, rs_divisor(18))[0] for block in (list(range(15)), list(range(15, 30)))]
+    assert result[56:64] == [14, 29, 44, 60, 45, 61] + first_ecc
+
+
+@pytest.mark.parametrize("text, level, size", [
+    ("ditto", 'M', 21),
+    ("https://sho.rt/promo", 'M', 25),
+    ("https://sho.rt/promo", 'H', 29),
+    ("x" * 300, 'L', 61),
+])
+def test_smallest_version_that_fits(text, level, size):
+    assert len(encode(text, level)) == size
+
+
+def test_too_long_text_is_rejected():
+    with pytest.raises(ValueError):
+        encode("x" * 3000, 'H')
+
+
+def read_format(modules):
+    """Both copies of the 15 format bits, most significant first"""
+    size = len(modules)
+    first = [(8, i) for i in range(6)] + [(8, 7), (8, 8), (7, 8)] + [(14 - i, 8) for i in range(9, 15)]
+    second = [(size - 1 - i, 8) for i in range(8)] + [(8, size - 15 + i) for i in range(8, 15)]
+    return ["".join("1" if modules[y][x] else "0" for x, y in reversed(copy)) for copy in (first, second)]
+
+
+def bch_remainder(value):
+    for shift in range(4, -1, -1):
+        if value >> (shift + 10) & 1:
+            value ^= 0x537 << shift
+    return value
+
+
+@pytest.mark.parametrize("level", "LMQH")
+def test_format_information_is_valid(level):
+    modules = encode("https://sho.rt/summer-sale", level)
+    first, second = read_format(modules)
+    assert first == second
+    bits = int(first, 2) ^ 0x5412
+    assert bch_remainder(bits) == 0
+    assert bits >> 13 == LEVEL_BITS[level]
+    assert modules[len(modules) - 8][8]  # the dark module
+
+
+def test_format_string_from_the_standards_table():
+    # "ditto" at M picks mask 0, whose format string the standard lists as 101010000010010
+    assert read_format(encode("ditto", 'M'))[0] == "101010000010010"
+
+
+def test_finder_patterns_in_three_corners():
+    modules = encode("https://sho.rt/promo")
+    size = len(modules)
+    for x0, y0 in ((0, 0), (size - 7, 0), (0, size - 7)):
+        ring = [modules[y0][x0 + i] for i in range(7)] + [modules[y0 + 6][x0 + i] for i in range(7)]
+        assert all(ring)
+        assert not modules[y0 + 1][x0 + 1] and modules[y0 + 3][x0 + 3]
+
+
+@pytest.mark.parametrize("text", ["ditto", "https://short-url.leapcell.app/summer-sale-2026"])
+def test_codewords_read_back_from_the_matrix(text):
+    modules = encode(text, 'M')
+    version = (len(modules) - 17) // 4
+    mask = (int(read_format(modules)[0], 2) ^ 0x5412) >> 10 & 7
+    template = QrMatrix(version)
+    template.draw_function_patterns()
+    bits = []
+    right = len(modules) - 1
+    while right >= 1:
+        if right == 6:
+            right = 5
+        upward = (right + 1) & 2 == 0
+        for vertical in range(len(modules)):
+            y = len(modules) - 1 - vertical if upward else vertical
+            for x in (right, right - 1):
+                if not template.function[y][x]:
+                    bits.append("1" if modules[y][x] != MASKS[mask](x, y) else "0")
+        right -= 2
+    read = [int("".join(bits[i:i + 8]), 2) for i in range(0, len(bits) - 7, 8)]
+    _, codewords = encode_data(text.encode('utf-8'), ECC_LEVELS['M'][0])
+    assert read == add_error_correction(codewords, version, ECC_LEVELS['M'][0])
+
+
+def png_pixels(png):
+    assert png.startswith(b"\x89PNG\r\n\x1a\n")
+    chunks, position = {}, 8
+    while position < len(png):
+        length, kind = struct.unpack(">I4s", png[position:position + 8])
+        data = png[position + 8:position + 8 + length]
+        assert struct.unpack(">I", png[position + 8 + length:position + 12 + length])[0] == zlib.crc32(kind + data)
+        chunks[kind] = data
+        position += 12 + length
+    width, height, depth, color = struct.unpack(">IIBB", chunks[b"IHDR"][:10])
+    assert (width, depth, color) == (height, 1, 0)
+    stride = (width + 7) // 8 + 1
+    raw = zlib.decompress(chunks[b"IDAT"])
+    rows = [raw[i + 1:i + stride] for i in range(0, len(raw), stride)]
+    return [[not (row[x // 8] >> (7 - x % 8)) & 1 for x in range(width)] for row in rows]
+
+
+def test_png_draws_each_module_scale_pixels_wide_inside_the_quiet_zone():
+    modules = encode("ditto")
+    pixels = png_pixels(render_png(modules, scale=3, border=4))
+    assert len(pixels) == (21 + 8) * 3
+    assert not any(pixels[0]) and not any(pixels[-1])
+    for y in range(21):
+        for x in range(21):
+            assert pixels[(y + 4) * 3 + 1][(x + 4) * 3 + 2] == modules[y][x]
+
+
+def test_rendered_images_are_cached(monkeypatch):
+    monkeypatch.setattr(ditto_qr, "qr_cache", ditto_qr.LRUCache(4))
+    first = qr_png("https://sho.rt/promo", scale=2)
+    assert qr_png("https://sho.rt/promo", scale=2) is first
+    assert qr_png("https://sho.rt/promo", scale=3) is not first
@@ -0,0 +1,113 @@
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+from ditto_ratelimit import DEFAULT_THROTTLE_BACKOFF, RateLimiter, TokenBucket, parse_reset, parse_retry_after
+
+
+def test_bucket_hands_out_its_burst_then_paces_requests():
+    bucket = TokenBucket(10, 3)
+    now = bucket.updated
+    assert [bucket.reserve(now) for _ in range(3)] == [0.0] * 3
+    assert abs(bucket.reserve(now) - 0.1) < 1e-9
+    assert abs(bucket.reserve(now) - 0.2) < 1e-9
+
+
+def test_bucket_refills_up_to_its_capacity():
+    bucket = TokenBucket(10, 3)
+    now = bucket.updated
+    for _ in range(3):
+        bucket.reserve(now)
+    assert bucket.reserve(now + 0.1) == 0.0
+    # An idle minute refills the burst, not 600 tokens
+    later = now + 60
+    assert [bucket.reserve(later) for _ in range(3)] == [0.0] * 3
+    assert bucket.reserve(later) > 0
+
+
+def test_zero_rate_disables_the_bucket():
+    bucket = TokenBucket(0, 0)
+    assert all(bucket.reserve(bucket.updated) == 0.0 for _ in range(100))
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("2.5") == 2.5
+    assert parse_retry_after("-3") == 0.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("soon") is None
+    in_a_minute = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=60), usegmt=True)
+    assert 55 < parse_retry_after(in_a_minute) <= 60
+
+
+def test_parse_reset_takes_seconds_or_a_timestamp():
+    assert parse_reset("4") == 4.0
+    assert 8 < parse_reset(str(time.time() + 10)) <= 10
+    assert parse_reset(str(time.time() - 10)) == 0.0
+    assert parse_reset(None) is None
+    assert parse_reset("tomorrow") is None
+
+
+def test_429_pauses_the_global_bucket_for_retry_after():
+    limiter = RateLimiter(rate=100, burst=100)
+    delay = limiter.observe({'status': 429, 'headers': {'retry-after': "2"}})
+    assert delay == 2.0
+    assert 1.9 < limiter.bucket.reserve(time.monotonic()) <= 2.0
+
+
+def test_429_without_retry_after_backs_off():
+    limiter = RateLimiter(rate=100, burst=100)
+    assert limiter.observe({'status': 429, 'headers': {}}) == DEFAULT_THROTTLE_BACKOFF
+
+
+def test_exhausted_quota_pauses_until_the_reset():
+    limiter = RateLimiter(rate=100, burst=100)
+    assert limiter.observe({'status': 200, 'headers': {'x-ratelimit-remaining': "0", 'x-ratelimit-reset': "3"}}) is None
+    assert 2.9 < limiter.bucket.reserve(time.monotonic()) <= 3.0
+
+
+def test_remaining_quota_doesnt_pause():
+    limiter = RateLimiter(rate=100, burst=100)
+    limiter.observe({'status': 200, 'headers': {'ratelimit-remaining': "5", 'ratelimit-reset': "3"}})
+    limiter.observe({'status': 200, 'headers': {'ratelimit-remaining': "n/a", 'ratelimit-reset': "3"}})
+    assert limiter.bucket.reserve(time.monotonic()) == 0.0
+
+
+def test_interactive_requests_are_charged():
+    limiter = RateLimiter(rate=10, burst=10)
+    session = TokenBucket(10, 10)
+
+    async def clicks(count):
+        for _ in range(count):
+            await limiter.acquire(session, interactive=True)
+
+    asyncio.run(clicks(15))
+    # The clicks borrowed five tokens past the burst, which the next bulk request waits for
+    assert limiter.bucket.reserve(time.monotonic()) > 0.5
+    assert session.reserve(time.monotonic()) > 0.5
+
+
+def test_interactive_requests_borrow_one_burst_ahead():
+    bucket = TokenBucket(10, 10)
+    now = bucket.updated
+    delays = [bucket.reserve(now, borrow=bucket.capacity) for _ in range(25)]
+    # 10 tokens in the bucket and 10 borrowed are free, after that clicks wait too
+    assert delays[:20] == [0.0] * 20
+    assert delays[20] > 0
+    assert delays[24] > delays[20]
+
+
+def test_borrowed_tokens_push_back_bulk_requests():
+    bucket = TokenBucket(10, 10)
+    now = bucket.updated
+    for _ in range(15):
+        bucket.reserve(now, borrow=bucket.capacity)
+    # Five tokens owed, so a bulk request waits for them and its own: 0.6 s at 10/s
+    assert abs(bucket.reserve(now) - 0.6) < 1e-9
+
+
+def test_interactive_requests_respect_pauses():
+    bucket = TokenBucket(10, 10)
+    now = bucket.updated
+    bucket.block_until(now + 3.0)
+    assert bucket.reserve(now, borrow=bucket.capacity) == 3.0
@@ -0,0 +1,88 @@
+import asyncio
+
+from ditto_scheduler import BACKGROUND, BULK, DEFAULT_LIMITS, INTERACTIVE, RequestScheduler, parse_limits
+
+
+def test_parse_limits():
+    assert parse_limits(None) == DEFAULT_LIMITS
+    assert parse_limits("bulk=2, background=1") == {INTERACTIVE: 16, BACKGROUND: 1, BULK: 2}
+    # Unknown classes and bad numbers keep the defaults; zero still leaves one slot
+    assert parse_limits("bulk=x,other=3,interactive=0") == {**DEFAULT_LIMITS, INTERACTIVE: 1}
+
+
+async def run_requests(scheduler, priority, count, seconds=0.01):
+    active = peak = 0
+    order = []
+
+    async def request(i):
+        nonlocal active, peak
+        async with scheduler.slot(priority):
+            active += 1
+            peak = max(peak, active)
+            order.append(i)
+            await asyncio.sleep(seconds)
+            active -= 1
+
+    await asyncio.gather(*(request(i) for i in range(count)))
+    return peak, order
+
+
+def test_class_limit_caps_concurrency_in_arrival_order():
+    scheduler = RequestScheduler({INTERACTIVE: 4, BACKGROUND: 1, BULK: 3})
+    peak, order = asyncio.run(run_requests(scheduler, BULK, 20))
+    assert peak == 3
+    assert order == list(range(20))
+    assert scheduler.stats()[BULK]['active'] == 0
+
+
+def test_full_class_doesnt_hold_up_another():
+    scheduler = RequestScheduler({INTERACTIVE: 4, BACKGROUND: 1, BULK: 1})
+
+    async def run():
+        bulk = asyncio.ensure_future(run_requests(scheduler, BULK, 10, seconds=0.05))
+        await asyncio.sleep(0)
+        await asyncio.wait_for(run_requests(scheduler, INTERACTIVE, 4), timeout=0.1)
+        await bulk
+
+    asyncio.run(run())
+
+
+def test_unknown_priority_uses_the_interactive_class():
+    scheduler = RequestScheduler({INTERACTIVE: 1, BACKGROUND: 1, BULK: 1})
+    assert scheduler.slot("urgent").priority == INTERACTIVE
+
+
+def test_cancelled_waiters_give_up_their_place():
+    scheduler = RequestScheduler({INTERACTIVE: 1, BACKGROUND: 1, BULK: 1})
+
+    async def run():
+        await scheduler.acquire(BULK)
+        waiter = asyncio.ensure_future(scheduler.acquire(BULK))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        scheduler.release(BULK)
+        # The slot is free again rather than handed to the cancelled waiter
+        await asyncio.wait_for(scheduler.acquire(BULK), timeout=0.1)
+
+    asyncio.run(run())
+    assert scheduler.classes[BULK].active == 1
+    assert not scheduler.classes[BULK].waiters
+
+
+def test_slot_handed_to_a_cancelled_waiter_is_passed_on():
+    scheduler = RequestScheduler({INTERACTIVE: 1, BACKGROUND: 1, BULK: 1})
+
+    async def run():
+        await scheduler.acquire(BULK)
+        first = asyncio.ensure_future(scheduler.acquire(BULK))
+        second = asyncio.ensure_future(scheduler.acquire(BULK))
+        await asyncio.sleep(0)
+        # The slot is handed over, then the waiter is cancelled before it resumes
+        scheduler.release(BULK)
+        first.cancel()
+        await asyncio.gather(first, return_exceptions=True)
+        await asyncio.wait_for(second, timeout=0.1)
+
+    asyncio.run(run())
+    assert scheduler.classes[BULK].active == 1
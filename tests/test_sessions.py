@@ -0,0 +1,130 @@
+import asyncio
+
+import pytest
+
+import ditto_sessions
+from ditto_api import SessionData
+from ditto_sessions import DISCONNECTED_TIMEOUT, IDLE_TIMEOUT, MAX_INFLIGHT_REQUESTS, SessionRegistry
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakePage:
+    def __init__(self):
+        self.session_data = SessionData()
+        self.updates = 0
+
+    def update(self, *controls):
+        self.updates += 1
+
+
+def release(page):
+    """What the app's on_reap does to a session's state"""
+    page.session_data = SessionData()
+    page.update()
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ditto_sessions, "monotonic", clock)
+    return clock
+
+
+@pytest.fixture
+def registry():
+    return SessionRegistry()
+
+
+def test_idle_session_is_reaped_once(clock, registry):
+    page, reaped = FakePage(), []
+    registry.register(page, reaped.append)
+    clock.now += IDLE_TIMEOUT - 1
+    assert registry.reap_idle() == 0
+    clock.now += 1
+    assert registry.reap_idle() == 1
+    assert registry.reap_idle() == 0
+    assert reaped == [page]
+    assert registry.counts() == {'live': 0, 'idle': 0, 'reaped': 1}
+
+
+def test_reaping_releases_the_inflight_budget(clock, registry):
+    page = FakePage()
+    registry.register(page, release)
+
+    async def exhaust():
+        budget = page.session_data.inflight_budget()
+        for _ in range(MAX_INFLIGHT_REQUESTS):
+            await budget.acquire()
+        return budget
+
+    held = asyncio.run(exhaust())
+    assert held.locked()
+    clock.now += IDLE_TIMEOUT
+    registry.reap_idle()
+    budget = page.session_data.inflight_budget()
+    assert budget is not held
+    assert not budget.locked()
+    assert budget._value == MAX_INFLIGHT_REQUESTS
+
+
+def test_activity_resets_the_idle_timer(clock, registry):
+    page, reaped = FakePage(), []
+    registry.register(page, reaped.append)
+    clock.now += IDLE_TIMEOUT - 1
+    page.update()
+    clock.now += IDLE_TIMEOUT - 1
+    assert registry.reap_idle() == 0
+    assert registry.counts() == {'live': 0, 'idle': 1, 'reaped': 0}
+    clock.now += 1
+    assert registry.reap_idle() == 1
+    assert reaped == [page]
+
+
+def test_updates_while_reaping_are_not_activity(clock, registry):
+    page = FakePage()
+    session = registry.register(page, release)
+    clock.now += IDLE_TIMEOUT
+    registry.reap_idle()
+    assert page.updates == 1
+    assert session.reaped
+    assert session.last_active == clock.now - IDLE_TIMEOUT
+    # The user coming back revives the session
+    page.update()
+    assert registry.counts() == {'live': 1, 'idle': 0, 'reaped': 0}
+
+
+def test_disconnected_session_is_reaped_sooner(clock, registry):
+    connected, dropped, reaped = FakePage(), FakePage(), []
+    registry.register(connected, reaped.append)
+    registry.register(dropped, reaped.append)
+    registry.disconnected(dropped)
+    clock.now += DISCONNECTED_TIMEOUT
+    assert registry.reap_idle() == 1
+    assert reaped == [dropped]
+
+
+def test_failing_on_reap_still_marks_the_session_reaped(clock, registry):
+    def on_reap(page):
+        raise RuntimeError("socket closed")
+
+    session = registry.register(FakePage(), on_reap)
+    clock.now += IDLE_TIMEOUT
+    assert registry.reap_idle() == 1
+    assert session.reaped
+    assert not session.reaping
+
+
+def test_unregistered_session_is_not_reaped(clock, registry):
+    page, reaped = FakePage(), []
+    registry.register(page, reaped.append)
+    registry.unregister(page)
+    clock.now += IDLE_TIMEOUT
+    assert registry.reap_idle() == 0
+    assert reaped == []
@@ -0,0 +1,134 @@
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+import ditto_logging
+import ditto_tracing
+from ditto_tracing import BatchExporter, otlp_span, span, span_record, traced
+
+
+class RecordingExporter:
+    def __init__(self):
+        self.spans = []
+
+    def submit(self, span, end_ns):
+        self.spans.append((span, end_ns))
+
+
+class FlakyExporter(BatchExporter):
+    """Fails its first export, then records every batch"""
+    def __init__(self):
+        self.batches = []
+        self.exported = threading.Event()
+        super().__init__()
+
+    def export(self, batch):
+        if not self.batches:
+            self.batches.append(None)
+            raise ConnectionRefusedError("collector is down")
+        self.batches.append([span.name for span, end_ns in batch])
+        self.exported.set()
+
+
+@pytest.fixture
+def exporter(monkeypatch):
+    exporter = RecordingExporter()
+    monkeypatch.setattr(ditto_tracing.tracer, "exporter", exporter)
+    monkeypatch.setattr(ditto_tracing.tracer, "sample_rate", 1.0)
+    return exporter
+
+
+def test_spans_nest_under_the_current_span(exporter):
+    @traced("ui.on_click")
+    async def on_click():
+        with span("api.request", path="/details") as request:
+            await asyncio.sleep(0)
+            with span("http.send"):
+                pass
+        request.set('status', 200)
+
+    asyncio.run(on_click())
+    [(send, _), (request, _), (click, _)] = exporter.spans
+    assert [s.name for s in (send, request, click)] == ["http.send", "api.request", "ui.on_click"]
+    assert send.trace_id == request.trace_id == click.trace_id
+    assert (send.parent_id, request.parent_id, click.parent_id) == (request.span_id, click.span_id, None)
+    assert request.attributes == {'path': "/details", 'status': 200}
+    assert ditto_tracing.current_span.get() is None
+
+
+def test_concurrent_handlers_get_separate_traces(exporter):
+    @traced("ui.on_click")
+    async def on_click():
+        with span("api.request"):
+            await asyncio.sleep(0.01)
+
+    async def run():
+        await asyncio.gather(on_click(), on_click())
+
+    asyncio.run(run())
+    roots = [s for s, _ in exporter.spans if s.parent_id is None]
+    children = [s for s, _ in exporter.spans if s.parent_id is not None]
+    assert len({s.trace_id for s in roots}) == 2
+    assert {s.parent_id for s in children} == {s.span_id for s in roots}
+
+
+def test_span_records_its_status(exporter):
+    with pytest.raises(ValueError):
+        with span("ui.on_save_click"):
+            with span("api.request"):
+                raise ValueError("boom")
+    with span("ui.on_refresh_click"):
+        pass
+
+    (failed_child, end_ns), (failed, _), (ok, ok_end_ns) = exporter.spans
+    assert failed_child.error == failed.error == "ValueError: boom"
+    assert span_record(failed_child, end_ns)['error'] == "ValueError: boom"
+    assert otlp_span(failed_child, end_ns)['status'] == {'code': 2, 'message': "ValueError: boom"}
+    assert span_record(ok, ok_end_ns)['error'] is None
+    assert otlp_span(ok, ok_end_ns)['status'] == {'code': 1}
+
+
+def test_unsampled_traces_export_nothing(exporter, monkeypatch):
+    monkeypatch.setattr(ditto_tracing.tracer, "sample_rate", 0.0)
+    with span("ui.on_click") as root:
+        with span("api.request") as child:
+            child.set('status', 200)
+    assert not root.sampled and not child.sampled
+    assert child.attributes == {}
+    assert exporter.spans == []
+
+
+def test_tracing_off_uses_the_noop_span(monkeypatch):
+    monkeypatch.setattr(ditto_tracing.tracer, "exporter", None)
+    assert span("ui.on_click") is ditto_tracing.NOOP_SPAN
+
+
+def test_exporter_survives_a_failed_export(monkeypatch, tmp_path):
+    log_path = tmp_path / "ditto.log.jsonl"
+    ditto_logging.configure("file", str(log_path), "INFO", {})
+    exporter = FlakyExporter()
+    monkeypatch.setattr(ditto_tracing.tracer, "exporter", exporter)
+    monkeypatch.setattr(ditto_tracing.tracer, "sample_rate", 1.0)
+    try:
+        with span("ui.lost"):
+            pass
+        # Wait for the failed batch before sending the next, so they aren't exported together
+        for _ in range(200):
+            if exporter.batches:
+                break
+            time.sleep(0.01)
+        with span("ui.kept"):
+            pass
+        assert exporter.exported.wait(5)
+    finally:
+        ditto_logging.logs.stop()
+        ditto_logging.configure("off")
+
+    assert exporter.batches == [None, ["ui.kept"]]
+    [record] = [json.loads(line) for line in log_path.read_text(encoding='utf-8').splitlines()]
+    assert record['event'] == "trace export failed"
+    assert record['error'] == "collector is down"
+    assert (record['exporter'], record['spans']) == ("FlakyExporter", 1)
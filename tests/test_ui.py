@@ -0,0 +1,327 @@
+import asyncio
+import threading
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+ft = pytest.importorskip("flet")
+
+import bench_pages
+import ditto
+import ditto_api
+import ditto_history
+import ditto_qr
+import ditto_sessions
+from ditto_jobs import JobScheduler
+from ditto_linkhealth import OK, LinkStatus
+
+
+async def dispatch(page, name):
+    """Call a handler the way Flet does: coroutine functions on the loop, plain ones in a worker thread"""
+    control, handler = bench_pages.find_handler(page, name)
+    event = SimpleNamespace(control=control, page=page, data=None)
+    if asyncio.iscoroutinefunction(handler):
+        await handler(event)
+    else:
+        await asyncio.get_running_loop().run_in_executor(None, handler, event)
+
+
+def find_control(page, predicate):
+    for root in page.controls:
+        for control in bench_pages.walk(root):
+            if predicate(control):
+                return control
+    raise LookupError("No matching control")
+
+
+async def settle():
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+@pytest.fixture(autouse=True)
+def canned_api(monkeypatch):
+    monkeypatch.setattr(ditto_api, "transport", bench_pages.CannedTransport())
+
+
+class FakeLinkChecker:
+    def __init__(self):
+        self.checks = []
+
+    def available(self):
+        return True
+
+    def cached(self, url):
+        return None
+
+    async def check(self, url, force=False):
+        self.checks.append((url, force))
+        return LinkStatus(url, OK, 200, [(url, 200)])
+
+
+def test_link_recheck_button(monkeypatch):
+    checker = FakeLinkChecker()
+    monkeypatch.setattr(ditto, "link_checker", checker)
+
+    async def run():
+        page = bench_pages.new_page(asyncio.get_running_loop(), bench_pages.BenchConnection())
+        await bench_pages.build_manage(page)
+        await settle()
+        await dispatch(page, "on_link_health_click")
+        await settle()
+        return page
+
+    asyncio.run(run())
+    url = bench_pages.CANNED[('GET', '/details')]['data']['url']
+    assert checker.checks == [(url, False), (url, True)]
+
+
+class RecordingJobs(JobScheduler):
+    """Records the thread every change to the schedule is made from"""
+    def __init__(self, path):
+        super().__init__(path)
+        self.threads = []
+
+    def schedule(self, *args, **kwargs):
+        self.threads.append(threading.current_thread())
+        return super().schedule(*args, **kwargs)
+
+    def cancel(self, job_id):
+        self.threads.append(threading.current_thread())
+        return super().cancel(job_id)
+
+
+def test_scheduling_stays_on_the_event_loop(monkeypatch, tmp_path):
+    jobs = RecordingJobs(str(tmp_path / "jobs.json"))
+    monkeypatch.setattr(ditto, "jobs", jobs)
+
+    async def run():
+        page = bench_pages.new_page(asyncio.get_running_loop(), bench_pages.BenchConnection())
+        await bench_pages.build_manage(page)
+        await settle()
+        when_field = find_control(page, lambda control: getattr(control, 'label', None) == "When (local time)")
+        when_field.value = (datetime.now() + timedelta(days=1)).strftime(ditto.SCHEDULE_FORMAT)
+        await dispatch(page, "on_schedule_click")
+        scheduled = jobs.pending_for(bench_pages.ALIAS)
+        await dispatch(page, "on_cancel_click")
+        return scheduled
+
+    scheduled = asyncio.run(run())
+    assert [job.action for job in scheduled] == ["pause"]
+    assert not jobs.jobs
+    # The scheduler's heap and timers belong to the loop; a worker thread must never touch them
+    assert jobs.threads == [threading.main_thread()] * 2
+
+
+class FakeClientStorage:
+    """One browser's client storage"""
+    def __init__(self, answers=True):
+        self.values = {}
+        self.answers = answers
+
+    async def get_async(self, key):
+        if not self.answers:
+            await asyncio.sleep(3600)
+        return self.values.get(key)
+
+    async def set_async(self, key, value):
+        self.values[key] = value
+        return True
+
+
+def browser_page(storage):
+    return SimpleNamespace(session_data=ditto_api.SessionData(), client_storage=storage)
+
+
+def test_browsers_dont_share_link_history(monkeypatch, tmp_path):
+    monkeypatch.setattr(ditto_history, "HISTORY_DIR", str(tmp_path))
+    first_browser, second_browser = FakeClientStorage(), FakeClientStorage()
+
+    async def run():
+        first = await ditto.user_history(browser_page(first_browser))
+        first.add("https://private.example/mine", "mine", "")
+        second = await ditto.user_history(browser_page(second_browser))
+        # Another tab of the first browser finds the same history
+        again = await ditto.user_history(browser_page(first_browser))
+        return first, second, again
+
+    first, second, again = asyncio.run(run())
+    assert second.search("") == []
+    assert again is first
+    assert [entry['alias'] for entry in again.search("")] == ["mine"]
+
+
+def test_history_without_client_storage_lasts_the_session(monkeypatch, tmp_path):
+    monkeypatch.setattr(ditto_history, "HISTORY_DIR", str(tmp_path))
+    monkeypatch.setattr(ditto, "HISTORY_ID_TIMEOUT", 0.05)
+    page = browser_page(FakeClientStorage(answers=False))
+
+    async def run():
+        # Concurrent callers share one lookup
+        return await asyncio.gather(ditto.user_history(page), ditto.user_history(page))
+
+    first, second = asyncio.run(run())
+    assert first is second
+    assert first.path is None
+
+
+class BulkTransport(bench_pages.CannedTransport):
+    """Logins succeed only with the password 'right', pauses fail after waiting for release"""
+    def __init__(self):
+        self.logins = {}
+        self.pauses = 0
+        self.release = asyncio.Event()
+
+    async def send(self, url, method, data, forward):
+        path = url[len(ditto_api.API_BASE_URL):]
+        if path == "/login":
+            self.logins[data['url_code']] = data['url_pass']
+            if data['url_pass'].strip() != "right":
+                return {'ok': False, 'status': 401, 'body': {'detail': "Invalid password"}, 'headers': {}}
+            return {'ok': True, 'status': 200, 'body': {'access_token': f"token-{data['url_code']}"}, 'headers': {}}
+        if path == "/pause":
+            self.pauses += 1
+            await self.release.wait()
+            return {'ok': False, 'status': 503, 'body': {'detail': "Try again later"}, 'headers': {}}
+        return await super().send(url, method, data, forward)
+
+
+def test_bulk_login_keeps_passwords_verbatim_and_hidden(monkeypatch):
+    transport = BulkTransport()
+    monkeypatch.setattr(ditto_api, "transport", transport)
+
+    async def run():
+        page = bench_pages.new_page(asyncio.get_running_loop(), bench_pages.BenchConnection())
+        await bench_pages.build_manage(page)
+        credentials_field = find_control(page, lambda control: getattr(control, 'label', None) == "Aliases to add")
+        credentials_field.value = "  first right\nsecond  right \nthird wrong-secret\n\n"
+        await dispatch(page, "on_login_all_click")
+        return page, credentials_field
+
+    page, credentials_field = asyncio.run(run())
+    assert transport.logins == {'first': "right", 'second': " right ", 'third': "wrong-secret"}
+    assert set(page.session_data.alias_tokens) == {bench_pages.ALIAS, "first", "second"}
+    # The failed alias is left for another try, without its password
+    assert credentials_field.value == "third "
+
+
+def test_retry_runs_once_for_repeated_clicks(monkeypatch):
+    transport = BulkTransport()
+    monkeypatch.setattr(ditto_api, "transport", transport)
+
+    async def run():
+        page = bench_pages.new_page(asyncio.get_running_loop(), bench_pages.BenchConnection())
+        await bench_pages.build_manage(page)
+        checkbox = find_control(page, lambda control: getattr(control, 'data', None) == bench_pages.ALIAS)
+        checkbox.value = True
+        pause_button = find_control(page, lambda control: isinstance(control, ft.ElevatedButton) and control.text == "Pause")
+        transport.release.set()
+        await pause_button.on_click(SimpleNamespace(control=pause_button, page=page, data=None))
+        assert transport.pauses == 1
+
+        transport.release.clear()
+        clicks = [asyncio.ensure_future(dispatch(page, "on_retry_click")) for _ in range(2)]
+        await settle()
+        transport.release.set()
+        await asyncio.gather(*clicks)
+
+    asyncio.run(run())
+    assert transport.pauses == 2
+
+
+class RecordingCache(ditto_api.LRUCache):
+    """Records the thread every lookup and insert is made from"""
+    def __init__(self, maxsize):
+        super().__init__(maxsize)
+        self.threads = []
+
+    def get(self, key):
+        self.threads.append(threading.current_thread())
+        return super().get(key)
+
+    def set(self, key, value):
+        self.threads.append(threading.current_thread())
+        return super().set(key, value)
+
+
+def test_qr_download_renders_on_the_event_loop(monkeypatch, tmp_path):
+    cache = RecordingCache(8)
+    monkeypatch.setattr(ditto_qr, "qr_cache", cache)
+    monkeypatch.setattr(ditto, "EXPORT_DIR", str(tmp_path))
+
+    async def run():
+        page = bench_pages.new_page(asyncio.get_running_loop(), bench_pages.BenchConnection())
+        await bench_pages.build_main(page)
+        link = find_control(page, lambda control: getattr(getattr(control, 'on_click', None), '__name__', None) == "on_url_click")
+        link.content.data = "https://sho.rt/promo"
+        await dispatch(page, "on_download_qr_click")
+        await dispatch(page, "on_download_qr_click")
+
+    asyncio.run(run())
+    # A miss and a hit; the cache is not thread-safe, so only the loop may use it
+    assert cache.threads == [threading.main_thread()] * 3
+    assert (tmp_path / "qr-promo.png").read_bytes() == ditto_qr.qr_png("https://sho.rt/promo", scale=ditto.QR_DOWNLOAD_SCALE)
+
+
+def test_reaped_session_releases_its_logins_and_budget():
+    async def run():
+        page = bench_pages.new_page(asyncio.get_running_loop(), bench_pages.BenchConnection())
+        await bench_pages.build_manage(page)
+        held = page.session_data.inflight_budget()
+        for _ in range(ditto_sessions.MAX_INFLIGHT_REQUESTS):
+            await held.acquire()
+        registry = ditto_sessions.SessionRegistry()
+        registry.register(page, ditto.reap_session)
+        registry.reap_idle(now=ditto_sessions.monotonic() + ditto_sessions.IDLE_TIMEOUT)
+        return page, held
+
+    page, held = asyncio.run(run())
+    assert page.session_data.alias_tokens == {}
+    assert page.session_data.inflight_budget() is not held
+    assert not page.session_data.inflight_budget().locked()
+    assert bench_pages.find_handler(page, "on_continue_click")
+
+
+class DetailsTransport(bench_pages.CannedTransport):
+    """Answers /details with whatever details currently holds"""
+    def __init__(self):
+        self.details = dict(bench_pages.CANNED[('GET', '/details')]['data'])
+
+    async def send(self, url, method, data, forward):
+        if url.endswith("/details"):
+            return {'ok': True, 'status': 200, 'body': {'data': dict(self.details)}, 'headers': {}}
+        return await super().send(url, method, data, forward)
+
+
+def test_refresh_redraws_only_changed_fields(monkeypatch):
+    transport = DetailsTransport()
+    monkeypatch.setattr(ditto_api, "transport", transport)
+
+    async def run():
+        page = bench_pages.new_page(asyncio.get_running_loop(), bench_pages.BenchConnection())
+        await bench_pages.build_manage(page)
+        await settle()
+        created_text = find_control(page, lambda control: str(getattr(control, 'value', "")).startswith("Created: "))
+        hits_text = find_control(page, lambda control: str(getattr(control, 'value', "")).startswith("Hits: "))
+        updates = []
+        update = page.update
+
+        def counting_update(*controls):
+            updates.append(controls)
+            update(*controls)
+
+        page.update = counting_update
+
+        await dispatch(page, "on_refresh_click")
+        unchanged_updates = len(updates)
+        transport.details['url_created_at'] = None
+        await dispatch(page, "on_refresh_click")
+        return created_text, hits_text, unchanged_updates, len(updates) - unchanged_updates
+
+    created_text, hits_text, unchanged_updates, cleared_updates = asyncio.run(run())
+    # "Refreshing..." and the result; the details themselves needed no update
+    assert unchanged_updates == 2
+    assert cleared_updates == 3
+    assert created_text.value == ""
+    assert hits_text.value == "Hits: 1234"
@@ -0,0 +1,80 @@
+"""
+Memory and parse cost of the alias data model.
+
+Builds N AliasDetails from /details-shaped answers and reports bytes per alias (traced
+allocations, target URL strings included) next to keeping the raw answer dicts, plus the
+cost of update() when nothing or only the hit count changed.
+
+    python tools/bench_model.py
+    python tools/bench_model.py --aliases 50000 --max-bytes 450   # exit 1 over the target
+
+Needs nothing beyond the standard library.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from ditto_api import AliasDetails
+
+MAX_BYTES_PER_ALIAS = 450  # AliasDetails with its own strings; raw /details dicts take about 750
+
+
+def answers(count):
+    # Decoded from JSON like real answers, so no strings are shared between aliases
+    return [json.loads(json.dumps({
+        'url': f"https://example.com/campaign/{i}?utm_source=newsletter&utm_medium=email",
+        'url_hits': i * 7,
+        'url_state': i % 3 != 0,
+        'url_created_at': f"2025-{i % 12 + 1:02d}-{i % 28 + 1:02d}T12:{i % 60:02d}:00Z",
+        'url_code': f"alias-{i}",
+    })) for i in range(count)]
+
+
+def traced_bytes(build):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = build()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return kept, used
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure memory per alias of the data model.")
+    parser.add_argument("--aliases", type=int, default=10000)
+    parser.add_argument("--max-bytes", type=float, default=MAX_BYTES_PER_ALIAS, help="bytes per alias above which to exit 1")
+    args = parser.parse_args()
+
+    _, raw_bytes = traced_bytes(lambda: answers(args.aliases))
+    # The answers are dropped once parsed, so only what the models kept is counted
+    models, model_bytes = traced_bytes(lambda: [AliasDetails.from_api(answer, answer['url_code']) for answer in answers(args.aliases)])
+    data = answers(args.aliases)
+
+    started = time.perf_counter()
+    unchanged = sum(len(model.update(answer)) for model, answer in zip(models, data))
+    unchanged_us = (time.perf_counter() - started) / args.aliases * 1e6
+    for answer in data:
+        answer['url_hits'] += 1
+    started = time.perf_counter()
+    hits_changed = sum(len(model.update(answer)) for model, answer in zip(models, data))
+    changed_us = (time.perf_counter() - started) / args.aliases * 1e6
+
+    per_alias = model_bytes / args.aliases
+    print(f"{args.aliases} aliases")
+    print(f"raw /details dicts  {raw_bytes / args.aliases:8.1f} B/alias")
+    print(f"AliasDetails        {per_alias:8.1f} B/alias (target {args.max_bytes:g})")
+    print(f"update, no change   {unchanged_us:8.2f} us/alias, {unchanged} fields changed")
+    print(f"update, hits only   {changed_us:8.2f} us/alias, {hits_changed} fields changed")
+    if per_alias > args.max_bytes:
+        print(f"REGRESSION AliasDetails uses {per_alias:.1f} B/alias, over {args.max_bytes:g}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
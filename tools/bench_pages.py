@@ -0,0 +1,247 @@
+"""
+Build and update benchmarks for Ditto's page builders.
+
+Builds each view on a headless Flet page whose connection serializes every update the
+way the web server does, then drives typical state changes through the real handlers.
+Reports build time, control count, payload bytes and page.update() cost per step.
+
+    python tools/bench_pages.py
+    python tools/bench_pages.py --output bench.json
+    python tools/bench_pages.py --baseline tools/bench_baseline.json   # exit 1 if payloads or control counts grew
+
+API calls are answered instantly from canned responses (or --cassette), so no backend is needed.
+Needs flet.
+"""
+import argparse
+import asyncio
+import copy
+import json
+import os
+import statistics
+import sys
+import time
+from types import SimpleNamespace
+from urllib.parse import urlsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# Nothing a benchmark does belongs in the local link history or the logs, or should probe the canned target URLs
+os.environ.setdefault("DITTO_HISTORY_DIR", "off")
+os.environ.setdefault("DITTO_LINK_HEALTH", "off")
+os.environ.setdefault("DITTO_LOG", "off")
+
+import flet as ft
+from flet.core.local_connection import LocalConnection
+from flet.core.protocol import ClientActions, ClientMessage, CommandEncoder, PageCommandsBatchResponsePayload
+
+import ditto
+import ditto_api
+import ditto_cassette
+
+CANNED = {
+    ('GET', '/health'): {'status': 'ok'},
+    ('GET', '/validate_token'): {'valid': True},
+    ('GET', '/details'): {'data': {
+        'url': 'https://example.com/landing?utm_source=bench',
+        'url_hits': 1234,
+        'url_state': True,
+        'url_created_at': '2025-01-01T12:00:00Z',
+        'url_code': 'bench',
+    }},
+}
+ALIAS = "bench"
+PAYLOAD_METRICS = ('build_bytes', 'controls', 'update_bytes')
+
+
+class CannedTransport:
+    """Answers every API call instantly from CANNED"""
+    async def send(self, url, method, data, forward):
+        body = CANNED.get((method, urlsplit(url).path), {})
+        return {'ok': True, 'status': 200, 'body': copy.deepcopy(body), 'headers': {}}
+
+
+class BenchConnection(LocalConnection):
+    """Serializes outgoing messages exactly as the web server would, and records their sizes"""
+    def __init__(self):
+        super().__init__()
+        self.sent = []
+
+    def send_command(self, session_id, command):
+        result, message = self._process_command(command)
+        if message:
+            self.record(message)
+        return result
+
+    def send_commands(self, session_id, commands):
+        results = []
+        messages = []
+        for command in commands:
+            result, message = self._process_command(command)
+            if command.name in ("add", "get"):
+                results.append(result)
+            if message:
+                messages.append(message)
+        if messages:
+            self.record(ClientMessage(ClientActions.PAGE_CONTROLS_BATCH, messages))
+        return PageCommandsBatchResponsePayload(results=results, error="")
+
+    def record(self, message):
+        self.sent.append(len(json.dumps(message, cls=CommandEncoder, separators=(",", ":")).encode('utf-8')))
+
+    def take(self):
+        sent, self.sent = self.sent, []
+        return sum(sent)
+
+
+def new_page(loop, conn):
+    page = ft.Page(conn, f"bench-{id(conn)}", loop)
+    page.session_data = ditto_api.SessionData()
+    return page
+
+
+def walk(control):
+    yield control
+    for child in control._get_children():
+        yield from walk(child)
+
+
+def count_controls(page):
+    return sum(1 for control in page.controls for _ in walk(control))
+
+
+def find_handler(page, name):
+    """The on_click/on_change handler called name (handlers keep their names through @traced)"""
+    for root in list(page.controls) + list(page.overlay):
+        for control in walk(root):
+            for attr in ('on_click', 'on_change'):
+                handler = getattr(control, attr, None)
+                if handler is not None and getattr(handler, '__name__', None) == name:
+                    return control, handler
+    raise LookupError(f"No control with handler {name}")
+
+
+async def fire(page, name):
+    control, handler = find_handler(page, name)
+    result = handler(SimpleNamespace(control=control, page=page, data=None))
+    if asyncio.iscoroutine(result):
+        await result
+
+
+def logged_in(page):
+    page.session_data.current_alias = ALIAS
+    page.session_data.remember_token(ALIAS, "bench-token")
+
+
+async def build_main(page):
+    ditto.show_main_page(page)
+    page.update()
+
+
+async def build_login(page):
+    ditto.show_login_page(page)
+    page.update()
+
+
+async def build_manage(page):
+    logged_in(page)
+    await ditto.show_manage_alias_page(page)
+    page.update()
+
+
+async def build_down(page):
+    ditto.show_down_page(page)
+    page.update()
+
+
+# view -> (builder, [(state change, handler fired)])
+VIEWS = {
+    'main': (build_main, [('status_text', 'on_shrink_click')]),
+    'login': (build_login, [('status_text', 'on_login_click')]),
+    'manage': (build_manage, [('edit_row', 'toggle_edit_mode'), ('refresh', 'on_refresh_click'), ('password_row', 'toggle_password_edit')]),
+    'down': (build_down, []),
+}
+
+
+async def bench_view(name, runs):
+    builder, changes = VIEWS[name]
+    loop = asyncio.get_running_loop()
+    build_times, update_times = [], {change: [] for change, _ in changes}
+    result = {}
+    for run in range(runs):
+        conn = BenchConnection()
+        page = new_page(loop, conn)
+        started = time.perf_counter()
+        await builder(page)
+        build_times.append(time.perf_counter() - started)
+        result['build_bytes'] = conn.take()
+        result['controls'] = count_controls(page)
+        for change, handler in changes:
+            started = time.perf_counter()
+            await fire(page, handler)
+            update_times[change].append(time.perf_counter() - started)
+            result.setdefault('updates', {})[change] = {'bytes': conn.take()}
+    result['build_ms'] = round(statistics.median(build_times) * 1000, 3)
+    for change, times in update_times.items():
+        result['updates'][change]['ms'] = round(statistics.median(times) * 1000, 3)
+    result['update_bytes'] = sum(update['bytes'] for update in result.get('updates', {}).values())
+    return result
+
+
+def compare(results, baseline, max_growth):
+    """Payload sizes and control counts that grew more than max_growth over the baseline"""
+    regressions = []
+    for view, result in results.items():
+        before = baseline.get(view)
+        if not before:
+            continue
+        for metric in PAYLOAD_METRICS:
+            old, new = before.get(metric), result.get(metric)
+            if old and new is not None and new > old * (1 + max_growth):
+                regressions.append(f"{view}.{metric}: {old} -> {new} (+{(new - old) / old:.0%})")
+    return regressions
+
+
+def print_results(results):
+    print(f"{'view':<8} {'build ms':>9} {'controls':>9} {'build B':>9}   updates (ms / bytes)")
+    for view, result in results.items():
+        updates = ", ".join(f"{change} {u['ms']}/{u['bytes']}" for change, u in result.get('updates', {}).items())
+        print(f"{view:<8} {result['build_ms']:>9} {result['controls']:>9} {result['build_bytes']:>9}   {updates}")
+
+
+async def run(args):
+    results = {}
+    for view in args.views:
+        results[view] = await bench_view(view, args.runs)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Ditto's page builders headlessly.")
+    parser.add_argument("--views", nargs="+", choices=list(VIEWS), default=list(VIEWS))
+    parser.add_argument("--runs", type=int, default=20, help="builds per view; times are medians")
+    parser.add_argument("--cassette", help="replay API responses from a recorded cassette instead of canned ones")
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--baseline", help="results JSON to compare payload sizes and control counts against")
+    parser.add_argument("--max-growth", type=float, default=0.05, help="allowed growth over the baseline (0.05 = 5%%)")
+    args = parser.parse_args()
+
+    ditto_api.transport = ditto_cassette.Cassette(args.cassette, "replay", 0) if args.cassette else CannedTransport()
+    results = asyncio.run(run(args))
+    print_results(results)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.max_growth)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
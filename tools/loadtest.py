@@ -0,0 +1,361 @@
+"""
+Concurrent-session load generator for the Ditto Flet server.
+
+Starts the in-memory mock backend and a headless Ditto web server, then drives N
+simulated browser sessions over Flet's websocket protocol through the real flows:
+open the main page, shrink a URL, log in to the manage page and pause the alias.
+
+    python tools/loadtest.py --sessions 1,10,50,100
+    python tools/loadtest.py --sessions 20 --backend-latency 0.05 --output loadtest.json
+
+Needs flet (with its web server) and websockets, which flet's web server pulls in.
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mock_backend import MockBackend
+
+ACTIONS = ['open', 'shrink', 'login', 'toggle']
+
+SERVER_CODE = """
+import os, sys
+sys.path.insert(0, {root!r})
+import flet as ft
+import ditto
+ft.app(target=ditto.main, view=None, port=int(os.environ['DITTO_LOADTEST_PORT']))
+"""
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Ditto server did not start on port {port}")
+
+
+def process_rss(pid):
+    """Resident set size of a process in bytes, or None if it can't be read"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import psutil
+        return psutil.Process(pid).memory_info().rss
+    except Exception:
+        return None
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class SimulatedSession:
+    """One browser tab: mirrors the server's control tree and sends UI events"""
+    def __init__(self, ws_url, index, run_id):
+        self.ws_url = ws_url
+        self.alias = f"lt{run_id}-{index}"
+        self.controls = {}  # control id -> props, including 't' (type), 'p' (parent) and 'c' (children)
+        self.changed = asyncio.Event()
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.crashed = None
+        self.ws = None
+        self.reader = None
+
+    async def connect(self):
+        import websockets
+        self.ws = await websockets.connect(self.ws_url, max_size=None)
+        self.reader = asyncio.create_task(self.read_loop())
+
+    async def close(self):
+        if self.ws:
+            await self.ws.close()
+        if self.reader:
+            self.reader.cancel()
+
+    async def send(self, action, payload):
+        message = json.dumps({'action': action, 'payload': payload})
+        self.bytes_out += len(message.encode('utf-8'))
+        await self.ws.send(message)
+
+    async def read_loop(self):
+        async for message in self.ws:
+            self.bytes_in += len(message.encode('utf-8') if isinstance(message, str) else message)
+            self.apply(json.loads(message))
+            self.changed.set()
+
+    def apply(self, message):
+        action = message.get('action')
+        payload = message.get('payload') or {}
+        if action == 'pageControlsBatch':
+            # Updates from one page.update() arrive as a batch of the messages below
+            for inner in payload:
+                self.apply(inner)
+        elif action == 'registerWebClient':
+            for control_id, control in ((payload.get('session') or {}).get('controls') or {}).items():
+                self.controls[control_id] = dict(control, i=control_id)
+        elif action == 'addPageControls':
+            for control in payload.get('controls') or []:
+                self.store(control)
+            for control_id in payload.get('trimIDs') or []:
+                self.remove(control_id)
+        elif action in ('updateControlProps', 'appendControlProps'):
+            for props in payload.get('props') or []:
+                self.controls.setdefault(props['i'], {}).update(props)
+        elif action == 'removeControl':
+            for control_id in payload.get('ids') or []:
+                self.remove(control_id)
+        elif action == 'cleanControl':
+            for control_id in payload.get('ids') or []:
+                for child_id in list(self.controls.get(control_id, {}).get('c') or []):
+                    self.remove(child_id)
+        elif action == 'sessionCrashed':
+            self.crashed = payload.get('message', 'session crashed')
+
+    def store(self, control):
+        control_id = control['i']
+        self.controls[control_id] = control
+        parent = self.controls.get(control.get('p'))
+        if parent is not None:
+            children = parent.setdefault('c', [])
+            if control_id not in children:
+                children.append(control_id)
+
+    def remove(self, control_id):
+        control = self.controls.pop(control_id, None)
+        if control is None:
+            return
+        for child_id in control.get('c') or []:
+            self.remove(child_id)
+        parent = self.controls.get(control.get('p'))
+        if parent is not None and control_id in (parent.get('c') or []):
+            parent['c'].remove(control_id)
+
+    def find(self, control_type, **props):
+        """Newest control of a type with the given props"""
+        def prop_matches(actual, value):
+            # Some props (e.g. tooltip) arrive JSON-encoded
+            return actual == value or (isinstance(actual, str) and f'"{value}"' in actual)
+
+        matches = [
+            control for control in self.controls.values()
+            if control.get('t') == control_type
+            and all(prop_matches(control.get(key), value) for key, value in props.items())
+        ]
+        if not matches:
+            return None
+        return max(matches, key=lambda control: int(str(control['i']).lstrip('_') or 0))
+
+    async def wait_for(self, predicate, timeout=30):
+        deadline = time.monotonic() + timeout
+        while not predicate():
+            if self.crashed:
+                raise RuntimeError(self.crashed)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError("timed out waiting for the UI to update")
+            self.changed.clear()
+            try:
+                await asyncio.wait_for(self.changed.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+
+    async def click(self, control):
+        await self.send('pageEventFromWeb', {'eventTarget': control['i'], 'eventName': 'click', 'eventData': ''})
+
+    async def type_into(self, control, value):
+        # The browser syncs the value prop, then fires the change event
+        control['value'] = value
+        await self.send('updateControlProps', {'props': [{'i': control['i'], 'value': value}]})
+        await self.send('pageEventFromWeb', {'eventTarget': control['i'], 'eventName': 'change', 'eventData': value})
+
+    def has_text(self, value, exact=True):
+        return any(
+            control.get('t') == 'text'
+            and (control.get('value') == value if exact else str(control.get('value', '')).startswith(value))
+            for control in self.controls.values()
+        )
+
+    async def measure(self, stats, name, steps, predicate):
+        bytes_before = self.bytes_in + self.bytes_out
+        started = time.perf_counter()
+        await steps()
+        await self.wait_for(predicate)
+        stats[name]['latency'].append(time.perf_counter() - started)
+        stats[name]['bytes'].append(self.bytes_in + self.bytes_out - bytes_before)
+
+    async def run_flow(self, stats):
+        await self.connect()
+        try:
+            async def open_main():
+                await self.send('registerWebClient', {
+                    'pageName': "",
+                    'pageRoute': "/",
+                    'pageWidth': "1280",
+                    'pageHeight': "800",
+                    'windowWidth': "1280",
+                    'windowHeight': "800",
+                    'windowTop': "0",
+                    'windowLeft': "0",
+                    'isPWA': "false",
+                    'isWeb': "true",
+                    'isDebug': "false",
+                    'platform': "linux",
+                    'platformBrightness': "dark",
+                    'media': "{}",
+                    'sessionId': None,
+                })
+            await self.measure(stats, 'open', open_main, lambda: self.find('elevatedbutton', text="Shrink URL"))
+
+            async def shrink():
+                await self.type_into(self.find('textfield', label="Long URL"), f"https://example.com/{self.alias}")
+                await self.type_into(self.find('textfield', label="Alias"), self.alias)
+                await self.type_into(self.find('textfield', label="Password"), "loadtest")
+                await self.click(self.find('elevatedbutton', text="Shrink URL"))
+            await self.measure(stats, 'shrink', shrink, lambda: self.has_text("URL shortened successfully!"))
+
+            async def login():
+                await self.click(self.find('textbutton', text="here"))
+                await self.wait_for(lambda: self.find('elevatedbutton', text="Login"))
+                await self.type_into(self.find('textfield', label="Enter Alias to Manage"), self.alias)
+                await self.type_into(self.find('textfield', label="Password"), "loadtest")
+                await self.click(self.find('elevatedbutton', text="Login"))
+            await self.measure(stats, 'login', login, lambda: self.has_text("Hits:", exact=False))
+
+            async def toggle():
+                await self.click(self.find('iconbutton', tooltip="Pause Alias"))
+            await self.measure(stats, 'toggle', toggle, lambda: self.has_text("Alias paused successfully!"))
+        finally:
+            await self.close()
+
+
+async def run_stage(ws_url, sessions, run_id, timeout):
+    stats = {name: {'latency': [], 'bytes': []} for name in ACTIONS}
+    errors = []
+
+    async def one(index):
+        session = SimulatedSession(ws_url, index, run_id)
+        try:
+            await asyncio.wait_for(session.run_flow(stats), timeout)
+        except Exception as ex:
+            errors.append(f"{type(ex).__name__}: {ex}")
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(index) for index in range(sessions)))
+    elapsed = time.perf_counter() - started
+
+    completed = sessions - len(errors)
+    result = {
+        'sessions': sessions,
+        'completed': completed,
+        'errors': len(errors),
+        'error_samples': sorted(set(errors))[:5],
+        'elapsed': elapsed,
+        'sessions_per_sec': completed / elapsed if elapsed else 0,
+        'actions': {},
+    }
+    for name, values in stats.items():
+        result['actions'][name] = {
+            'count': len(values['latency']),
+            'p50_ms': (percentile(values['latency'], 0.5) or 0) * 1000,
+            'p95_ms': (percentile(values['latency'], 0.95) or 0) * 1000,
+            'max_ms': max(values['latency'], default=0) * 1000,
+            'bytes_per_action': sum(values['bytes']) / len(values['bytes']) if values['bytes'] else 0,
+        }
+    return result
+
+
+def print_stage(result):
+    rss = f"{result['server_rss'] / 2**20:.1f} MB" if result.get('server_rss') else "n/a"
+    print(
+        f"N={result['sessions']:<5} {result['sessions_per_sec']:7.2f} sessions/s  "
+        f"completed={result['completed']} errors={result['errors']}  server RSS={rss}"
+    )
+    for name, action in result['actions'].items():
+        print(
+            f"    {name:<7} p50={action['p50_ms']:8.1f} ms  p95={action['p95_ms']:8.1f} ms  "
+            f"max={action['max_ms']:8.1f} ms  ws bytes/action={action['bytes_per_action']:9.0f}"
+        )
+    for sample in result['error_samples']:
+        print(f"    error: {sample}")
+
+
+async def run(args):
+    backend = None
+    server = None
+    server_pid = args.server_pid
+    ws_url = args.url
+    if ws_url is None:
+        backend = MockBackend(latency=args.backend_latency)
+        backend_url = backend.start()
+        port = free_port()
+        # Simulated sessions' links stay out of the local link history, and their example.com targets aren't probed
+        env = dict(os.environ, DITTO_API_BASE_URL=backend_url, DITTO_LOADTEST_PORT=str(port), FLET_FORCE_WEB_SERVER="true",
+                   DITTO_HISTORY_DIR="off", DITTO_LINK_HEALTH="off")
+        server = subprocess.Popen([sys.executable, "-c", SERVER_CODE.format(root=ROOT)], env=env)
+        server_pid = server.pid
+        wait_for_port(port)
+        ws_url = f"ws://127.0.0.1:{port}/ws"
+
+    results = []
+    try:
+        for stage, sessions in enumerate(args.sessions):
+            result = await run_stage(ws_url, sessions, f"{int(time.time())}s{stage}", args.timeout)
+            result['server_rss'] = process_rss(server_pid) if server_pid else None
+            result['backend_requests'] = backend.requests if backend else None
+            print_stage(result)
+            results.append(result)
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+        if backend:
+            backend.stop()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate concurrent browser sessions against the Ditto Flet server.")
+    parser.add_argument("--sessions", default="1,10,50", help="comma-separated session counts, run one stage each")
+    parser.add_argument("--backend-latency", type=float, default=0.0, help="seconds added to every mock API call")
+    parser.add_argument("--timeout", type=float, default=60, help="seconds allowed for one session's flow")
+    parser.add_argument("--url", help="websocket URL of an already running server (API must point at a mock)")
+    parser.add_argument("--server-pid", type=int, help="PID to sample RSS from when using --url")
+    parser.add_argument("--output", help="write results as JSON")
+    args = parser.parse_args()
+    args.sessions = [int(n) for n in args.sessions.split(",") if n.strip()]
+
+    results = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
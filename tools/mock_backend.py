@@ -0,0 +1,207 @@
+"""
+In-memory stand-in for the Short-URL API, for offline development, load tests and benchmarks.
+
+    python tools/mock_backend.py --port 8000 --latency 0.05
+    DITTO_API_BASE_URL=http://127.0.0.1:8000 python ditto.py
+
+It also serves stub targets for link health checks: /status/<code> answers with that
+status, and /redirect/<n> redirects n times before answering 200.
+"""
+import argparse
+import json
+import secrets
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+
+class MockBackend:
+    """Implements the endpoints Ditto uses, with optional per-request latency"""
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.aliases = {}  # alias -> {url, url_pass, url_hits, url_state, url_created_at}
+        self.tokens = {}  # access token -> alias
+        self.requests = 0
+        self.active = 0  # requests being served
+        self.peak = 0  # most requests served at once
+        self.lock = threading.Lock()
+        self.server = None
+
+    def start(self, host="127.0.0.1", port=0):
+        backend = self
+
+        class Handler(MockHandler):
+            pass
+        Handler.backend = backend
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return f"http://{host}:{self.server.server_port}"
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def issue_token(self, alias):
+        token = secrets.token_hex(16)
+        self.tokens[token] = alias
+        return token
+
+    def handle(self, method, path, query, token, body):
+        """Returns (status, payload, headers) for one API call"""
+        with self.lock:
+            self.requests += 1
+            alias = self.tokens.get(token)
+            record = self.aliases.get(alias)
+
+            if method == "GET" and path == "/health":
+                return 200, {'status': 'ok'}, {}
+
+            if method in ("GET", "HEAD") and path.startswith("/status/") and path[8:].isdigit():
+                return int(path[8:]), {}, {}
+            if method in ("GET", "HEAD") and path.startswith("/redirect/") and path[10:].isdigit():
+                hops = int(path[10:])
+                if hops:
+                    return 302, {}, {'Location': f"/redirect/{hops - 1}"}
+                return 200, {'status': 'ok'}, {}
+
+            if method == "POST" and path == "/create":
+                code = body.get('url_code', '')
+                if not code or not body.get('url'):
+                    return 422, {'detail': 'url and url_code are required'}, {}
+                if code in self.aliases:
+                    return 400, {'detail': 'Alias already exists'}, {}
+                self.aliases[code] = {
+                    'url': body['url'],
+                    'url_pass': body.get('url_pass', ''),
+                    'url_hits': 0,
+                    'url_state': True,
+                    'url_created_at': datetime.now(timezone.utc).isoformat(),
+                }
+                return 200, {'short_url': f"{self.base_url}/{code}"}, {}
+
+            if method == "POST" and path == "/login":
+                found = self.aliases.get(body.get('url_code'))
+                if not found:
+                    return 404, {'detail': 'Alias not found'}, {}
+                if found['url_pass'] != body.get('url_pass', ''):
+                    return 401, {'detail': 'Invalid password'}, {}
+                return 200, {'access_token': self.issue_token(body['url_code'])}, {}
+
+            if method in ("GET", "HEAD") and path not in ("/validate_token", "/refresh_token", "/details") and path.count("/") == 1:
+                found = self.aliases.get(unquote(path[1:]))
+                if not found:
+                    return 404, {'detail': 'Alias not found'}, {}
+                if not found['url_state']:
+                    return 403, {'detail': 'Alias is paused'}, {}
+                found['url_hits'] += 1
+                return 307, {}, {'Location': found['url']}
+
+            if record is None:
+                return 401, {'detail': 'Invalid or expired token'}, {}
+
+            if method == "GET" and path == "/validate_token":
+                return 200, {'valid': True}, {}
+            if method == "GET" and path == "/refresh_token":
+                return 200, {'access_token': self.issue_token(alias)}, {}
+            if method == "GET" and path == "/details":
+                data = {key: value for key, value in record.items() if key != 'url_pass'}
+                return 200, {'data': dict(data, url_code=alias)}, {}
+            if method == "PATCH" and path == "/change_url":
+                record['url'] = query.get('url', [''])[0]
+                return 200, {'detail': 'URL updated'}, {}
+            if method == "PATCH" and path in ("/pause", "/resume"):
+                record['url_state'] = path == "/resume"
+                return 200, {'detail': 'State updated'}, {}
+            if method == "PATCH" and path == "/reset_hits":
+                record['url_hits'] = 0
+                return 200, {'detail': 'Hits reset'}, {}
+            if method == "POST" and path == "/change_password":
+                if record['url_pass'] != body.get('old_url_pass', ''):
+                    return 401, {'detail': 'Invalid password'}, {}
+                record['url_pass'] = body.get('new_url_pass', '')
+                return 200, {'detail': 'Password updated'}, {}
+            if method == "DELETE" and path.startswith("/delete"):
+                del self.aliases[alias]
+                self.tokens = {t: a for t, a in self.tokens.items() if a != alias}
+                return 200, {'detail': 'Alias deleted'}, {}
+            return 404, {'detail': 'Not Found'}, {}
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    backend = None
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; with Nagle on, each response on a kept-alive connection stalls ~40 ms
+    disable_nagle_algorithm = True
+    gzip_min_bytes = 256  # smaller responses aren't worth compressing
+
+    def dispatch(self):
+        with self.backend.lock:
+            self.backend.active += 1
+            self.backend.peak = max(self.backend.peak, self.backend.active)
+        try:
+            self.respond()
+        finally:
+            with self.backend.lock:
+                self.backend.active -= 1
+
+    def respond(self):
+        if self.backend.latency:
+            time.sleep(self.backend.latency)
+        parts = urlsplit(self.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(length) if length else b""
+        if raw and self.headers.get('Content-Encoding') == 'gzip':
+            raw = zlib.decompress(raw, 16 + zlib.MAX_WBITS)
+        try:
+            body = json.loads(raw) if raw else {}
+        except ValueError:
+            body = {}
+        auth = self.headers.get('Authorization', '')
+        token = auth[7:] if auth.startswith('Bearer ') else None
+        status, payload, headers = self.backend.handle(self.command, parts.path, parse_qs(parts.query), token, body)
+
+        data = json.dumps(payload).encode('utf-8')
+        if len(data) >= self.gzip_min_bytes and 'gzip' in self.headers.get('Accept-Encoding', ''):
+            compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            data = compressor.compress(data) + compressor.flush()
+            headers = dict(headers, **{'Content-Encoding': 'gzip'})
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(data)
+
+    do_GET = do_HEAD = do_POST = do_PATCH = do_DELETE = dispatch
+
+    def log_message(self, format, *args):
+        pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run an in-memory Short-URL API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every request")
+    args = parser.parse_args()
+
+    backend = MockBackend(latency=args.latency)
+    print(f"Mock Short-URL API on {backend.start(args.host, args.port)}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        backend.stop()